@@ -0,0 +1,182 @@
+import asyncio
+import math
+import time
+from contextlib import asynccontextmanager
+
+# Turn priorities, lower is served first
+LIVE = 0  # /vad-stream/ and /process-vad-audio/: someone is waiting to hear the answer
+UPLOAD = 1  # /transcribe/ uploads
+BATCH = 2  # batch jobs over archived recordings; nobody is waiting on a single clip
+
+PRIORITY_NAMES = {LIVE: "live", UPLOAD: "upload", BATCH: "batch"}
+
+
+class OverloadedError(Exception):
+    """A stage's admission queue is full; retry_after is a hint in seconds"""
+
+    def __init__(self, message: str, stage: str, retry_after: float):
+        super().__init__(message)
+        self.stage = stage
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(Exception):
+    """A turn's deadline passed before it reached the next stage"""
+
+    def __init__(self, message: str, stage: str):
+        super().__init__(message)
+        self.stage = stage
+
+
+class _Waiter:
+    def __init__(self, priority: int, seq: int, deadline: float, future: asyncio.Future):
+        self.priority = priority
+        self.seq = seq
+        self.deadline = deadline
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+
+class AdmissionGate:
+    """Bounded admission into one stage of the voice pipeline.
+
+    At most concurrency turns hold the stage at once and at most max_waiting
+    wait for it, served by priority (live turns, then uploads, then batch
+    jobs) and then in arrival order. When the queue is full a turn displaces
+    the most recently queued one of a lower priority; anything else is refused right away with
+    OverloadedError. Deadlines are time.monotonic() values: a turn whose
+    deadline passes while it waits is dropped with DeadlineExceeded instead of
+    being admitted. Use from the event loop only.
+    """
+
+    def __init__(self, name: str, concurrency: int, max_waiting: int):
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.max_waiting = max_waiting
+        self.active = 0
+        self._waiters = []
+        self._seq = 0
+        # Moving average of how long a turn holds the stage, for Retry-After hints
+        self._avg_hold = 1.0
+        self._held_since = {}
+        self.admitted = 0
+        self.rejected = 0
+        self.shed = 0
+        self.expired = 0
+        self.total_wait = 0.0
+
+    @property
+    def waiting(self):
+        return len(self._waiters)
+
+    def retry_after(self):
+        """Seconds until a new request would likely be admitted"""
+        return max(1, math.ceil(self._avg_hold * (len(self._waiters) + 1) / self.concurrency))
+
+    def _lowest_priority_waiter(self):
+        return max(self._waiters, key=lambda waiter: (waiter.priority, waiter.seq), default=None)
+
+    def _refuse(self):
+        self.rejected += 1
+        raise OverloadedError(f"{self.name} is at capacity ({self.active} running, {len(self._waiters)} waiting)", self.name, self.retry_after())
+
+    def check(self, priority: int):
+        """Raise OverloadedError if a request of this priority would be refused now"""
+        if self.active < self.concurrency or len(self._waiters) < self.max_waiting:
+            return
+        victim = self._lowest_priority_waiter()
+        if victim is None or victim.priority <= priority:
+            self._refuse()
+
+    def _check_deadline(self, deadline: float):
+        if deadline is not None and time.monotonic() >= deadline:
+            self.expired += 1
+            raise DeadlineExceeded(f"Deadline passed before {self.name}", self.name)
+
+    def _grant(self, token):
+        self.active += 1
+        self.admitted += 1
+        self._held_since[token] = time.monotonic()
+
+    async def acquire(self, priority: int = UPLOAD, deadline: float = None):
+        """Wait for a slot; returns a token to pass to release()"""
+        self._check_deadline(deadline)
+        self._seq += 1
+        token = self._seq
+        if self.active < self.concurrency and not self._waiters:
+            self._grant(token)
+            return token
+        if len(self._waiters) >= self.max_waiting:
+            # Make room by dropping the newest waiter of a lower priority
+            victim = self._lowest_priority_waiter()
+            if victim is None or victim.priority <= priority:
+                self._refuse()
+            self._waiters.remove(victim)
+            self.shed += 1
+            victim.future.set_exception(OverloadedError(f"{self.name} shed this request for a higher-priority one", self.name, self.retry_after()))
+        waiter = _Waiter(priority, token, deadline, asyncio.get_running_loop().create_future())
+        self._waiters.append(waiter)
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout)
+        except BaseException as e:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            if waiter.future.done() and not waiter.future.cancelled() and waiter.future.exception() is None:
+                # Admitted just as we gave up: hand the slot on
+                self.release(token)
+            elif not waiter.future.done():
+                waiter.future.cancel()
+            if isinstance(e, asyncio.TimeoutError):
+                self.expired += 1
+                raise DeadlineExceeded(f"Deadline passed while waiting for {self.name}", self.name) from None
+            raise
+        return token
+
+    def release(self, token):
+        held_since = self._held_since.pop(token, None)
+        if held_since is None:
+            return
+        self.active -= 1
+        self._avg_hold = 0.8 * self._avg_hold + 0.2 * (time.monotonic() - held_since)
+        now = time.monotonic()
+        while self._waiters and self.active < self.concurrency:
+            waiter = min(self._waiters, key=lambda w: (w.priority, w.seq))
+            self._waiters.remove(waiter)
+            if waiter.future.done():
+                continue
+            if waiter.deadline is not None and now >= waiter.deadline:
+                self.expired += 1
+                waiter.future.set_exception(DeadlineExceeded(f"Deadline passed while waiting for {self.name}", self.name))
+                continue
+            self.total_wait += now - waiter.enqueued_at
+            self._grant(waiter.seq)
+            waiter.future.set_result(None)
+
+    @asynccontextmanager
+    async def admit(self, priority: int = UPLOAD, deadline: float = None, trace=None):
+        """Hold a slot for the enclosed block; the wait is recorded as an admission_wait span on trace"""
+        if trace is None:
+            token = await self.acquire(priority, deadline)
+        else:
+            with trace.span("admission_wait", stage=self.name):
+                token = await self.acquire(priority, deadline)
+        try:
+            yield
+        finally:
+            self.release(token)
+
+    def stats(self):
+        return {
+            "concurrency": self.concurrency,
+            "active": self.active,
+            "waiting": len(self._waiters),
+            "max_waiting": self.max_waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "shed": self.shed,
+            "expired": self.expired,
+            "avg_wait_ms": round(1000 * self.total_wait / self.admitted, 2) if self.admitted else 0.0,
+            "avg_hold_ms": round(1000 * self._avg_hold, 2),
+            "retry_after_seconds": self.retry_after(),
+        }
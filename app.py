@@ -1,22 +1,34 @@
-from fastapi import FastAPI, UploadFile, File, Form, WebSocket
-import mlx_whisper
+from fastapi import FastAPI, UploadFile, File, Form, WebSocket, Request
 import tempfile
 import os
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse, FileResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, Response, StreamingResponse, PlainTextResponse
 import uuid
 import numpy as np
 import soundfile as sf
 import logging
 from dotenv import load_dotenv
-import mlx
-from mlx_lm import load, generate
 import io
 import base64
 import asyncio
 import json
-import torch
+import re
+import threading
+import time
+from inference import InferenceExecutor, QueueFullError
+from admission import LIVE, UPLOAD, PRIORITY_NAMES, AdmissionGate, DeadlineExceeded, OverloadedError
+from audio_io import AUDIO_FORMATS, UPLOAD_FORMATS, WHISPER_SAMPLE_RATE, decode_audio_bytes, decode_audio_frame, negotiate_audio_format
+from results import ResultsStore
+from streaming_vad import VAD_WINDOW_SAMPLES, StreamingVAD, UtteranceRecorder
+from vad_batcher import VADBatcher
+from streaming_asr import LocalAgreementTranscriber
+from response_cache import TTS_CACHE_PREFIX, AnswerCache, AudioBufferCache, TTSCache
+from model_loader import ModelState, ModelUnavailableError
+from model_registry import ModelRegistry
+from metrics import REGISTRY, STAGE_SECONDS, TurnTrace
+from knowledge_base import KnowledgeBase, format_question
+from batch_jobs import BatchJob, resolve_under, run_job
 
 # Replace Silero VAD direct import with torch.hub method
 # from silero_vad import load_silero_vad, get_speech_timestamps, read_audio as vad_read_audio
@@ -28,31 +40,66 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger("mlx-whisper-tts")
 
-# Import MLX Audio TTS functionality
-try:
-    from mlx_audio.tts.utils import load_model
-    from mlx_audio.tts.audio_player import AudioPlayer
-    TTS_AVAILABLE = True
-except ImportError:
-    logger.warning("MLX Audio not installed. TTS features will be disabled.")
-    TTS_AVAILABLE = False
-
-# Define the models used
+# Default models; config.json ("whisper_model", "llm_model", "tts_model") overrides them
+# and /config/ switches them at runtime. model_status[...].model_id is the one in use.
 WHISPER_MODEL = "mlx-community/whisper-large-v3-turbo"
 LLM_MODEL = "mlx-community/Mistral-7B-Instruct-v0.3-4bit"  # Using Mistral 7B 4-bit quantized
+TTS_MODEL = "mlx-community/Kokoro-82M-4bit"
+VAD_MODEL = "snakers4/silero-vad"
 
-# Initialize MLX LM model
-try:
-    logger.info(f"Loading MLX LM model from {LLM_MODEL}")
-    llm_model, tokenizer = load(LLM_MODEL)
-    LLM_AVAILABLE = True
-    logger.info("MLX LM model loaded successfully")
-except Exception as e:
-    logger.error(f"Error loading MLX LM model: {str(e)}")
-    import traceback
-    logger.error(f"Traceback: {traceback.format_exc()}")
-    LLM_AVAILABLE = False
-    logger.warning("LLM features will be disabled due to initialization error.")
+# One serialized worker per model so blocking inference never runs on the event loop.
+# max_queue bounds how many calls may wait behind the running one.
+INFERENCE_QUEUE_SIZE = 8
+whisper_executor = InferenceExecutor("whisper", max_queue=INFERENCE_QUEUE_SIZE)
+llm_executor = InferenceExecutor("llm", max_queue=INFERENCE_QUEUE_SIZE)
+tts_executor = InferenceExecutor("tts", max_queue=INFERENCE_QUEUE_SIZE)
+# Silero scores windows from every /vad-stream/ connection in shared batches on this worker
+vad_executor = InferenceExecutor("vad", max_queue=INFERENCE_QUEUE_SIZE)
+
+# Models load and warm up in the background after startup; handlers await their state.
+# torch, mlx_whisper, mlx_lm and mlx_audio are only imported by the loaders, so
+# importing this module (e.g. on every uvicorn --reload) stays fast.
+model_status = {
+    "whisper": ModelState("whisper", WHISPER_MODEL),
+    "llm": ModelState("llm", LLM_MODEL),
+    "tts": ModelState("tts", TTS_MODEL),
+    "vad": ModelState("vad", VAD_MODEL),
+}
+model_load_task = None
+# Set when the models live in a separate model_server.py process
+model_server_client = None
+
+# Exported on /metrics; per-stage latencies are recorded through TurnTrace spans
+LLM_TOKENS = REGISTRY.counter("llm_generated_tokens_total", "Tokens streamed from the LLM")
+LLM_TOKENS_PER_SECOND = REGISTRY.histogram(
+    "llm_decode_tokens_per_second",
+    "LLM decode rate of each turn",
+    buckets=(1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 200),
+)
+REAL_TIME_FACTOR = REGISTRY.histogram(
+    "audio_real_time_factor",
+    "Processing seconds per second of audio (below 1 is faster than real time)",
+    labelnames=("model",),
+    buckets=(0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0),
+)
+VAD_FRAMES = REGISTRY.counter("vad_frames_total", "Audio frames received on /vad-stream/")
+VAD_FRAME_RATE = REGISTRY.gauge("vad_frames_per_second", "Frame rate of each open /vad-stream/ connection", labelnames=("connection",))
+ACTIVE_WEBSOCKETS = REGISTRY.gauge("active_websockets", "Open /vad-stream/ connections")
+RESULTS_STORE_SIZE = REGISTRY.gauge("results_store_entries", "Entries in the results store")
+INFERENCE_QUEUE_DEPTH = REGISTRY.gauge("inference_queue_depth", "Calls waiting for each model worker", labelnames=("executor",))
+VOICE_TURNS = REGISTRY.counter("voice_turns_total", "Finished voice turns by outcome", labelnames=("status",))
+ADMISSION_DROPPED = REGISTRY.counter(
+    "admission_dropped_total",
+    "Requests refused and turns dropped by admission control",
+    labelnames=("stage", "reason"),
+)
+ADMISSION_WAITING = REGISTRY.gauge("admission_waiting", "Turns waiting to enter each pipeline stage", labelnames=("stage",))
+
+# Set by the loaders
+mlx_whisper = None
+llm_model = None
+tokenizer = None
+stream_generate = None
 
 app = FastAPI()
 
@@ -72,221 +119,975 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 OUTPUT_FOLDER = os.path.join(os.path.expanduser("~"), ".mlx_audio", "outputs")
 os.makedirs(OUTPUT_FOLDER, exist_ok=True)
 
+# KV cache reuse for the system prompt and conversations, created once the LLM is loaded
+prompt_caches = None
+# Continuous batching of concurrent LLM requests (None: one request at a time)
+llm_scheduler = None
+
 # Global variables for TTS
 tts_model = None
 audio_player = None
+results_sweeper_task = None
 
 # Load Silero VAD model once at startup
 vad_model = None
 vad_get_speech_timestamps = None
 vad_read_audio = None
+vad_batcher = None
 
 # Load configuration
 CONFIG_FILE = "config.json"
 
+# Modification time of config.json when this process last read or wrote it
+config_mtime = None
+
+def config_file_mtime():
+    try:
+        return os.path.getmtime(CONFIG_FILE)
+    except OSError:
+        return None
+
 def load_config():
+    global config_mtime
+    # Taken before reading, so a write that lands mid-read is picked up next time
+    mtime = config_file_mtime()
     try:
         with open(CONFIG_FILE, 'r') as f:
-            return json.load(f)
+            loaded = json.load(f)
+        config_mtime = mtime
+        return loaded
     except FileNotFoundError:
         default_config = {
             "system_prompt": "You are a helpful AI assistant. Please provide clear and concise responses to help the user with their questions."
         }
-        with open(CONFIG_FILE, 'w') as f:
-            json.dump(default_config, f, indent=4)
+        save_config(default_config)
         return default_config
 
 def save_config(config):
-    with open(CONFIG_FILE, 'w') as f:
+    global config_mtime
+    # Other workers may be reading config.json; never let them see it half-written
+    temp_path = f"{CONFIG_FILE}.{os.getpid()}.tmp"
+    with open(temp_path, 'w') as f:
         json.dump(config, f, indent=4)
+    os.replace(temp_path, CONFIG_FILE)
+    config_mtime = config_file_mtime()
+
+def reload_config_if_changed():
+    """Pick up config.json changes made by another worker (uvicorn --workers N).
+
+    Each worker holds its own copy of the config, so POST /config/ only updates
+    the worker that served it; the others re-read the file when its mtime moves.
+    """
+    if config_file_mtime() in (None, config_mtime):
+        return
+    previous_prompt = config.get("system_prompt")
+    try:
+        fresh = load_config()
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not reload {CONFIG_FILE}, keeping the current config: {str(e)}")
+        return
+    config.clear()
+    config.update(fresh)
+    logger.info(f"Reloaded {CONFIG_FILE}")
+    if config.get("system_prompt") != previous_prompt and prompt_caches is not None:
+        # Re-prefill the new system prompt on this worker's LLM too
+        asyncio.create_task(rebuild_prompt_cache())
 
 # Load initial configuration
 config = load_config()
 
-# Initialize TTS model and audio player
-def setup_tts():
+# Loaded Whisper, LLM and TTS weights, unloaded least recently used first to stay under the budget
+model_registry = ModelRegistry(
+    budget_mb=config.get("model_memory_budget_mb"),
+    sizes_mb=config.get("model_memory_mb"),
+)
+
+def load_whisper():
+    global mlx_whisper
+    model_id = config.get("whisper_model", WHISPER_MODEL)
+    logger.info(f"Loading Whisper from {model_id}")
+    import mlx_whisper
+    model_status["whisper"].model_id = model_id
+    return mlx_whisper
+
+def warm_up_whisper(_):
+    silence = np.zeros(WHISPER_SAMPLE_RATE, dtype=np.float32)
+    whisper_transcribe(silence)
+    model_registry.pin("whisper", model_status["whisper"].model_id)
+    if config.get("whisper_small_model"):
+        # Short utterances are the most common ones; don't make the first pay for the load
+        whisper_transcribe(silence, config["whisper_small_model"])
+
+def activate_whisper(model_id: str):
+    """Make the registry's copy of model_id the one mlx_whisper.transcribe() uses (Whisper worker only)"""
+    if getattr(mlx_whisper, "__name__", None) != "mlx_whisper":
+        # The model server proxy (or a stand-in) picks the model from path_or_hf_repo itself
+        return
+    import mlx.core as mx
+    from mlx_whisper.load_models import load_model
+    from mlx_whisper.transcribe import ModelHolder
+    
+    def unload(model):
+        if ModelHolder.model is model:
+            ModelHolder.model = None
+            ModelHolder.model_path = None
+    
+    model = model_registry.get("whisper", model_id, lambda: load_model(model_id, dtype=mx.float16), unload)
+    # transcribe() reuses ModelHolder's model when the path matches instead of loading its own
+    ModelHolder.model = model
+    ModelHolder.model_path = model_id
+
+def whisper_transcribe(audio, model_id: str = None, **kwargs):
+    """Blocking mlx_whisper.transcribe() with model_id (default: the active model); run on the Whisper worker"""
+    model_id = model_id or model_status["whisper"].model_id
+    activate_whisper(model_id)
+    return mlx_whisper.transcribe(audio, path_or_hf_repo=model_id, **kwargs)
+
+def load_llm(model_id: str = None):
+    global llm_model, tokenizer, stream_generate, prompt_caches, llm_scheduler
+    from mlx_lm import load, stream_generate
+    from prompt_cache import PromptCacheManager
+    from llm_scheduler import LLMScheduler
+    
+    model_id = model_id or config.get("llm_model", LLM_MODEL)
+    logger.info(f"Loading MLX LM model from {model_id}")
+    model, model_tokenizer = model_registry.get("llm", model_id, lambda: load(model_id))
+    caches = PromptCacheManager(
+        model,
+        model_tokenizer,
+        max_sessions=config.get("llm_max_sessions", 16),
+        memory_budget_mb=config.get("llm_session_cache_mb", 1024),
+        history_turns=config.get("llm_history_turns", 6),
+    )
+    scheduler = None
+    if config.get("llm_batching", True):
+        try:
+            scheduler = LLMScheduler(
+                model,
+                model_tokenizer,
+                llm_executor,
+                caches,
+                max_batch_size=config.get("llm_max_batch_size", 8),
+            )
+            logger.info("Continuous batching enabled for LLM requests")
+        except Exception as e:
+            logger.warning(f"LLM batching disabled, generating one request at a time: {str(e)}")
+    # Prefill the system prompt before the swap so the first turn only processes the question
+    caches.set_system_prompt(config.get("system_prompt", "You are a helpful AI assistant."))
+    # Swap everything together; turns already streaming keep the previous model's scheduler
+    llm_model, tokenizer, prompt_caches = model, model_tokenizer, caches
+    llm_scheduler = scheduler
+    model_status["llm"].model_id = model_id
+    model_registry.pin("llm", model_id)
+    return llm_model
+
+def warm_up_llm(_):
+    for _ in stream_generate(llm_model, tokenizer, prompt="Hello", max_tokens=1):
+        pass
+
+def load_tts(model_id: str = None):
     global tts_model, audio_player
+    from mlx_audio.tts.utils import load_model
+    from mlx_audio.tts.audio_player import AudioPlayer
     
-    if not TTS_AVAILABLE:
-        return
+    model_id = model_id or config.get("tts_model", TTS_MODEL)
+    logger.info(f"Loading TTS model from {model_id}")
+    tts_model = model_registry.get("tts", model_id, lambda: load_model(model_id))
+    model_status["tts"].model_id = model_id
+    model_registry.pin("tts", model_id)
+    if audio_player is None:
+        audio_player = AudioPlayer()
+    return tts_model
+
+def warm_up_tts(_):
+    for _ in tts_model.generate(text="Hello.", voice="af_heart", speed=1.0, lang_code="a", verbose=False):
+        pass
+
+def load_vad():
+    global vad_model, vad_get_speech_timestamps, vad_read_audio
+    import torch
+    
+    logger.info("Loading Silero VAD model")
+    torch.set_num_threads(1)  # To avoid performance issues
+    model, utils = torch.hub.load(repo_or_dir=VAD_MODEL, model='silero_vad')
+    vad_model = model
+    vad_get_speech_timestamps, _, vad_read_audio, _, _ = utils
+    return vad_model
+
+def warm_up_vad(model):
+    import torch
     
+    with torch.no_grad():
+        model(torch.zeros(VAD_WINDOW_SAMPLES), WHISPER_SAMPLE_RATE)
+    model.reset_states()
+    global vad_batcher
+    if config.get("vad_batching", True):
+        # Checks batched scoring against single-stream scoring, so build it here on the VAD worker
+        vad_batcher = VADBatcher(
+            model,
+            vad_executor,
+            WHISPER_SAMPLE_RATE,
+            max_wait_ms=config.get("vad_batch_wait_ms", 4),
+            max_batch_size=config.get("vad_max_batch_size", 64),
+        )
+
+async def load_local_models():
+    """Load and warm up all models concurrently, each on the worker that will run it"""
+    await asyncio.gather(
+        model_status["whisper"].load(load_whisper, warm_up_whisper, run=whisper_executor.run),
+        model_status["llm"].load(load_llm, warm_up_llm, run=llm_executor.run),
+        model_status["tts"].load(load_tts, warm_up_tts, run=tts_executor.run),
+        model_status["vad"].load(load_vad, warm_up_vad, run=vad_executor.run),
+    )
+
+def connect_model_server(address: str):
+    """Use the models of a separate model_server.py process instead of loading them here"""
+    from model_ipc import ModelServerClient, RemoteWhisper, RemoteTTS, RemoteLLM, RemotePromptCaches, authkey_from_env
+    
+    client = ModelServerClient(address, authkey_from_env())
+    timeout = config.get("model_ready_timeout_seconds", 120)
+    
+    def load_whisper_remote():
+        global mlx_whisper
+        client.wait_ready("whisper", timeout)
+        mlx_whisper = RemoteWhisper(client)
+        return mlx_whisper
+    
+    def load_llm_remote():
+        global prompt_caches, llm_scheduler
+        client.wait_ready("llm", timeout)
+        prompt_caches = RemotePromptCaches(client)
+        # The server batches requests from every front-end worker together
+        llm_scheduler = RemoteLLM(client)
+        return llm_scheduler
+    
+    def load_tts_remote():
+        global tts_model, audio_player
+        client.wait_ready("tts", timeout)
+        tts_model = RemoteTTS(client)
+        try:
+            # Server playback still happens on this machine's speakers
+            from mlx_audio.tts.audio_player import AudioPlayer
+            audio_player = AudioPlayer()
+        except Exception as e:
+            logger.warning(f"Server-side playback unavailable: {str(e)}")
+        return tts_model
+    
+    return client, load_whisper_remote, load_llm_remote, load_tts_remote
+
+async def load_models():
+    """Load the models in this process, or connect to the model server when one is configured.
+
+    Silero VAD always runs here: it is tiny and scores every 32 ms frame, so a
+    round trip per frame would cost more than the model itself.
+    """
+    address = config.get("model_server_socket")
+    if not address:
+        await load_local_models()
+        return
+    global model_server_client
+    logger.info(f"Using models from the model server at {address}")
+    model_server_client, load_whisper_remote, load_llm_remote, load_tts_remote = connect_model_server(address)
+    await asyncio.gather(
+        model_status["whisper"].load(load_whisper_remote),
+        model_status["llm"].load(load_llm_remote),
+        model_status["tts"].load(load_tts_remote),
+        model_status["vad"].load(load_vad, warm_up_vad, run=vad_executor.run),
+    )
+
+async def wait_for_model(name: str):
+    """Wait for a model to finish loading; raises ModelUnavailableError if it failed or timed out"""
+    await model_status[name].wait(config.get("model_ready_timeout_seconds", 120))
+
+# Model switches in progress, by kind
+model_switches = {}
+
+async def switch_model(kind: str, model_id: str):
+    """Load model_id and make it the active model of its kind; the current model serves until then"""
+    if model_status[kind].model_id == model_id:
+        return
+    await wait_for_model(kind)
+    logger.info(f"Switching {kind} model from {model_status[kind].model_id} to {model_id}")
+    if model_server_client is not None and kind != "whisper":
+        # The weights live in the model server; Whisper is chosen per call instead
+        await asyncio.to_thread(model_server_client.call, "switch_model", kind=kind, model_id=model_id)
+        model_status[kind].model_id = model_id
+    elif kind == "whisper":
+        await whisper_executor.run(activate_whisper, model_id)
+        model_status["whisper"].model_id = model_id
+        model_registry.pin("whisper", model_id)
+    elif kind == "llm":
+        await llm_executor.run(load_llm, model_id)
+    elif kind == "tts":
+        await tts_executor.run(load_tts, model_id)
+    logger.info(f"Now using {model_id} for {kind}")
+
+async def apply_model_switch(kind: str, model_id: str):
+    """Background task for /config/: switch, or put the config back if the new model can't load"""
     try:
-        # Initialize TTS model
-        default_model = "mlx-community/Kokoro-82M-4bit"
-        logger.info(f"Loading TTS model from {default_model}")
-        tts_model = load_model(default_model)
-        logger.info("TTS model loaded successfully")
-        
-        # Initialize audio player
-        audio_player = AudioPlayer()
-        logger.info("Audio player initialized successfully")
+        await switch_model(kind, model_id)
     except Exception as e:
-        logger.error(f"Error initializing TTS: {str(e)}")
+        logger.error(f"Could not switch {kind} model to {model_id}: {str(e)}")
+        config[f"{kind}_model"] = model_status[kind].model_id
+        save_config(config)
+    finally:
+        if model_switches.get(kind) == model_id:
+            del model_switches[kind]
 
 @app.on_event("startup")
 async def startup_event():
-    # Initialize TTS model and audio player on server startup
-    setup_tts()
+    # Load models in the background so the server starts accepting connections right away
+    global model_load_task
+    model_load_task = asyncio.create_task(load_models())
     
-    # Initialize Silero VAD model
-    global vad_model, vad_get_speech_timestamps, vad_read_audio
+    # Start dropping expired results
+    global results_sweeper_task
+    results_sweeper_task = asyncio.create_task(results_sweeper())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if tts_disk_writes:
+        # Finish writing replay and cache files so they survive the restart
+        await asyncio.gather(*tts_disk_writes, return_exceptions=True)
+    if model_server_client is not None:
+        # Releases this worker's shared-memory segments
+        model_server_client.close()
+
+@app.get("/health/ready")
+async def health_ready():
+    """Report per-model load state; 200 once every model is ready, 503 before that"""
+    ready = all(state.ready for state in model_status.values())
+    return JSONResponse(
+        {
+            "ready": ready,
+            "models": {name: state.status() for name, state in model_status.items()},
+        },
+        status_code=200 if ready else 503,
+    )
+
+def generate_with_prompt_cache(question: str, system_prompt: str, session_id: str = None, max_tokens: int = 100, augmented_question: str = None):
+    """Run on the LLM worker: reuse cached KV prefixes, stream the answer, then store the turn"""
+    prompt_tokens, cache, commit = prompt_caches.prepare(system_prompt, question, session_id, augmented_question=augmented_question)
+    answer = ""
+    finished = False
     try:
-        logger.info("Loading Silero VAD model")
-        torch.set_num_threads(1)  # To avoid performance issues
-        model, utils = torch.hub.load(repo_or_dir='snakers4/silero-vad', model='silero_vad')
-        vad_model = model
-        vad_get_speech_timestamps, _, vad_read_audio, _, _ = utils
-        logger.info("Silero VAD model loaded successfully")
+        for response in stream_generate(
+            llm_model,
+            tokenizer,
+            prompt=prompt_tokens,
+            max_tokens=max_tokens,
+            prompt_cache=cache,
+        ):
+            answer += getattr(response, "text", response)
+            yield response
+        finished = True
+    except GeneratorExit:
+        # Closed early at the end of the first line; the cache is still consistent
+        finished = True
+        raise
+    finally:
+        if finished:
+            commit(answer.strip().split("\n")[0].strip())
+
+async def rebuild_prompt_cache():
+    """Prefill the KV cache for the current system prompt on the LLM worker"""
+    try:
+        await llm_executor.run(prompt_caches.set_system_prompt, config.get("system_prompt", "You are a helpful AI assistant."))
     except Exception as e:
-        logger.error(f"Error loading Silero VAD model: {str(e)}")
-        import traceback
-        logger.error(f"Traceback: {traceback.format_exc()}")
-        logger.warning("VAD features will be disabled due to initialization error.")
+        logger.error(f"Error building system prompt cache: {str(e)}")
 
-async def get_llm_response(transcription_text: str):
-    """Query local MLX LM model with the transcription text and return the response"""
-    if not LLM_AVAILABLE:
-        logger.warning("LLM features are disabled. Skipping LLM query.")
-        return None
+def llm_token_stream(question: str, system_prompt: str, session_id: str = None, max_tokens: int = 100, augmented_question: str = None):
+    """Async iterator over raw LLM chunks for one question.
+
+    augmented_question is what the model sees this turn; the session history keeps question.
+    """
+    if llm_scheduler is not None:
+        # Shares decode steps with other users' requests
+        return llm_scheduler.stream(question, system_prompt, session_id, max_tokens=max_tokens, augmented_question=augmented_question)
+    return llm_executor.stream(
+        generate_with_prompt_cache,
+        question,
+        system_prompt,
+        session_id,
+        max_tokens=max_tokens,
+        augmented_question=augmented_question,
+    )
+
+async def stream_llm_response(transcription_text: str, session_id: str = None, trace: TurnTrace = None):
+    """Stream the LLM answer to the transcription text as it is generated.
+
+    Yields text deltas and stops generating at the first newline, since only the
+    first line of the answer is used. With a session_id, earlier turns of that
+    conversation are part of the prompt. The trace gets an llm_prefill span
+    (request to first token, including queueing) and an llm_decode span.
+    """
+    await wait_for_model("llm")
+    logger.info(f"Sending query to MLX LM: '{transcription_text[:50]}...'")
+    
+    # Use system prompt from config
+    system_prompt = config.get("system_prompt", "You are a helpful AI assistant.")
+    
+    # Retrieved passages go after the cached system-prompt prefix, so the prefix stays reusable.
+    # They are part of this turn's prompt only; the session history keeps the bare question.
+    augmented_question = None
+    top_k = config.get("knowledge_top_k", 3)
+    if top_k > 0:
+        retrieval_started = time.perf_counter()
+        # Off the event loop: the search waits for any index rebuild in progress
+        passages = await asyncio.to_thread(knowledge_base.search, transcription_text, top_k, config.get("knowledge_min_score", 0.0))
+        augmented_question = format_question(transcription_text, passages)
+        if trace is not None:
+            trace.add_span("retrieval", retrieval_started, time.perf_counter(), passages=len(passages))
+    
+    tokens = llm_token_stream(transcription_text, system_prompt, session_id, max_tokens=100, augmented_question=augmented_question)  # Reduced for more concise responses
+    started = False
+    requested_at = time.perf_counter()
+    first_token_at = None
+    token_count = 0
+    try:
+        async for chunk in tokens:
+            token_count += 1
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+            # Newer mlx_lm versions yield GenerationResponse objects, older ones plain strings
+            segment = getattr(chunk, "text", chunk)
+            if not started:
+                # Leading whitespace/newlines are not the end of the first line
+                segment = segment.lstrip()
+                started = bool(segment)
+            end_of_line = "\n" in segment
+            if end_of_line:
+                segment = segment.split("\n")[0]
+            if segment:
+                yield segment
+            if end_of_line:
+                break
+    finally:
+        await tokens.aclose()
+        finished_at = time.perf_counter()
+        LLM_TOKENS.inc(token_count)
+        if trace is not None and first_token_at is not None:
+            trace.add_span("llm_prefill", requested_at, first_token_at)
+            trace.add_span("llm_decode", first_token_at, finished_at, tokens=token_count)
+        if token_count > 1 and finished_at > first_token_at:
+            LLM_TOKENS_PER_SECOND.observe((token_count - 1) / (finished_at - first_token_at))
+
+def models_in_use():
+    """Model names reported alongside each transcription"""
+    return {
+        "whisper": model_status["whisper"].model_id,
+        "llm": model_status["llm"].model_id if not model_status["llm"].failed else None,
+        "tts": model_status["tts"].model_id if not model_status["tts"].failed else None
+    }
+
+def route_whisper(seconds: float):
+    """Pick the Whisper checkpoint for an utterance: the small one for short clips, else the active model"""
+    small_model = config.get("whisper_small_model")
+    if small_model and seconds <= config.get("whisper_small_max_seconds", 3.0):
+        return small_model
+    return model_status["whisper"].model_id
+
+def confident_transcript(result: dict):
+    """Whether a small-model transcript can be kept instead of re-running the large model"""
+    segments = result.get("segments", [])
+    if not result.get("text", "").strip() or not segments:
+        # VAD heard speech, so an empty transcript is more likely a miss than silence
+        return False
+    logprob = sum(segment.get("avg_logprob", 0.0) for segment in segments) / len(segments)
+    repetitive = any(segment.get("compression_ratio", 0.0) > 2.4 for segment in segments)
+    return logprob >= config.get("whisper_escalate_logprob", -0.7) and not repetitive
+
+async def transcribe_array(audio: np.ndarray, trace: TurnTrace):
+    """Run Whisper on 16 kHz audio, recording a whisper span and the real-time factor.
+
+    Short utterances go to the small checkpoint when one is configured and are
+    re-run on the large model if it wasn't confident.
+    """
+    seconds = len(audio) / WHISPER_SAMPLE_RATE
+    model_id = route_whisper(seconds)
+    with trace.span("whisper", audio_seconds=round(seconds, 2), model=model_id):
+        started = time.perf_counter()
+        result = await whisper_executor.run(whisper_transcribe, audio, model_id)
+    if seconds > 0:
+        REAL_TIME_FACTOR.observe((time.perf_counter() - started) / seconds, model="whisper")
+    if model_id != model_status["whisper"].model_id and not confident_transcript(result):
+        logger.info(f"Low-confidence transcript from {model_id} ('{result.get('text', '').strip()[:30]}'), re-running on the large model")
+        with trace.span("whisper", audio_seconds=round(seconds, 2), model=model_status["whisper"].model_id, escalated=True):
+            result = await whisper_executor.run(whisper_transcribe, audio)
+    return result
+
+async def transcribe_upload(content: bytes, filename: str, content_type: str, trace: TurnTrace):
+    """Transcribe uploaded audio bytes with Whisper.
+
+    WAV and raw PCM bodies are decoded in memory and handed to Whisper as a
+    16 kHz array, and so are Opus uploads in WebM or Ogg. Anything else (mp4,
+    ...) goes through a temporary file so Whisper can decode it with ffmpeg.
+    """
+    await wait_for_model("whisper")
+    with trace.span("decode", bytes=len(content)):
+        audio = await asyncio.to_thread(decode_audio_bytes, content, content_type)
+    if audio is not None:
+        logger.info(f"Decoded {len(audio) / 16000:.2f}s of audio in memory")
+        return await transcribe_array(audio, trace)
+    
+    suffix = os.path.splitext(filename or "")[1]
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as temp_file:
+        temp_file.write(content)
+    try:
+        logger.info(f"Falling back to file decode for {temp_file.name}")
+        with trace.span("whisper", file_decode=True):
+            return await whisper_executor.run(whisper_transcribe, temp_file.name)
+    finally:
+        # Clean up the temporary file
+        os.unlink(temp_file.name)
 
+@app.post("/transcribe/")
+async def transcribe_audio(file: UploadFile = File(...), session_id: str = Form(None)):
+    # The transcription ID doubles as the turn's trace ID
+    transcription_id = str(uuid.uuid4())
+    trace = TurnTrace(transcription_id)
+    with trace.span("upload_read"):
+        content = await file.read()
+    
+    deadline = turn_deadline(UPLOAD)
+    
     try:
-        logger.info(f"Sending query to MLX LM: '{transcription_text[:50]}...'")
+        # Refuse right away rather than transcribe a turn the LLM stage can't take
+        admission["llm"].check(UPLOAD)
         
-        # Use system prompt from config
-        system_prompt = config.get("system_prompt", "You are a helpful AI assistant.")
-        prompt = f"{system_prompt}\n\nQ: {transcription_text}\nA: "
-        
-        # Generate response with minimal parameters
-        response = generate(
-            llm_model, 
-            tokenizer, 
-            prompt=prompt,
-            max_tokens=100,  # Reduced for more concise responses
-            verbose=False  # Disable verbose output
-        )
+        # Transcribe the audio using MLX Whisper with the specified model
+        logger.info(f"Transcribing uploaded audio: {file.filename} ({len(content)} bytes)")
         
-        # Clean up the response
-        response = response.strip().split('\n')[0]  # Take only the first line
-        logger.info(f"MLX LM response: '{response}'")
-            
-        return response
+        async with admission["transcribe"].admit(UPLOAD, deadline, trace):
+            result = await transcribe_upload(content, file.filename, file.content_type, trace)
+        
+        transcription_text = result["text"]
+        logger.info(f"Transcription result: '{transcription_text[:50]}...'")
+        
+        response_data = {
+            "text": transcription_text,
+            "transcription_id": transcription_id,
+            "status": "success",
+            "models": models_in_use()
+        }
+        
+        # Always use LLM and TTS if available
+        if not model_status["llm"].failed:
+            results_store[transcription_id] = new_result_entry(trace)
+            # Create a task to process LLM response and TTS in the background
+            start_turn(transcription_id, transcription_text, True, session_id, UPLOAD, deadline)
+        
+        return response_data
+    except (QueueFullError, ModelUnavailableError, OverloadedError, DeadlineExceeded) as e:
+        logger.warning(f"Rejecting transcription: {str(e)}")
+        return rejection_response(e)
     except Exception as e:
-        logger.error(f"Error querying MLX LM: {str(e)}")
+        logger.error(f"Transcription error: {str(e)}")
         import traceback
-        logger.error(f"Traceback: {traceback.format_exc()}")
-        return None
+        logger.error(f"Transcription traceback: {traceback.format_exc()}")
+        return {
+            "error": str(e),
+            "status": "error"
+        }
 
-@app.post("/transcribe/")
-async def transcribe_audio(file: UploadFile = File(...)):
-    # Create a temporary file to store the uploaded audio
-    with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file.filename)[1]) as temp_file:
-        # Write the uploaded file content to the temporary file
-        content = await file.read()
-        temp_file.write(content)
-        temp_file.flush()
+# LLM responses and TTS filenames per transcription ID, bounded by size and age
+results_store = ResultsStore(
+    max_entries=config.get("results_max_entries", 500),
+    ttl_seconds=config.get("results_ttl_seconds", 3600),
+)
+
+# Repeated questions skip the LLM; keyed by normalized question, system prompt and model
+answer_cache = AnswerCache(
+    max_entries=config.get("answer_cache_max_entries", 1000),
+    ttl_seconds=config.get("answer_cache_ttl_seconds", 86400),
+)
+
+# Bounded admission into each pipeline stage: (concurrency, max waiting) unless configured
+ADMISSION_DEFAULTS = {"transcribe": (2, 8), "llm": (8, 16), "tts": (2, 16)}
+admission = {
+    stage: AdmissionGate(
+        stage,
+        config.get("admission_concurrency", {}).get(stage, concurrency),
+        config.get("admission_max_waiting", {}).get(stage, max_waiting),
+    )
+    for stage, (concurrency, max_waiting) in ADMISSION_DEFAULTS.items()
+}
+
+def turn_deadline(priority: int):
+    """time.monotonic() by which a turn arriving now must have reached its last stage (None: no deadline)"""
+    seconds = config.get(f"{PRIORITY_NAMES[priority]}_turn_deadline_seconds")
+    return time.monotonic() + seconds if seconds else None
+
+def record_drop(e: Exception):
+    if isinstance(e, (OverloadedError, DeadlineExceeded)):
+        ADMISSION_DROPPED.inc(stage=e.stage, reason="overloaded" if isinstance(e, OverloadedError) else "deadline")
+
+def retry_after_seconds(e: Exception):
+    if isinstance(e, OverloadedError):
+        return e.retry_after
+    if isinstance(e, DeadlineExceeded):
+        return admission[e.stage].retry_after()
+    if isinstance(e, QueueFullError):
+        return 1
+    # A model that is still loading
+    return 10
+
+def rejection_response(e: Exception):
+    """Fast 429 (admission queue full) or 503 (stale, busy or model unavailable) with a Retry-After"""
+    record_drop(e)
+    retry_after = retry_after_seconds(e)
+    return JSONResponse(
+        {"error": str(e), "status": "error", "retry_after": retry_after},
+        status_code=429 if isinstance(e, OverloadedError) else 503,
+        headers={"Retry-After": str(retry_after)},
+    )
+
+# Shop documents; each turn's prompt gets only the passages relevant to the question
+knowledge_base = KnowledgeBase(
+    config.get("knowledge_base_dir", "knowledge_base"),
+    chunk_words=config.get("knowledge_chunk_words", 80),
+)
+
+def answer_cache_context():
+    """Part of the answer cache key besides question, prompt and model: the knowledge base when turns use it.
+
+    The index version comes from the file, so answers cached by this worker stop
+    matching when another worker changes the documents.
+    """
+    return knowledge_base.version() if config.get("knowledge_top_k", 3) > 0 else None
+
+def new_result_entry(trace: TurnTrace = None):
+    """Create the results_store entry for a turn that is still processing"""
+    return {
+        # Stage spans of the turn, served by /trace/{transcription_id}
+        "trace": trace,
+        "llm_response": None,
+        "partial_response": "",
+        "tts_filename": None,
+        "tts_status": "pending",
+        # Per-sentence 24 kHz float32 chunks, appended as soon as each is synthesized
+        "audio_chunks": [],
+        "playback": None,
+        "completed": False,
+        "error": None,
+        "status": "processing",
+        # Bumped and broadcast on every change so streaming clients can wait for updates
+        "version": 0,
+        "updated": asyncio.Condition(),
+    }
+
+async def publish_result(transcription_id: str, **updates):
+    """Apply updates to a results_store entry and wake any clients streaming it"""
+    entry = results_store.get(transcription_id)
+    if entry is None:
+        # Evicted while still processing; nobody can fetch it anymore
+        return
+    entry.update(updates)
+    entry["version"] += 1
+    async with entry["updated"]:
+        entry["updated"].notify_all()
+
+async def as_async_iterator(items):
+    """Iterate a plain iterable or an async iterable with async for"""
+    if hasattr(items, "__aiter__"):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
+
+# Running process_llm_and_tts tasks by transcription ID, and the latest turn of each
+# session (or of each /vad-stream/ connection without one)
+turn_tasks = {}
+session_turns = {}
+
+def start_turn(
+    transcription_id: str,
+    transcription_text: str,
+    play_audio: bool = False,
+    session_id: str = None,
+    priority: int = UPLOAD,
+    deadline: float = None,
+    turn_group: str = None,
+):
+    """Run process_llm_and_tts in the background, cancelling the group's previous turn if it is still running.
+
+    session_id is the client's opt-in conversation (earlier turns go into the
+    prompt); turn_group only decides which turns replace each other and
+    defaults to the session.
+    """
+    turn_group = turn_group or session_id
+    if turn_group:
+        cancel_session_turn(turn_group, "a newer turn arrived")
+        session_turns[turn_group] = transcription_id
+    task = asyncio.create_task(process_llm_and_tts(transcription_id, transcription_text, play_audio, session_id, priority, deadline))
+    turn_tasks[transcription_id] = task
+    
+    def forget(_):
+        turn_tasks.pop(transcription_id, None)
+        if turn_group and session_turns.get(turn_group) == transcription_id:
+            del session_turns[turn_group]
+    
+    task.add_done_callback(forget)
+    return task
+
+def cancel_turn(transcription_id: str, reason: str):
+    """Cancel a running turn; returns False if it already finished"""
+    task = turn_tasks.get(transcription_id)
+    if task is None or task.done():
+        return False
+    logger.info(f"Cancelling turn {transcription_id}: {reason}")
+    task.cancel()
+    return True
+
+def cancel_session_turn(session_id: str, reason: str):
+    transcription_id = session_turns.get(session_id)
+    return transcription_id is not None and cancel_turn(transcription_id, reason)
+
+async def process_llm_and_tts(
+    transcription_id: str,
+    transcription_text: str,
+    play_audio: bool = False,
+    session_id: str = None,
+    priority: int = UPLOAD,
+    deadline: float = None,
+):
+    """Process LLM response and TTS generation in the background.
+
+    With TTS enabled, completed sentences are synthesized while the LLM is still
+    generating the rest of the answer. Cancelling the task (barge-in, a newer
+    turn, an explicit cancel) stops the LLM at the next token, TTS at the next
+    sentence, and server-side playback of this turn's audio. The turn waits
+    for admission into the LLM and TTS stages by priority, and is dropped if
+    its deadline passes first.
+    """
+    # Another worker may have changed the system prompt
+    reload_config_if_changed()
+    # Endpoints register the entry before scheduling us so streaming clients never see a 404
+    entry = results_store.setdefault(transcription_id, new_result_entry())
+    if entry["trace"] is None:
+        entry["trace"] = TurnTrace(transcription_id)
+    trace = entry["trace"]
+    speak = play_audio and not model_status["tts"].failed
+    tts_task = None
+    try:
+        if speak:
+            playback = config.get("tts_playback", "server")
+            await publish_result(transcription_id, playback=playback)
+            sentences = asyncio.Queue()
+            splitter = SentenceSplitter()
+            tts_task = asyncio.create_task(speak_sentences(transcription_id, sentences, playback, priority, deadline))
         
+        # An answer that depends on earlier turns of a conversation can't be shared
+        system_prompt = config.get("system_prompt", "You are a helpful AI assistant.")
+        # In model-server mode prompt_caches calls are blocking socket round trips
+        cacheable = not (session_id and prompt_caches is not None and await asyncio.to_thread(prompt_caches.has_history, session_id))
+        cache_context = answer_cache_context()
+        cached_response = answer_cache.get(transcription_text, system_prompt, model_status["llm"].model_id, cache_context) if cacheable else None
+        
+        llm_token = None
+        if cached_response is None:
+            # Stale or shed turns stop here instead of reaching the LLM
+            with trace.span("admission_wait", stage="llm"):
+                llm_token = await admission["llm"].acquire(priority, deadline)
+        
+        # Stream the LLM response into the store token by token
+        partial_response = ""
         try:
-            # Transcribe the audio using MLX Whisper with the specified model
-            logger.info(f"Transcribing audio file: {temp_file.name}")
-            logger.info(f"Using Whisper model: {WHISPER_MODEL}")
-            
-            result = mlx_whisper.transcribe(
-                temp_file.name,
-                path_or_hf_repo=WHISPER_MODEL,
-            )
-            
-            # Clean up the temporary file
-            os.unlink(temp_file.name)
-            
-            transcription_text = result["text"]
-            logger.info(f"Transcription result: '{transcription_text[:50]}...'")
-            
-            # Store transcription in a temporary location with unique ID for later retrieval
-            transcription_id = str(uuid.uuid4())
-            
-            response_data = {
-                "text": transcription_text,
-                "transcription_id": transcription_id,
-                "status": "success",
-                "models": {
-                    "whisper": WHISPER_MODEL,
-                    "llm": LLM_MODEL if LLM_AVAILABLE else None,
-                    "tts": "mlx-community/Kokoro-82M-4bit" if TTS_AVAILABLE else None
-                }
-            }
-            
-            # Always use LLM and TTS if available
-            if LLM_AVAILABLE:
-                # Create a task to process LLM response and TTS in the background
-                asyncio.create_task(process_llm_and_tts(transcription_id, transcription_text, True))
+            if cached_response is not None:
+                logger.info(f"Answer cache hit for: '{transcription_text[:50]}...'")
+                if session_id and prompt_caches is not None:
+                    await asyncio.to_thread(prompt_caches.record_turn, session_id, transcription_text, cached_response)
+                segments = [cached_response]
+            else:
+                segments = stream_llm_response(transcription_text, session_id, trace)
             
-            return response_data
+            async for segment in as_async_iterator(segments):
+                partial_response += segment
+                await publish_result(transcription_id, partial_response=partial_response)
+                if speak:
+                    for sentence in splitter.feed(segment):
+                        sentences.put_nowait(sentence)
+            llm_response = partial_response.strip()
+            logger.info(f"MLX LM response: '{llm_response}'")
+            if cached_response is None and cacheable and llm_response:
+                answer_cache.put(transcription_text, system_prompt, model_status["llm"].model_id, llm_response, cache_context)
         except Exception as e:
-            # Clean up the temporary file in case of error
-            os.unlink(temp_file.name)
-            logger.error(f"Transcription error: {str(e)}")
+            logger.error(f"Error querying MLX LM: {str(e)}")
             import traceback
-            logger.error(f"Transcription traceback: {traceback.format_exc()}")
-            return {
-                "error": str(e),
-                "status": "error"
-            }
-
-# Dictionary to store LLM responses and TTS filenames
-results_store = {}
-
-async def process_llm_and_tts(transcription_id: str, transcription_text: str, play_audio: bool = False):
-    """Process LLM response and TTS generation in the background"""
-    try:
-        # Initialize the result in the store with processing state
-        results_store[transcription_id] = {
-            "llm_response": None,
-            "tts_filename": None,
-            "completed": False,
-            "error": None,
-            "status": "processing"
-        }
-
-        # Get response from LLM
-        llm_response = await get_llm_response(transcription_text)
+            logger.error(f"Traceback: {traceback.format_exc()}")
+            llm_response = None
+        finally:
+            if llm_token is not None:
+                admission["llm"].release(llm_token)
         
-        if llm_response is None:
+        if not llm_response:
+            if tts_task is not None:
+                tts_task.cancel()
             # Handle the case where we got no response from the LLM
-            results_store[transcription_id].update({
-                "completed": True,
-                "error": "No response from LLM model",
-                "status": "error"
-            })
+            await publish_result(
+                transcription_id,
+                completed=True,
+                error="No response from LLM model",
+                status="error",
+                tts_status="skipped",
+            )
             return
         
         # Store the successful LLM response
-        results_store[transcription_id].update({
-            "llm_response": llm_response,
-            "completed": True,
-            "status": "success"
-        })
+        await publish_result(
+            transcription_id,
+            llm_response=llm_response,
+            completed=True,
+            status="success",
+        )
         
-        # Generate TTS if enabled
-        if play_audio and TTS_AVAILABLE:
+        # Finish TTS for the trailing sentence if enabled
+        if speak:
+            for sentence in splitter.flush():
+                sentences.put_nowait(sentence)
+            sentences.put_nowait(None)
             try:
-                tts_filename = await generate_tts(llm_response)
-                results_store[transcription_id]["tts_filename"] = tts_filename
+                tts_filename = await tts_task
+                await publish_result(transcription_id, tts_filename=tts_filename, tts_status="done")
+            except (OverloadedError, DeadlineExceeded) as e:
+                # The text answer stands; speaking it would come too late or crowd out live turns
+                record_drop(e)
+                logger.warning(f"Skipping TTS for turn {transcription_id}: {str(e)}")
+                await publish_result(transcription_id, tts_status="skipped")
             except Exception as e:
                 logger.error(f"Error in TTS processing: {str(e)}")
                 import traceback
                 logger.error(f"TTS traceback: {traceback.format_exc()}")
                 # Don't mark as error if TTS fails, just log it
                 logger.warning("TTS failed but continuing with LLM response")
+                await publish_result(transcription_id, tts_status="failed")
+        else:
+            await publish_result(transcription_id, tts_status="skipped")
+    except asyncio.CancelledError:
+        if tts_task is not None:
+            tts_task.cancel()
+        if entry["playback"] == "server" and entry["audio_chunks"] and audio_player is not None:
+            audio_player.stop()
+        await publish_result(
+            transcription_id,
+            completed=True,
+            status="cancelled",
+            tts_status="cancelled",
+        )
+        raise
+    except (OverloadedError, DeadlineExceeded) as e:
+        record_drop(e)
+        logger.warning(f"Dropping turn {transcription_id}: {str(e)}")
+        if tts_task is not None:
+            tts_task.cancel()
+        await publish_result(
+            transcription_id,
+            completed=True,
+            error=str(e),
+            status="error",
+            tts_status="skipped",
+        )
     except Exception as e:
         logger.error(f"Error in background processing: {str(e)}")
         import traceback
         logger.error(f"Background processing traceback: {traceback.format_exc()}")
+        if tts_task is not None:
+            tts_task.cancel()
         # Store the error in results
-        results_store[transcription_id].update({
-            "completed": True,
-            "error": str(e),
-            "status": "error"
-        })
+        await publish_result(
+            transcription_id,
+            completed=True,
+            error=str(e),
+            status="error",
+            tts_status="skipped",
+        )
+    finally:
+        VOICE_TURNS.inc(status=entry["status"])
+        logger.info(f"Turn {transcription_id} trace: {trace.summary()}")
+
+def sse_event(event: str, data: dict):
+    """Format a server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+# How long a streaming client waits without any update before giving up
+STREAM_IDLE_TIMEOUT = 60
+
+async def result_events(entry: dict):
+    """Yield (event, data) pairs for a results_store entry as it progresses.
+
+    Emits token deltas, per-sentence audio chunks (with browser playback),
+    llm_done once the answer is complete, and finally done (or error). Shared
+    by the SSE endpoint and the VAD WebSocket.
+    """
+    sent = 0
+    sent_chunks = 0
+    llm_done_sent = False
+    while True:
+        seen_version = entry["version"]
+        partial = entry["partial_response"]
+        if len(partial) > sent:
+            yield "token", {"text": partial[sent:]}
+            sent = len(partial)
+        
+        # With server playback the browser has nothing to play; don't ship the PCM
+        chunks = entry["audio_chunks"] if entry["playback"] == "browser" else ()
+        while sent_chunks < len(chunks):
+            yield "audio", {
+                "index": sent_chunks,
+                "sample_rate": TTS_SAMPLE_RATE,
+                "playback": entry["playback"],
+                "pcm": encode_pcm16_base64(chunks[sent_chunks]),
+            }
+            sent_chunks += 1
+        
+        if entry["status"] == "error":
+            yield "error", {"error": entry.get("error") or "Unknown error"}
+            return
+        
+        if entry["status"] == "cancelled":
+            yield "cancelled", {"partial_response": entry["partial_response"]}
+            return
+        
+        if entry["completed"] and not llm_done_sent:
+            yield "llm_done", {"llm_response": entry["llm_response"]}
+            llm_done_sent = True
+        
+        if entry["tts_status"] != "pending":
+            yield "done", {
+                "tts_filename": entry["tts_filename"],
+                "tts_status": entry["tts_status"],
+                "audio_streamed": entry["playback"] == "server" and bool(entry["audio_chunks"]),
+            }
+            return
+        
+        try:
+            async with entry["updated"]:
+                await asyncio.wait_for(
+                    entry["updated"].wait_for(lambda: entry["version"] != seen_version),
+                    timeout=STREAM_IDLE_TIMEOUT,
+                )
+        except asyncio.TimeoutError:
+            yield "error", {"error": "Timed out waiting for response"}
+            return
+
+@app.get("/stream_response/{transcription_id}")
+async def stream_response(transcription_id: str):
+    """Stream LLM tokens, then the TTS filename, for a transcription ID as server-sent events"""
+    if transcription_id not in results_store:
+        return JSONResponse({"error": "Transcription ID not found", "status": "error"}, status_code=404)
+    
+    entry = results_store[transcription_id]
+    
+    async def events():
+        async for event, data in result_events(entry):
+            yield sse_event(event, data)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @app.get("/get_response/{transcription_id}")
 async def get_response(transcription_id: str):
@@ -304,9 +1105,14 @@ async def get_response(transcription_id: str):
         return {
             "status": "success",
             "llm_response": result.get("llm_response"),
-            "tts_filename": result.get("tts_filename")
+            "tts_filename": result.get("tts_filename"),
+            # Server-side playback already happened sentence by sentence
+            "audio_streamed": result.get("playback") == "server" and bool(result.get("audio_chunks"))
         }
     
+    if result.get("status") == "cancelled":
+        return {"status": "cancelled", "llm_response": None, "tts_filename": None}
+    
     # If there was an error, return the error
     return {
         "status": "error",
@@ -315,70 +1121,217 @@ async def get_response(transcription_id: str):
         "tts_filename": None
     }
 
-async def generate_tts(text: str, voice: str = "af_heart", speed: float = 1.0):
-    """Generate TTS audio for the given text and return the filename"""
-    global tts_model
+TTS_SAMPLE_RATE = 24000
+
+# TTS audio served by /audio/ and /play straight from memory; files on disk are only a fallback
+audio_buffers = AudioBufferCache(int(config.get("audio_buffer_cache_mb", 64) * 1024 * 1024))
+
+# Synthesized sentences and whole answers, reused across turns
+tts_cache = TTSCache(
+    OUTPUT_FOLDER,
+    TTS_SAMPLE_RATE,
+    max_entries=config.get("tts_cache_max_entries", 2000),
+    max_bytes=int(config.get("tts_cache_max_mb", 500) * 1024 * 1024),
+    ttl_seconds=config.get("tts_cache_ttl_seconds", 7 * 86400),
+    buffers=audio_buffers,
+)
+
+# WAV files still being written in the background, so the turn doesn't wait on the disk
+tts_disk_writes = set()
+tts_disk_write_stats = {"written": 0, "failed": 0}
+
+def write_in_background(write, *args):
+    """Run a blocking file write on a thread without awaiting it"""
+    async def run():
+        try:
+            await asyncio.to_thread(write, *args)
+            tts_disk_write_stats["written"] += 1
+        except Exception as e:
+            tts_disk_write_stats["failed"] += 1
+            logger.error(f"Could not write TTS audio to disk: {str(e)}")
     
-    if not text.strip():
-        raise ValueError("Text is empty")
+    task = asyncio.create_task(run())
+    tts_disk_writes.add(task)
+    task.add_done_callback(tts_disk_writes.discard)
+    return task
+
+# A sentence ends at . ! or ? (plus any closing quotes/brackets) followed by whitespace
+SENTENCE_END = re.compile(r"[.!?][\"')\]]*\s+")
+
+class SentenceSplitter:
+    """Accumulate streamed text and emit complete sentences for incremental TTS"""
     
-    if tts_model is None:
-        raise ValueError("TTS model not initialized")
+    def __init__(self, min_chars: int = 12):
+        # Fragments shorter than this ("Hi.", "Mr.") are merged into the next sentence
+        self.min_chars = min_chars
+        self.buffer = ""
     
-    # Generate a unique filename
-    unique_id = str(uuid.uuid4())
-    filename = f"tts_{unique_id}.wav"
-    output_path = os.path.join(OUTPUT_FOLDER, filename)
+    def feed(self, text: str):
+        """Add text and return the sentences it completed"""
+        self.buffer += text
+        sentences = []
+        start = 0
+        for match in SENTENCE_END.finditer(self.buffer):
+            sentence = self.buffer[start:match.end()].strip()
+            if len(sentence) < self.min_chars:
+                continue
+            sentences.append(sentence)
+            start = match.end()
+        self.buffer = self.buffer[start:]
+        return sentences
     
-    logger.info(f"Generating TTS for text: '{text[:50]}...' with voice: {voice}, speed: {speed}")
+    def flush(self):
+        """Return whatever is left once the text stream has ended"""
+        rest = self.buffer.strip()
+        self.buffer = ""
+        return [rest] if rest else []
+
+def encode_pcm16_base64(audio: np.ndarray):
+    """Encode float audio in [-1, 1] as base64 little-endian 16-bit PCM"""
+    pcm = (np.clip(audio, -1.0, 1.0) * 32767).astype("<i2")
+    return base64.b64encode(pcm.tobytes()).decode("ascii")
+
+async def synthesize_speech(text: str, voice: str = "af_heart", speed: float = 1.0):
+    """Run Kokoro on the TTS worker and return the generated float32 audio segments"""
+    await wait_for_model("tts")
+    stop = threading.Event()
     
-    # Generate TTS
-    results = tts_model.generate(
-        text=text,
-        voice=voice,
-        speed=speed,
-        lang_code=voice[0],
-        verbose=False,
-    )
+    def synthesize():
+        # tts_model.generate is lazy, so drain it on the TTS worker as well
+        results = tts_model.generate(
+            text=text,
+            voice=voice,
+            speed=speed,
+            lang_code=voice[0],
+            verbose=False,
+        )
+        segments = []
+        for segment in results:
+            if stop.is_set():
+                # Cancelled: free the worker instead of finishing the text
+                break
+            segments.append(np.asarray(segment.audio, dtype=np.float32))
+        return segments
     
-    # Gather all segments into a single wav
-    audio_arrays = []
-    for segment in results:
-        audio_arrays.append(segment.audio)
+    try:
+        return await tts_executor.run(synthesize)
+    except asyncio.CancelledError:
+        stop.set()
+        raise
+
+async def cached_speech(text: str, voice: str = "af_heart", speed: float = 1.0, trace: TurnTrace = None):
+    """Return float32 audio for the text from the TTS cache, synthesizing and caching it on a miss"""
+    trace = trace or TurnTrace(None)
+    with trace.span("tts_cache_read"):
+        audio = await asyncio.to_thread(tts_cache.load, text, voice, speed)
+    if audio is not None:
+        return audio
     
-    if not audio_arrays:
-        raise ValueError("No audio segments generated")
+    with trace.span("tts", chars=len(text)) as span:
+        started = time.perf_counter()
+        segments = await synthesize_speech(text, voice, speed)
+        if segments:
+            audio = np.concatenate(segments, axis=0)
+            span["audio_seconds"] = round(len(audio) / TTS_SAMPLE_RATE, 2)
+    if audio is None:
+        return None
+    REAL_TIME_FACTOR.observe((time.perf_counter() - started) * TTS_SAMPLE_RATE / max(len(audio), 1), model="tts")
+    # In memory now, on disk (for restarts and other workers) once the background write is done
+    tts_cache.remember(text, voice, speed, audio)
+    write_in_background(tts_cache.store, text, voice, speed, audio)
+    return audio
+
+async def load_tts_audio(filename: str):
+    """Float32 samples of a TTS file, from the in-memory buffers or else from disk; None if there is none"""
+    audio = audio_buffers.get(filename)
+    if audio is not None:
+        return audio
+    # Only files we wrote: no paths, only TTS names
+    if os.path.basename(filename) != filename or not filename.endswith(".wav") or not filename.startswith(TTS_CACHE_PREFIX):
+        return None
+    file_path = os.path.join(OUTPUT_FOLDER, filename)
     
-    # Concatenate all segments
-    cat_audio = np.concatenate(audio_arrays, axis=0)
+    def read():
+        try:
+            audio, _ = sf.read(file_path, dtype="float32")
+        except (FileNotFoundError, RuntimeError):
+            return None
+        # If audio is stereo, convert to mono
+        if audio.ndim > 1:
+            audio = audio.mean(axis=1)
+        audio_buffers.put(filename, audio)
+        return audio
     
-    # Write the audio as a WAV
-    sf.write(output_path, cat_audio, 24000)
+    return await asyncio.to_thread(read)
+
+async def speak_sentences(transcription_id: str, sentences: asyncio.Queue, playback: str, priority: int = UPLOAD, deadline: float = None):
+    """Synthesize sentences from the queue as they arrive until a None sentinel.
+
+    Each sentence's audio is published to streaming clients and, for server
+    playback, queued on the AudioPlayer right away. Returns the filename of the
+    full answer written as one WAV for replay. Sentences and answers that were
+    spoken before come from the TTS cache without running the model. The turn
+    enters the TTS stage when its first sentence is ready.
+    """
+    entry = results_store[transcription_id]
+    chunks = entry["audio_chunks"]
+    trace = entry["trace"]
+    spoken = []
+    tts_token = None
+    try:
+        while True:
+            sentence = await sentences.get()
+            if sentence is None:
+                break
+            if tts_token is None:
+                with trace.span("admission_wait", stage="tts"):
+                    tts_token = await admission["tts"].acquire(priority, deadline)
+            
+            logger.info(f"Generating TTS for sentence: '{sentence[:50]}...'")
+            try:
+                audio = await cached_speech(sentence, trace=trace)
+            except Exception as e:
+                # Skip the sentence rather than losing the rest of the answer
+                logger.error(f"TTS failed for sentence: {str(e)}")
+                continue
+            if audio is None:
+                continue
+            
+            spoken.append(sentence)
+            chunks.append(audio)
+            if playback == "server" and audio_player is not None:
+                audio_player.queue_audio(audio)
+            await publish_result(transcription_id)
+    finally:
+        if tts_token is not None:
+            admission["tts"].release(tts_token)
     
-    if not os.path.exists(output_path) or os.path.getsize(output_path) == 0:
-        raise ValueError("Failed to create audio file or file is empty")
+    if not chunks:
+        raise ValueError("No audio segments generated")
     
-    return filename
+    # The replay file is content-addressed too, so a repeated answer reuses it
+    answer_text = " ".join(spoken)
+    filename = await asyncio.to_thread(tts_cache.lookup, answer_text, "af_heart", 1.0)
+    if filename is not None:
+        return filename
+    with trace.span("wav_write", answer=True):
+        audio = np.concatenate(chunks, axis=0)
+        filename = tts_cache.remember(answer_text, "af_heart", 1.0, audio)
+        write_in_background(tts_cache.store, answer_text, "af_heart", 1.0, audio)
+        return filename
 
 async def play_audio_file(filename: str):
     """Play an audio file using the audio player"""
     global audio_player
     
-    if not TTS_AVAILABLE or audio_player is None:
-        return False
-    
-    file_path = os.path.join(OUTPUT_FOLDER, filename)
-    if not os.path.exists(file_path):
-        logger.error(f"Audio file not found: {file_path}")
+    if audio_player is None:
         return False
     
     try:
-        # Load the audio file
-        audio_data, sample_rate = sf.read(file_path)
-        
-        # If audio is stereo, convert to mono
-        if len(audio_data.shape) > 1 and audio_data.shape[1] > 1:
-            audio_data = audio_data.mean(axis=1)
+        audio_data = await load_tts_audio(filename)
+        if audio_data is None:
+            logger.error(f"Audio file not found: {filename}")
+            return False
         
         # Queue the audio for playback
         audio_player.queue_audio(audio_data)
@@ -388,35 +1341,132 @@ async def play_audio_file(filename: str):
         logger.error(f"Failed to auto-play audio: {str(e)}")
         return False
 
+results_sweeper_stats = {"runs": 0, "last_run": None}
+
+async def results_sweeper():
+    """Periodically drop expired results, so turns nobody fetches don't hold memory until the next lookup"""
+    while True:
+        await asyncio.sleep(config.get("results_sweep_interval_seconds", 60))
+        try:
+            results_store.expire()
+            results_sweeper_stats["runs"] += 1
+            results_sweeper_stats["last_run"] = time.time()
+        except Exception as e:
+            logger.error(f"Error sweeping results: {str(e)}")
+
+@app.get("/results/stats")
+async def results_stats():
+    """Report results store size, evictions, cache hit rates and sweeper activity"""
+    return {
+        "results_store": results_store.stats(),
+        "results_sweeper": results_sweeper_stats,
+        "answer_cache": answer_cache.stats(),
+        "tts_cache": tts_cache.stats(),
+        "audio_buffers": audio_buffers.stats(),
+        "tts_disk_writes": {"pending": len(tts_disk_writes), **tts_disk_write_stats},
+    }
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: per-stage latency histograms, real-time factors, queue depths"""
+    RESULTS_STORE_SIZE.set(len(results_store))
+    for executor in (whisper_executor, llm_executor, tts_executor, vad_executor):
+        INFERENCE_QUEUE_DEPTH.set(executor.stats()["queue_depth"], executor=executor.name)
+    for stage, gate in admission.items():
+        ADMISSION_WAITING.set(gate.waiting, stage=stage)
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/trace/{transcription_id}")
+async def get_trace(transcription_id: str):
+    """Stage timings of one turn, while its result is still stored"""
+    entry = results_store.get(transcription_id)
+    if entry is None or entry.get("trace") is None:
+        return JSONResponse({"error": "Trace not found"}, status_code=404)
+    return entry["trace"].to_dict()
+
+AUDIO_STREAM_CHUNK_BYTES = 64 * 1024
+
+def parse_byte_range(header: str, size: int):
+    """Parse a single-range "bytes=start-end" header into inclusive (start, end).
+
+    Returns None to serve the whole body (no header, or several ranges) and
+    raises ValueError when the range can't be satisfied.
+    """
+    if not header or not header.strip().lower().startswith("bytes="):
+        return None
+    spec = header.split("=", 1)[1].strip()
+    if "," in spec:
+        return None
+    start_text, _, end_text = spec.partition("-")
+    try:
+        if not start_text:
+            # Suffix range: the last N bytes
+            length = int(end_text)
+            if length <= 0:
+                raise ValueError(f"Empty suffix range {header}")
+            return max(0, size - length), size - 1
+        start = int(start_text)
+        end = int(end_text) if end_text else size - 1
+    except ValueError:
+        raise ValueError(f"Malformed range {header}") from None
+    if start >= size or end < start:
+        raise ValueError(f"Range {header} is outside the {size} byte body")
+    return start, min(end, size - 1)
+
+def stream_bytes(data: bytes, start: int, end: int):
+    """Yield data[start:end + 1] in chunks without copying the whole body"""
+    view = memoryview(data)
+    for offset in range(start, end + 1, AUDIO_STREAM_CHUNK_BYTES):
+        yield view[offset:min(offset + AUDIO_STREAM_CHUNK_BYTES, end + 1)]
+
 @app.get("/audio/{filename}")
-def get_audio_file(filename: str):
-    """Return an audio file from the outputs folder"""
-    file_path = os.path.join(OUTPUT_FOLDER, filename)
+async def get_audio_file(request: Request, filename: str, format: str = None):
+    """Stream a TTS file from memory, as 16-bit WAV or Ogg Opus depending on the Accept header (or ?format=)"""
+    if format is not None:
+        fmt = format if format in AUDIO_FORMATS else None
+    else:
+        fmt = negotiate_audio_format(request.headers.get("accept"), config.get("tts_audio_format", "wav"))
+    if fmt is None:
+        return JSONResponse({"error": f"No acceptable audio format, available: {', '.join(AUDIO_FORMATS)}", "status": "error"}, status_code=406)
+    media_type, encode = AUDIO_FORMATS[fmt]
     
-    if not os.path.exists(file_path):
+    if await load_tts_audio(filename) is None:
         return JSONResponse({"error": "File not found"}, status_code=404)
+    data = await asyncio.to_thread(audio_buffers.encoded, filename, fmt, lambda audio: encode(audio, TTS_SAMPLE_RATE))
+    if data is None:
+        # Evicted between the load and the encode; rare, so just encode from disk
+        audio = await load_tts_audio(filename)
+        if audio is None:
+            return JSONResponse({"error": "File not found"}, status_code=404)
+        data = await asyncio.to_thread(encode, audio, TTS_SAMPLE_RATE)
     
-    return FileResponse(file_path, media_type="audio/wav")
+    headers = {"Accept-Ranges": "bytes", "Vary": "Accept", "ETag": f'"{filename}.{fmt}"'}
+    try:
+        byte_range = parse_byte_range(request.headers.get("range"), len(data))
+    except ValueError:
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{len(data)}", **headers})
+    if byte_range is None:
+        start, end, status_code = 0, len(data) - 1, 200
+    else:
+        start, end = byte_range
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{len(data)}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(stream_bytes(data, start, end), status_code=status_code, media_type=media_type, headers=headers)
 
 @app.post("/play")
 async def play_audio(filename: str = Form(...)):
     """Play audio directly from the server using the AudioPlayer"""
     global audio_player
     
-    if not TTS_AVAILABLE or audio_player is None:
+    if audio_player is None:
         return JSONResponse({"error": "Audio player not initialized"}, status_code=500)
     
-    file_path = os.path.join(OUTPUT_FOLDER, filename)
-    if not os.path.exists(file_path):
-        return JSONResponse({"error": "File not found"}, status_code=404)
-    
     try:
-        # Load the audio file
-        audio_data, sample_rate = sf.read(file_path)
-        
-        # If audio is stereo, convert to mono
-        if len(audio_data.shape) > 1 and audio_data.shape[1] > 1:
-            audio_data = audio_data.mean(axis=1)
+        # Straight from memory unless the buffer was evicted
+        audio_data = await load_tts_audio(filename)
+        if audio_data is None:
+            return JSONResponse({"error": "File not found"}, status_code=404)
         
         # Queue the audio for playback
         audio_player.queue_audio(audio_data)
@@ -425,12 +1475,23 @@ async def play_audio(filename: str = Form(...)):
     except Exception as e:
         return JSONResponse({"error": f"Failed to play audio: {str(e)}"}, status_code=500)
 
+@app.post("/cancel")
+async def cancel(session_id: str = Form(None), transcription_id: str = Form(None)):
+    """Cancel a running turn by transcription ID, or the latest turn of a session"""
+    if transcription_id:
+        cancelled = cancel_turn(transcription_id, "cancelled by the client")
+    elif session_id:
+        cancelled = cancel_session_turn(session_id, "cancelled by the client")
+    else:
+        return JSONResponse({"error": "Pass session_id or transcription_id", "status": "error"}, status_code=400)
+    return {"status": "success", "cancelled": cancelled}
+
 @app.post("/stop")
 async def stop_audio():
     """Stop any currently playing audio"""
     global audio_player
     
-    if not TTS_AVAILABLE or audio_player is None:
+    if audio_player is None:
         return JSONResponse({"error": "Audio player not initialized"}, status_code=500)
     
     try:
@@ -439,6 +1500,85 @@ async def stop_audio():
     except Exception as e:
         return JSONResponse({"error": f"Failed to stop audio: {str(e)}"}, status_code=500)
 
+@app.get("/inference/stats")
+async def inference_stats():
+    """Report queue depth and wait times for each model worker"""
+    if model_server_client is not None:
+        # The model server's own executors, caches and batching, shared by all front-end workers
+        try:
+            remote, _ = await asyncio.to_thread(model_server_client.call, "stats")
+        except Exception as e:
+            remote = {"error": str(e)}
+        return {
+            "executors": [executor.stats() for executor in (whisper_executor, llm_executor, tts_executor, vad_executor)],
+            "model_server": remote,
+            "vad_batching": vad_batcher.stats() if vad_batcher is not None else None,
+            "admission": {stage: gate.stats() for stage, gate in admission.items()},
+            "switching": dict(model_switches),
+        }
+    return {
+        "executors": [executor.stats() for executor in (whisper_executor, llm_executor, tts_executor, vad_executor)],
+        "prompt_cache": prompt_caches.stats() if prompt_caches is not None else None,
+        "llm_batching": llm_scheduler.stats() if llm_scheduler is not None else None,
+        "vad_batching": vad_batcher.stats() if vad_batcher is not None else None,
+        "admission": {stage: gate.stats() for stage, gate in admission.items()},
+        "models": model_registry.stats(),
+        "switching": dict(model_switches),
+    }
+
+# Offline batch jobs by job ID; they run one at a time next to live traffic
+batch_jobs = {}
+batch_job_lock = asyncio.Lock()
+
+async def run_batch_job(job: BatchJob):
+    async with batch_job_lock:
+        await run_job(job)
+
+@app.post("/jobs")
+async def create_job(manifest: str = Form(...), output: str = Form(None), llm: bool = Form(True), tts: bool = Form(True)):
+    """Start a batch job over a JSONL manifest of recordings in the jobs directory.
+
+    manifest and output are relative to batch_jobs_dir, and so are the audio
+    paths in the manifest once resolved; nothing outside it is read or written.
+    """
+    root = config.get("batch_jobs_dir", "batch_jobs")
+    try:
+        manifest_path = resolve_under(root, manifest)
+        output_path = resolve_under(root, output) if output else None
+    except ValueError as e:
+        return JSONResponse({"error": str(e), "status": "error"}, status_code=400)
+    if not os.path.isfile(manifest_path):
+        return JSONResponse({"error": f"Manifest not found: {manifest}", "status": "error"}, status_code=400)
+    job = BatchJob(manifest_path, output_path, llm=llm, tts=tts, root=root)
+    running = [other for other in batch_jobs.values() if other.status in ("queued", "running")]
+    if any(other.output == job.output for other in running):
+        return JSONResponse({"error": f"Another job is writing {job.output}", "status": "error"}, status_code=409)
+    batch_jobs[job.id] = job
+    job.task = asyncio.create_task(run_batch_job(job))
+    return JSONResponse(job.to_dict(), status_code=202)
+
+@app.get("/jobs")
+async def list_jobs():
+    return {"jobs": [job.to_dict() for job in batch_jobs.values()]}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = batch_jobs.get(job_id)
+    if job is None:
+        return JSONResponse({"error": "Job not found", "status": "error"}, status_code=404)
+    return job.to_dict()
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Cancel a job; finished clips stay in its output and are skipped if it is started again"""
+    job = batch_jobs.get(job_id)
+    if job is None:
+        return JSONResponse({"error": "Job not found", "status": "error"}, status_code=404)
+    if job.task is not None and not job.task.done():
+        job.task.cancel()
+        job.status = "cancelled"
+    return job.to_dict()
+
 @app.get("/")
 async def root():
     # Serve the index.html file
@@ -446,85 +1586,228 @@ async def root():
         html_content = f.read()
     return HTMLResponse(content=html_content)
 
+def whisper_words(audio: np.ndarray, initial_prompt: str = None):
+    """Blocking Whisper decode returning (word, start, end) tuples for streaming ASR"""
+    result = whisper_transcribe(
+        audio,
+        word_timestamps=True,
+        initial_prompt=initial_prompt,
+        condition_on_previous_text=False,
+    )
+    return [
+        (word["word"], word["start"], word["end"])
+        for segment in result.get("segments", [])
+        for word in segment.get("words", [])
+    ]
+
+async def decode_partial_transcript(send, asr: LocalAgreementTranscriber):
+    """Re-decode the current utterance window and push the committed/tentative text"""
+    if not model_status["whisper"].ready:
+        return
+    audio, offset, prompt = asr.window()
+    started = time.perf_counter()
+    try:
+        words = await whisper_executor.run(asr.decode, audio, prompt)
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage="whisper_partial")
+    except QueueFullError:
+        # Partials are best effort; skip this step rather than queue behind other turns
+        return
+    except Exception as e:
+        logger.error(f"Partial transcription error: {str(e)}")
+        return
+    committed, tentative = asr.update(words, offset)
+    await send({"status": "partial_transcript", "committed": committed, "tentative": tentative})
+
+async def handle_vad_utterance(send, audio: np.ndarray, session_id: str, asr: LocalAgreementTranscriber = None, pending_partial=None, turn_group: str = None):
+    """Transcribe a server-captured utterance and stream the full turn back over the socket.
+
+    With streaming ASR, most of the utterance is already committed and only the
+    unstable tail is decoded here.
+    """
+    transcription_id = str(uuid.uuid4())
+    trace = TurnTrace(transcription_id)
+    deadline = turn_deadline(LIVE)
+    try:
+        admission["llm"].check(LIVE)
+        await send({"status": "transcribing", "duration": round(len(audio) / 16000, 2)})
+        await wait_for_model("whisper")
+        
+        async with admission["transcribe"].admit(LIVE, deadline, trace):
+            if asr is not None:
+                if pending_partial is not None:
+                    # The partial decode touches the same transcriber; let it land first
+                    await asyncio.gather(pending_partial, return_exceptions=True)
+                logger.info(f"Finalizing streamed transcript ({len(asr.audio) / 16000:.2f}s tail after {asr.decodes} partial decodes)")
+                with trace.span("whisper", streamed=True, partial_decodes=asr.decodes):
+                    transcription_text = await whisper_executor.run(asr.finish)
+            else:
+                logger.info(f"Transcribing server-captured utterance ({len(audio) / 16000:.2f}s)")
+                result = await transcribe_array(audio, trace)
+                transcription_text = result["text"]
+        logger.info(f"VAD transcription result: '{transcription_text[:50]}...'")
+        
+        await send({
+            "status": "transcription",
+            "text": transcription_text,
+            "transcription_id": transcription_id,
+            "models": models_in_use()
+        })
+        
+        if model_status["llm"].failed:
+            return
+        
+        entry = new_result_entry(trace)
+        results_store[transcription_id] = entry
+        start_turn(transcription_id, transcription_text, True, session_id, LIVE, deadline, turn_group)
+        
+        async for event, data in result_events(entry):
+            await send({"status": event, "transcription_id": transcription_id, **data})
+    except asyncio.CancelledError:
+        raise
+    except (QueueFullError, ModelUnavailableError, OverloadedError, DeadlineExceeded) as e:
+        logger.warning(f"Rejecting VAD utterance: {str(e)}")
+        record_drop(e)
+        await send({"status": "error", "error": str(e), "retry_after": retry_after_seconds(e)})
+    except Exception as e:
+        logger.error(f"VAD utterance error: {str(e)}")
+        import traceback
+        logger.error(f"VAD utterance traceback: {traceback.format_exc()}")
+        await send({"status": "error", "error": str(e)})
+
 @app.websocket("/vad-stream/")
 async def vad_stream(websocket: WebSocket):
     await websocket.accept()
-    logger.info("VAD WebSocket connection established")
+    # ?capture=1: the server keeps the utterance audio and runs the whole turn itself
+    # instead of the browser re-uploading it to /process-vad-audio/
+    capture = websocket.query_params.get("capture") in ("1", "true")
+    # Partial transcripts while the user is still speaking (server capture only)
+    partials = capture and config.get("vad_partial_transcripts", True)
+    # New speech cancels this session's answer that is still generating or playing
+    barge_in = config.get("barge_in", True)
+    # Conversation history for the LLM, only when the client opts in with its own ID (it survives reconnects)
+    session_id = websocket.query_params.get("session_id") or None
+    connection_id = uuid.uuid4().hex[:8]
+    # Barge-in and cancel stop this connection's turns, or the session's if there is one
+    turn_group = session_id or f"vad-stream-{connection_id}"
+    logger.info(f"VAD WebSocket connection {connection_id} established (server capture: {capture})")
+    ACTIVE_WEBSOCKETS.inc()
+    frames_in_window = 0
+    window_started = time.perf_counter()
+    
+    # Speech-state messages and utterance results are sent from different tasks
+    send_lock = asyncio.Lock()
+    
+    async def send(payload: dict):
+        async with send_lock:
+            await websocket.send_json(payload)
+    
+    utterance_tasks = set()
+    vad = None
     
     try:
-        # Buffer to accumulate audio data
-        audio_buffer = []
-        speech_detected = False
+        try:
+            await wait_for_model("vad")
+        except ModelUnavailableError as e:
+            logger.warning(f"VAD stream without a VAD model: {str(e)}")
+        # Per-connection VAD keeps Silero's recurrent state and a ring buffer of recent audio,
+        # so each incoming frame is scored once instead of re-scanning the whole window;
+        # with the batcher, windows from all connections share one forward pass
+        if model_status["vad"].ready:
+            vad = StreamingVAD(vad_model, batcher=vad_batcher)
+        recorder = UtteranceRecorder(vad) if vad is not None and capture else None
+        asr = None
+        partial_task = None
         
-        # Keep track of consecutive speech/non-speech frames for debouncing
-        consecutive_speech_frames = 0
-        consecutive_silence_frames = 0
+        def track(task):
+            utterance_tasks.add(task)
+            task.add_done_callback(utterance_tasks.discard)
+            return task
+        
+        def start_utterance():
+            nonlocal asr
+            pre_roll = recorder.start()
+            if partials:
+                asr = LocalAgreementTranscriber(whisper_words)
+                asr.insert_audio(pre_roll)
+        
+        def finish_utterance():
+            nonlocal asr, partial_task
+            audio = recorder.finish()
+            utterance_asr, pending, asr, partial_task = asr, partial_task, None, None
+            if audio is None:
+                logger.info("Captured utterance too short, ignoring")
+                return
+            track(asyncio.create_task(handle_vad_utterance(send, audio, session_id, utterance_asr, pending, turn_group)))
         
         while True:
-            # Receive audio chunk
-            data = await websocket.receive_text()
+            # Receive audio chunk: binary frames (int16/float32 PCM with a small header),
+            # or base64 float32 text from older clients
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            data = message.get("text")
+            frame = message.get("bytes")
             
             # Skip empty data or client closing messages
-            if not data or data == "close":
+            if data == "close" or (not data and not frame):
                 break
+            if data == "cancel":
+                cancel_session_turn(turn_group, "cancelled by the client")
+                continue
+            
+            VAD_FRAMES.inc()
+            frames_in_window += 1
+            now = time.perf_counter()
+            if now - window_started >= 1.0:
+                VAD_FRAME_RATE.set(round(frames_in_window / (now - window_started), 2), connection=connection_id)
+                frames_in_window, window_started = 0, now
             
-            # Decode base64 audio data
             try:
-                audio_data = base64.b64decode(data.split(',')[1] if ',' in data else data)
-                audio_np = np.frombuffer(audio_data, dtype=np.float32)
+                if frame is not None:
+                    audio_np = decode_audio_frame(frame)
+                else:
+                    # Decode base64 audio data
+                    audio_data = base64.b64decode(data.split(',')[1] if ',' in data else data)
+                    audio_np = np.frombuffer(audio_data, dtype=np.float32)
+                
+                if vad is None:
+                    continue
+                
+                if vad.batcher is not None:
+                    speech_state = await vad.process_chunk_batched(audio_np)
+                else:
+                    speech_state = vad.process_chunk(audio_np)
+                
+                if recorder is not None:
+                    if recorder.active:
+                        recorder.append(audio_np)
+                        if asr is not None:
+                            asr.insert_audio(audio_np)
+                            # At most one partial decode in flight per utterance, and none while
+                            # finished utterances are waiting to be transcribed
+                            if asr.ready() and (partial_task is None or partial_task.done()) and not admission["transcribe"].waiting:
+                                partial_task = track(asyncio.create_task(decode_partial_transcript(send, asr)))
+                    if speech_state is True:
+                        # Pre-roll from the ring buffer already includes this chunk
+                        start_utterance()
+                    elif speech_state is False:
+                        finish_utterance()
+                    elif recorder.active and recorder.full:
+                        logger.info(f"Utterance reached {recorder.duration:.1f}s, transcribing")
+                        finish_utterance()
+                        recorder.resume()
+                        if partials:
+                            asr = LocalAgreementTranscriber(whisper_words)
                 
-                # Add chunk to buffer
-                audio_buffer.append(audio_np)
+                if speech_state is True and barge_in:
+                    # The user started talking over the answer
+                    cancel_session_turn(turn_group, "barge-in")
                 
-                # Process with VAD if we have enough data
-                if len(audio_buffer) >= 3:
-                    combined_audio = np.concatenate(audio_buffer)
-                    
-                    # Process with Silero VAD
-                    if vad_model is not None and vad_get_speech_timestamps is not None:
-                        # Lower threshold for initial detection to be more sensitive (0.65 → 0.5)
-                        # Maintain moderate threshold for ongoing speech (0.4)
-                        threshold = 0.4 if speech_detected else 0.65
-                        
-                        speech_timestamps = vad_get_speech_timestamps(
-                            combined_audio, 
-                            vad_model,
-                            threshold=threshold,
-                            sampling_rate=16000,
-                            min_speech_duration_ms=100,  # Keep this low to catch short speech segments
-                            min_silence_duration_ms=150, # Reduced from 400ms to 150ms for faster speech end detection
-                            speech_pad_ms=50,  # Reduced from 70ms to 50ms
-                            return_seconds=True
-                        )
-                        
-                        # Determine if speech is present in the audio
-                        raw_speech_detected = len(speech_timestamps) > 0
-                        
-                        # Implement debouncing to prevent rapid switching
-                        if raw_speech_detected:
-                            consecutive_speech_frames += 1
-                            consecutive_silence_frames = 0
-                        else:
-                            consecutive_silence_frames += 1
-                            consecutive_speech_frames = 0
-                        
-                        # Apply debouncing logic: require fewer consecutive frames to start (2 instead of 3)
-                        if not speech_detected and consecutive_speech_frames >= 2:
-                            speech_detected = True
-                            await websocket.send_json({
-                                "status": "speech_state",
-                                "speech_detected": True
-                            })
-                        elif speech_detected and consecutive_silence_frames >= 1: # Reduced from 2 to 1 for faster end detection
-                            speech_detected = False
-                            await websocket.send_json({
-                                "status": "speech_state",
-                                "speech_detected": False
-                            })
-                    
-                    # Keep more frames in buffer for context
-                    if len(audio_buffer) > 15:  # Increased from 10 to 15
-                        audio_buffer = audio_buffer[-5:]  # Keep more chunks (3 → 5) for better context
+                if speech_state is not None:
+                    await send({
+                        "status": "speech_state",
+                        "speech_detected": speech_state
+                    })
             
             except Exception as e:
                 logger.error(f"Error processing audio chunk: {str(e)}")
@@ -533,73 +1816,133 @@ async def vad_stream(websocket: WebSocket):
     except Exception as e:
         logger.error(f"WebSocket error: {str(e)}")
     finally:
-        logger.info("VAD WebSocket connection closed")
+        for task in utterance_tasks:
+            task.cancel()
+        if vad is not None:
+            vad.close()
+        ACTIVE_WEBSOCKETS.dec()
+        VAD_FRAME_RATE.remove(connection=connection_id)
+        logger.info(f"VAD WebSocket connection {connection_id} closed")
 
 @app.post("/process-vad-audio/")
-async def process_vad_audio(file: UploadFile = File(...)):
+async def process_vad_audio(file: UploadFile = File(...), session_id: str = Form(None)):
     """Process audio captured using VAD"""
     # This is similar to the transcribe_audio endpoint but specifically for VAD-captured audio
-    with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file.filename)[1]) as temp_file:
-        # Write the uploaded file content to the temporary file
+    transcription_id = str(uuid.uuid4())
+    trace = TurnTrace(transcription_id)
+    with trace.span("upload_read"):
         content = await file.read()
-        temp_file.write(content)
-        temp_file.flush()
+    
+    deadline = turn_deadline(LIVE)
+    
+    try:
+        admission["llm"].check(LIVE)
+        
+        # Transcribe the audio using MLX Whisper with the specified model
+        logger.info(f"Transcribing VAD-captured audio: {file.filename} ({len(content)} bytes)")
+        
+        async with admission["transcribe"].admit(LIVE, deadline, trace):
+            result = await transcribe_upload(content, file.filename, file.content_type, trace)
+        
+        transcription_text = result["text"]
+        logger.info(f"VAD transcription result: '{transcription_text[:50]}...'")
+        
+        response_data = {
+            "text": transcription_text,
+            "transcription_id": transcription_id,
+            "status": "success",
+            "models": models_in_use()
+        }
+        
+        # Always use LLM and TTS if available
+        if not model_status["llm"].failed:
+            results_store[transcription_id] = new_result_entry(trace)
+            # Create a task to process LLM response and TTS in the background
+            start_turn(transcription_id, transcription_text, True, session_id, LIVE, deadline)
         
+        return response_data
+    except (QueueFullError, ModelUnavailableError, OverloadedError, DeadlineExceeded) as e:
+        logger.warning(f"Rejecting VAD transcription: {str(e)}")
+        return rejection_response(e)
+    except Exception as e:
+        logger.error(f"VAD transcription error: {str(e)}")
+        import traceback
+        logger.error(f"VAD transcription traceback: {traceback.format_exc()}")
+        return {
+            "error": str(e),
+            "status": "error"
+        }
+
+@app.get("/knowledge/")
+async def list_knowledge():
+    """List knowledge-base documents with index size and build/query latency"""
+    documents = await asyncio.to_thread(knowledge_base.list_documents)
+    return {"documents": documents, "stats": knowledge_base.stats()}
+
+@app.post("/knowledge/")
+async def add_knowledge(file: UploadFile = File(None), text: str = Form(None), name: str = Form(None)):
+    """Add a text or Markdown document (file upload or text field); a document with the same name is replaced"""
+    if file is not None:
         try:
-            # Transcribe the audio using MLX Whisper with the specified model
-            logger.info(f"Transcribing VAD-captured audio: {temp_file.name}")
-            
-            result = mlx_whisper.transcribe(
-                temp_file.name,
-                path_or_hf_repo=WHISPER_MODEL,
-            )
-            
-            # Clean up the temporary file
-            os.unlink(temp_file.name)
-            
-            transcription_text = result["text"]
-            logger.info(f"VAD transcription result: '{transcription_text[:50]}...'")
-            
-            # Store transcription in a temporary location with unique ID for later retrieval
-            transcription_id = str(uuid.uuid4())
-            
-            response_data = {
-                "text": transcription_text,
-                "transcription_id": transcription_id,
-                "status": "success",
-                "models": {
-                    "whisper": WHISPER_MODEL,
-                    "llm": LLM_MODEL if LLM_AVAILABLE else None,
-                    "tts": "mlx-community/Kokoro-82M-4bit" if TTS_AVAILABLE else None
-                }
-            }
-            
-            # Always use LLM and TTS if available
-            if LLM_AVAILABLE:
-                # Create a task to process LLM response and TTS in the background
-                asyncio.create_task(process_llm_and_tts(transcription_id, transcription_text, True))
-            
-            return response_data
-        except Exception as e:
-            # Clean up the temporary file in case of error
-            os.unlink(temp_file.name)
-            logger.error(f"VAD transcription error: {str(e)}")
-            import traceback
-            logger.error(f"VAD transcription traceback: {traceback.format_exc()}")
-            return {
-                "error": str(e),
-                "status": "error"
-            }
+            text = (await file.read()).decode("utf-8")
+        except UnicodeDecodeError:
+            return JSONResponse({"error": "Documents must be UTF-8 text", "status": "error"}, status_code=400)
+        name = name or file.filename
+    if not text or not text.strip():
+        return JSONResponse({"error": "Pass a file or text", "status": "error"}, status_code=400)
+    document = await asyncio.to_thread(knowledge_base.add_document, name or "untitled", text)
+    # Cached answers may have been given without this document. They no longer match
+    # anyway (the index version is in the key); this frees them in this worker
+    answer_cache.invalidate()
+    return {"status": "success", "document": document, "stats": knowledge_base.stats()}
+
+@app.delete("/knowledge/{doc_id}")
+async def delete_knowledge(doc_id: str):
+    if not await asyncio.to_thread(knowledge_base.remove_document, doc_id):
+        return JSONResponse({"error": "Document not found", "status": "error"}, status_code=404)
+    answer_cache.invalidate()
+    return {"status": "success", "stats": knowledge_base.stats()}
+
+@app.get("/knowledge/search")
+async def search_knowledge(q: str, k: int = 3):
+    """The passages a turn asking q would get"""
+    passages = await asyncio.to_thread(knowledge_base.search, q, k, config.get("knowledge_min_score", 0.0))
+    return {"passages": passages, "query_ms": knowledge_base.last_query_ms}
 
 # Add configuration endpoints
 @app.get("/config/")
 async def get_config():
-    """Get the current configuration"""
-    return config
+    """Get the current configuration, plus the upload formats this server decodes without ffmpeg"""
+    reload_config_if_changed()
+    return {**config, "upload_formats": UPLOAD_FORMATS}
 
 @app.post("/config/")
-async def update_config(system_prompt: str = Form(...)):
-    """Update the configuration"""
-    config["system_prompt"] = system_prompt
+async def update_config(
+    system_prompt: str = Form(None),
+    whisper_model: str = Form(None),
+    whisper_small_model: str = Form(None),
+    llm_model: str = Form(None),
+    tts_model: str = Form(None),
+):
+    """Update the configuration; model changes load in the background and take over once ready"""
+    # Start from the latest file so changes saved by other workers are not overwritten
+    reload_config_if_changed()
+    for kind, model_id in (("whisper", whisper_model), ("llm", llm_model), ("tts", tts_model)):
+        if model_id and model_id != model_status[kind].model_id:
+            config[f"{kind}_model"] = model_id
+            model_switches[kind] = model_id
+            asyncio.create_task(apply_model_switch(kind, model_id))
+    if whisper_small_model is not None:
+        # An empty value turns duration-based routing off; the small model loads on first use
+        config["whisper_small_model"] = whisper_small_model or None
+    changed = system_prompt is not None and system_prompt != config.get("system_prompt")
+    if system_prompt is not None:
+        config["system_prompt"] = system_prompt
     save_config(config)
-    return {"status": "success", "config": config}
\ No newline at end of file
+    if changed:
+        # Cached answers were written for the old prompt
+        answer_cache.invalidate()
+    if changed and prompt_caches is not None:
+        # Re-prefill the system prompt now rather than on the next turn
+        asyncio.create_task(rebuild_prompt_cache())
+    return {"status": "success", "config": config, "switching": dict(model_switches)}
\ No newline at end of file
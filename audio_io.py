@@ -0,0 +1,335 @@
+import io
+import struct
+
+import numpy as np
+
+from opus_io import decode_compressed
+
+# Whisper and Silero both expect 16 kHz mono float32
+WHISPER_SAMPLE_RATE = 16000
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# numpy dtypes and full-scale values for raw PCM encodings
+PCM_ENCODINGS = {
+    "s16le": ("<i2", 32768.0),
+    "s16be": (">i2", 32768.0),
+    "s32le": ("<i4", 2147483648.0),
+    "f32le": ("<f4", None),
+}
+
+
+def pcm_to_float32(payload, encoding: str, channels: int = 1):
+    """Convert raw interleaved PCM bytes to mono float32 samples in [-1, 1]"""
+    dtype, scale = PCM_ENCODINGS[encoding]
+    itemsize = np.dtype(dtype).itemsize
+    # Ignore a trailing partial frame instead of failing on it
+    usable = len(payload) - len(payload) % (itemsize * channels)
+    samples = np.frombuffer(payload, dtype=dtype, count=usable // itemsize)
+    if scale is None:
+        audio = samples.astype(np.float32)
+    else:
+        audio = samples.astype(np.float32) / np.float32(scale)
+    if channels > 1:
+        audio = audio.reshape(-1, channels).mean(axis=1, dtype=np.float32)
+    return audio
+
+
+def _wav_samples_to_float32(payload, format_tag: int, bits: int, channels: int):
+    if format_tag == WAVE_FORMAT_PCM:
+        if bits == 16:
+            return pcm_to_float32(payload, "s16le", channels)
+        if bits == 32:
+            return pcm_to_float32(payload, "s32le", channels)
+        if bits == 8:
+            # 8-bit WAV is unsigned with a 128 offset
+            usable = len(payload) - len(payload) % channels
+            audio = (np.frombuffer(payload, dtype=np.uint8, count=usable).astype(np.float32) - 128.0) / 128.0
+        elif bits == 24:
+            usable = len(payload) - len(payload) % (3 * channels)
+            raw = np.frombuffer(payload, dtype=np.uint8, count=usable).reshape(-1, 3).astype(np.int32)
+            ints = raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)
+            ints = np.where(ints & 0x800000, ints - 0x1000000, ints)
+            audio = ints.astype(np.float32) / np.float32(8388608.0)
+        else:
+            return None
+    elif format_tag == WAVE_FORMAT_IEEE_FLOAT:
+        if bits == 32:
+            return pcm_to_float32(payload, "f32le", channels)
+        if bits == 64:
+            usable = len(payload) - len(payload) % (8 * channels)
+            audio = np.frombuffer(payload, dtype="<f8", count=usable // 8).astype(np.float32)
+        else:
+            return None
+    else:
+        return None
+
+    if channels > 1:
+        audio = audio.reshape(-1, channels).mean(axis=1, dtype=np.float32)
+    return audio
+
+
+def parse_wav(data: bytes):
+    """Parse an in-memory RIFF/WAVE file.
+
+    Returns (mono float32 samples, sample rate), or None if the bytes are not a
+    WAV this parser understands (compressed codecs, missing chunks, ...).
+    """
+    if len(data) < 12 or data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        return None
+
+    view = memoryview(data)
+    fmt = None
+    pos = 12
+    while pos + 8 <= len(data):
+        chunk_id = bytes(view[pos:pos + 4])
+        size = struct.unpack_from("<I", data, pos + 4)[0]
+        body = pos + 8
+
+        if chunk_id == b"fmt ":
+            if size < 16:
+                return None
+            format_tag, channels, sample_rate, _, _, bits = struct.unpack_from("<HHIIHH", data, body)
+            if format_tag == WAVE_FORMAT_EXTENSIBLE and size >= 26:
+                # The real format is the first two bytes of the SubFormat GUID
+                format_tag = struct.unpack_from("<H", data, body + 24)[0]
+            fmt = (format_tag, channels, sample_rate, bits)
+        elif chunk_id == b"data":
+            if fmt is None:
+                return None
+            format_tag, channels, sample_rate, bits = fmt
+            if channels < 1 or sample_rate < 1:
+                return None
+            # Streaming writers leave the size as 0 or 0xFFFFFFFF; read to the end then
+            end = len(data) if size in (0, 0xFFFFFFFF) else min(body + size, len(data))
+            audio = _wav_samples_to_float32(view[body:end], format_tag, bits, channels)
+            if audio is None:
+                return None
+            return audio, sample_rate
+
+        # Chunks are word aligned
+        pos = body + size + (size & 1)
+
+    return None
+
+
+def parse_pcm_content_type(content_type: str):
+    """Parse a raw PCM media type into (encoding, sample_rate, channels).
+
+    Understands ``audio/pcm;rate=16000;encoding=s16le;channels=1`` and the
+    RFC 2586 form ``audio/L16;rate=16000`` (big-endian). Returns None for
+    anything else.
+    """
+    if not content_type:
+        return None
+
+    parts = [part.strip() for part in content_type.split(";")]
+    media_type = parts[0].lower()
+    params = {}
+    for part in parts[1:]:
+        if "=" in part:
+            key, value = part.split("=", 1)
+            params[key.strip().lower()] = value.strip().lower()
+
+    if media_type == "audio/pcm":
+        encoding = params.get("encoding", "s16le")
+    elif media_type == "audio/l16":
+        encoding = "s16be"
+    else:
+        return None
+
+    if encoding not in PCM_ENCODINGS or "rate" not in params:
+        return None
+    try:
+        return encoding, int(params["rate"]), int(params.get("channels", 1))
+    except ValueError:
+        return None
+
+
+# Binary /vad-stream/ frames: an 8-byte little-endian header followed by mono PCM.
+#   u8 sample format, u8 protocol version, u16 reserved, u32 sample rate (0 = 16 kHz)
+FRAME_HEADER = struct.Struct("<BBHI")
+FRAME_VERSION = 1
+FRAME_FORMAT_INT16 = 1
+FRAME_FORMAT_FLOAT32 = 2
+
+
+def decode_audio_frame(frame: bytes, target_sr: int = WHISPER_SAMPLE_RATE):
+    """Decode one binary audio frame to float32 samples at target_sr.
+
+    float32 payloads at the target rate are returned as a read-only view of the
+    frame without copying. Raises ValueError for malformed frames.
+    """
+    if len(frame) < FRAME_HEADER.size:
+        raise ValueError("Audio frame is shorter than its header")
+    sample_format, version, _, sample_rate = FRAME_HEADER.unpack_from(frame)
+    if version != FRAME_VERSION:
+        raise ValueError(f"Unsupported audio frame version {version}")
+
+    payload_size = len(frame) - FRAME_HEADER.size
+    if sample_format == FRAME_FORMAT_INT16:
+        samples = np.frombuffer(frame, dtype="<i2", count=payload_size // 2, offset=FRAME_HEADER.size)
+        audio = samples.astype(np.float32) / np.float32(32768.0)
+    elif sample_format == FRAME_FORMAT_FLOAT32:
+        audio = np.frombuffer(frame, dtype="<f4", count=payload_size // 4, offset=FRAME_HEADER.size)
+    else:
+        raise ValueError(f"Unknown audio frame format {sample_format}")
+
+    if sample_rate and sample_rate != target_sr:
+        # Browsers may ignore the requested AudioContext rate; resample per frame
+        audio = resample(audio, sample_rate, target_sr)
+    return audio
+
+
+def encode_audio_frame(audio: np.ndarray, sample_format: int = FRAME_FORMAT_INT16, sample_rate: int = WHISPER_SAMPLE_RATE):
+    """Build a binary audio frame (used by benchmarks and Python clients)"""
+    if sample_format == FRAME_FORMAT_INT16:
+        payload = (np.clip(audio, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+    else:
+        payload = np.asarray(audio, dtype="<f4").tobytes()
+    return FRAME_HEADER.pack(sample_format, FRAME_VERSION, 0, sample_rate) + payload
+
+
+def _lowpass_taps(cutoff: float, num_taps: int = 63):
+    """Hamming-windowed sinc low-pass FIR; cutoff is in cycles per sample"""
+    n = np.arange(num_taps) - (num_taps - 1) / 2
+    taps = 2 * cutoff * np.sinc(2 * cutoff * n) * np.hamming(num_taps)
+    return (taps / taps.sum()).astype(np.float32)
+
+
+def resample(audio: np.ndarray, orig_sr: int, target_sr: int = WHISPER_SAMPLE_RATE):
+    """Resample mono float32 audio.
+
+    Downsampling applies an anti-aliasing FIR first. Integer ratios (48k/16k)
+    are then a plain stride; anything else uses linear interpolation.
+    """
+    if orig_sr == target_sr or len(audio) == 0:
+        return audio.astype(np.float32, copy=False)
+
+    if orig_sr > target_sr:
+        # Keep a little below Nyquist of the target rate
+        taps = _lowpass_taps(0.45 * target_sr / orig_sr)
+        half = len(taps) // 2
+        if orig_sr % target_sr == 0:
+            # Only evaluate the filter at the samples that survive decimation
+            padded = np.pad(audio.astype(np.float32, copy=False), (half, half))
+            windows = np.lib.stride_tricks.sliding_window_view(padded, len(taps))
+            return windows[::orig_sr // target_sr] @ taps[::-1]
+        audio = np.convolve(audio, taps, mode="same")
+
+    num_out = int(round(len(audio) * target_sr / orig_sr))
+    positions = np.arange(num_out, dtype=np.float64) * (orig_sr / target_sr)
+    return np.interp(positions, np.arange(len(audio)), audio).astype(np.float32)
+
+
+def decode_audio_bytes(data: bytes, content_type: str = None, target_sr: int = WHISPER_SAMPLE_RATE):
+    """Decode an uploaded WAV, raw PCM, Ogg or WebM Opus body straight to mono float32 at target_sr.
+
+    Returns None when the format isn't supported here; callers should fall back
+    to the ffmpeg-backed file path in that case.
+    """
+    pcm_format = parse_pcm_content_type(content_type)
+    if pcm_format is not None:
+        encoding, sample_rate, channels = pcm_format
+        audio = pcm_to_float32(data, encoding, channels)
+    else:
+        parsed = parse_wav(data)
+        if parsed is None:
+            # Opus from MediaRecorder, recognized by its container's magic bytes
+            parsed = decode_compressed(data, target_sr)
+        if parsed is None:
+            return None
+        audio, sample_rate = parsed
+
+    if len(audio) == 0:
+        return None
+    return resample(audio, sample_rate, target_sr)
+
+
+def encode_wav_pcm16(audio: np.ndarray, sample_rate: int):
+    """Encode mono float audio in [-1, 1] as an in-memory 16-bit PCM WAV"""
+    pcm = (np.clip(audio, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+    header = struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 36 + len(pcm), b"WAVE",
+        b"fmt ", 16, WAVE_FORMAT_PCM, 1, sample_rate, sample_rate * 2, 2, 16,
+        b"data", len(pcm),
+    )
+    return header + pcm
+
+
+def _encode_ogg_opus(audio: np.ndarray, sample_rate: int):
+    import soundfile as sf
+
+    buffer = io.BytesIO()
+    sf.write(buffer, np.clip(audio, -1.0, 1.0), sample_rate, format="OGG", subtype="OPUS")
+    return buffer.getvalue()
+
+
+def _opus_available():
+    try:
+        import soundfile as sf
+
+        return "OPUS" in sf.available_subtypes("OGG")
+    except Exception:
+        return False
+
+
+# Formats /audio/ can serve: name -> (media type, encoder). Opus needs libsndfile >= 1.0.29
+AUDIO_FORMATS = {"wav": ("audio/wav", encode_wav_pcm16)}
+if _opus_available():
+    AUDIO_FORMATS["opus"] = ("audio/ogg; codecs=opus", _encode_ogg_opus)
+
+# Upload formats the browser may choose from (GET /config/ lists them). Everything here
+# decodes in decode_audio_bytes without ffmpeg: 16-bit PCM WAV, and Opus in WebM or Ogg
+UPLOAD_FORMATS = ["pcm16"] + (["webm-opus", "ogg-opus"] if "opus" in AUDIO_FORMATS else [])
+
+# Accept media types -> format, in our order of preference when the client weighs them equally
+ACCEPT_MEDIA_TYPES = {
+    "audio/ogg": "opus",
+    "audio/opus": "opus",
+    "audio/wav": "wav",
+    "audio/wave": "wav",
+    "audio/x-wav": "wav",
+}
+
+
+def negotiate_audio_format(accept: str, default: str = "wav"):
+    """Pick a format from AUDIO_FORMATS for an Accept header (q-values honoured).
+
+    Wildcards and a missing header get default, so plain <audio> elements and
+    old clients keep receiving WAV. Returns None when nothing acceptable is
+    available.
+    """
+    if default not in AUDIO_FORMATS:
+        default = "wav"
+    if not accept:
+        return default
+    best = None
+    for position, item in enumerate(accept.split(",")):
+        parts = [part.strip() for part in item.split(";")]
+        media_type = parts[0].lower()
+        q = 1.0
+        for part in parts[1:]:
+            if part.lower().startswith("q="):
+                try:
+                    q = float(part[2:])
+                except ValueError:
+                    q = 0.0
+        if q <= 0:
+            continue
+        if media_type in ("*/*", "audio/*"):
+            candidate = default
+            # A wildcard is weaker than an explicit type with the same q
+            specificity = 0
+        else:
+            candidate = ACCEPT_MEDIA_TYPES.get(media_type)
+            specificity = 1
+        if candidate is None or candidate not in AUDIO_FORMATS:
+            continue
+        rank = (q, specificity, -position)
+        if best is None or rank > best[0]:
+            best = (rank, candidate)
+    return best[1] if best is not None else None
@@ -0,0 +1,463 @@
+"""Offline batch jobs: run archived recordings through Whisper -> LLM -> TTS.
+
+A job reads a JSONL manifest with one clip per line:
+
+    {"id": "call-0001", "audio": "recordings/call-0001.wav"}
+    {"id": "faq-17", "text": "What time do you open?"}
+
+"audio" paths are relative to the manifest; "text" skips Whisper. Results are
+appended to the output JSONL as each clip finishes, and clips that already
+succeeded in the output are skipped, so an interrupted job resumes where it
+stopped (failed clips are retried and get a new line). Run it from the command line:
+
+    python batch_jobs.py manifest.jsonl --output results.jsonl
+
+or through POST /jobs on a running server.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import soundfile as sf
+
+from admission import BATCH, OverloadedError
+from audio_io import WHISPER_SAMPLE_RATE, decode_audio_bytes, resample
+from inference import QueueFullError
+
+logger = logging.getLogger("mlx-whisper-tts")
+
+# Whisper decodes 30 s windows; shorter clips can share one batched decode
+WHISPER_WINDOW_SECONDS = 30.0
+
+# Batched results that look like a failed greedy decode are re-run through transcribe(),
+# which retries with temperature fallback (same thresholds as mlx_whisper)
+COMPRESSION_RATIO_THRESHOLD = 2.4
+LOGPROB_THRESHOLD = -1.0
+NO_SPEECH_THRESHOLD = 0.6
+
+
+def resolve_under(root: str, path: str, base: str = None):
+    """Real path of path, relative to base (default: root).
+
+    Raises ValueError if path is absolute or resolves outside root, following
+    ".." and symlinks, so server callers can't reach arbitrary files.
+    """
+    if os.path.isabs(path) or path.startswith("~"):
+        raise ValueError(f"Path must be relative to the jobs directory: {path}")
+    root = os.path.realpath(root)
+    resolved = os.path.realpath(os.path.join(base or root, path))
+    if os.path.commonpath([root, resolved]) != root:
+        raise ValueError(f"Path is outside the jobs directory: {path}")
+    return resolved
+
+
+def read_manifest(path: str, root: str = None):
+    """Parse the manifest into a list of items with an id and an audio path or text.
+
+    With a root, audio paths must stay inside that directory.
+    """
+    base = os.path.dirname(os.path.abspath(path))
+    items = []
+    with open(path, "r") as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            item["id"] = str(item.get("id", line_number))
+            if item.get("audio") and root is not None:
+                try:
+                    item["audio"] = resolve_under(root, item["audio"], base)
+                except ValueError as e:
+                    raise ValueError(f"{path}:{line_number}: {e}") from None
+            elif item.get("audio"):
+                item["audio"] = os.path.join(base, os.path.expanduser(item["audio"]))
+            elif not item.get("text"):
+                raise ValueError(f"{path}:{line_number}: needs \"audio\" or \"text\"")
+            items.append(item)
+    return items
+
+
+def completed_ids(output_path: str):
+    """IDs that already succeeded in the output; failed clips and a truncated last line are retried"""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, "r") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if "error" not in record:
+                done.add(str(record["id"]))
+    return done
+
+
+def probe_duration(path: str):
+    """Duration in seconds from the file header, or None if soundfile can't read it"""
+    try:
+        return sf.info(path).duration
+    except Exception:
+        return None
+
+
+def load_clip(path: str):
+    """Decode a clip to 16 kHz mono float32; None means only ffmpeg (Whisper's file path) can"""
+    with open(path, "rb") as f:
+        content = f.read()
+    audio = decode_audio_bytes(content)
+    if audio is not None:
+        return audio
+    try:
+        # FLAC, OGG and friends
+        data, sample_rate = sf.read(path, dtype="float32", always_2d=True)
+    except Exception:
+        return None
+    return resample(data.mean(axis=1, dtype=np.float32), sample_rate)
+
+
+def whisper_batch_decoder(mlx_whisper_module, model_path: str, activate):
+    """Return a blocking fn(list of arrays) -> list of texts that decodes clips in one batch.
+
+    Uses mlx_whisper's decoder directly, since transcribe() handles one clip at
+    a time; activate(model_path) makes the registry's model current first.
+    Returns None when the Whisper in use (the model server proxy or a stand-in)
+    has no batched decoder.
+    """
+    if getattr(mlx_whisper_module, "__name__", None) != "mlx_whisper":
+        return None
+    try:
+        import mlx.core as mx
+        from mlx_whisper.audio import N_FRAMES, log_mel_spectrogram, pad_or_trim
+        from mlx_whisper.decoding import DecodingOptions
+        from mlx_whisper.transcribe import ModelHolder
+    except ImportError:
+        return None
+
+    def decode_batch(clips):
+        activate(model_path)
+        model = ModelHolder.get_model(model_path, mx.float16)
+        mels = [
+            pad_or_trim(log_mel_spectrogram(clip, n_mels=model.dims.n_mels), N_FRAMES, axis=-2)
+            for clip in clips
+        ]
+        results = model.decode(mx.stack(mels).astype(mx.float16), DecodingOptions(temperature=0.0, without_timestamps=True))
+        texts = []
+        for clip, result in zip(clips, results):
+            if result.no_speech_prob > NO_SPEECH_THRESHOLD and result.avg_logprob < LOGPROB_THRESHOLD:
+                texts.append("")
+            elif result.compression_ratio > COMPRESSION_RATIO_THRESHOLD or result.avg_logprob < LOGPROB_THRESHOLD:
+                texts.append(mlx_whisper_module.transcribe(clip, path_or_hf_repo=model_path)["text"])
+            else:
+                texts.append(result.text)
+        return texts
+
+    return decode_batch
+
+
+def safe_filename(item_id: str):
+    return re.sub(r"[^\w.-]", "_", item_id)[:100] or "clip"
+
+
+class BatchJob:
+    """Progress and settings of one batch run"""
+
+    def __init__(self, manifest: str, output: str = None, llm: bool = True, tts: bool = True, root: str = None):
+        self.id = uuid.uuid4().hex[:12]
+        self.manifest = manifest
+        # Directory the manifest's audio must stay in (jobs started over HTTP)
+        self.root = root
+        self.output = output or os.path.splitext(manifest)[0] + ".results.jsonl"
+        self.audio_folder = os.path.splitext(self.output)[0] + "_audio"
+        self.llm = llm
+        self.tts = tts and llm
+        self.status = "queued"
+        self.error = None
+        self.total = 0
+        self.skipped = 0
+        self.completed = 0
+        self.failed = 0
+        self.audio_seconds = 0.0
+        self.whisper_batches = 0
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.task = None
+
+    def to_dict(self):
+        elapsed = (self.finished or time.time()) - self.started if self.started else 0.0
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "error": self.error,
+            "manifest": self.manifest,
+            "output": self.output,
+            "llm": self.llm,
+            "tts": self.tts,
+            "total": self.total,
+            "skipped": self.skipped,
+            "completed": self.completed,
+            "failed": self.failed,
+            "remaining": max(0, self.total - self.skipped - self.completed - self.failed),
+            "audio_seconds": round(self.audio_seconds, 1),
+            "whisper_batches": self.whisper_batches,
+            "elapsed_seconds": round(elapsed, 1),
+            "clips_per_second": round((self.completed + self.failed) / elapsed, 2) if elapsed else 0.0,
+        }
+
+
+async def retry_busy(fn, *args, **kwargs):
+    """Await fn, backing off while a model worker's queue is full of live requests"""
+    delay = 0.05
+    while True:
+        try:
+            return await fn(*args, **kwargs)
+        except QueueFullError:
+            await asyncio.sleep(delay)
+            delay = min(2 * delay, 2.0)
+
+
+async def admitted(pipeline, stage: str, fn, *args, **kwargs):
+    """Await fn holding a slot of the app's admission gate for stage, at batch priority.
+
+    Live turns and uploads are admitted first and may push a waiting clip out
+    of a full queue; the clip then backs off and tries again instead of failing.
+    """
+    delay = 0.05
+    while True:
+        try:
+            async with pipeline.admission[stage].admit(BATCH):
+                return await retry_busy(fn, *args, **kwargs)
+        except OverloadedError:
+            await asyncio.sleep(delay)
+            delay = min(2 * delay, 2.0)
+
+
+async def run_job(job: BatchJob):
+    """Run a job to completion against the models loaded in the app module"""
+    import app as pipeline
+
+    job.status = "running"
+    job.started = time.time()
+    config = pipeline.config
+    decode_workers = config.get("batch_decode_workers", 4)
+    batch_size = config.get("batch_whisper_batch_size", 8)
+    llm_concurrency = config.get("batch_llm_concurrency", config.get("llm_max_batch_size", 8))
+    decode_pool = ThreadPoolExecutor(max_workers=decode_workers, thread_name_prefix="batch-decode")
+    loop = asyncio.get_running_loop()
+    output = None
+    answer_tasks = set()
+    try:
+        items = read_manifest(job.manifest, job.root)
+        job.total = len(items)
+        done = completed_ids(job.output)
+        pending = [item for item in items if item["id"] not in done]
+        job.skipped = job.total - len(pending)
+        if job.skipped:
+            logger.info(f"Job {job.id}: resuming, {job.skipped} of {job.total} clips already in {job.output}")
+        if job.tts:
+            os.makedirs(job.audio_folder, exist_ok=True)
+        output = open(job.output, "a")
+        write_lock = asyncio.Lock()
+
+        async def write_result(record: dict):
+            async with write_lock:
+                # One line per clip, flushed right away so it counts as a checkpoint
+                output.write(json.dumps(record) + "\n")
+                output.flush()
+
+        # Sort by duration so each Whisper batch holds clips of similar length,
+        # which also keeps their decoder passes a similar number of tokens
+        audio_items = [item for item in pending if item.get("audio")]
+        durations = await asyncio.gather(*[
+            loop.run_in_executor(decode_pool, probe_duration, item["audio"]) for item in audio_items
+        ])
+        for item, duration in zip(audio_items, durations):
+            item["duration"] = duration
+        audio_items.sort(key=lambda item: (item["duration"] is None, item["duration"] or 0.0))
+        text_items = [item for item in pending if not item.get("audio")]
+
+        decode_batch = None
+        if audio_items:
+            await pipeline.wait_for_model("whisper")
+            # Offline jobs favour accuracy: always the active (large) model, no duration routing
+            whisper_model = pipeline.model_status["whisper"].model_id
+            decode_batch = whisper_batch_decoder(pipeline.mlx_whisper, whisper_model, pipeline.activate_whisper)
+        answer_slots = asyncio.Semaphore(llm_concurrency)
+
+        async def answer(item: dict, transcription: str, timings: dict):
+            record = {"id": item["id"], "audio": item.get("audio"), "duration": item.get("duration"), "transcription": transcription}
+            try:
+                if job.llm and transcription.strip():
+                    started = time.perf_counter()
+                    record["llm_response"] = await answer_question(pipeline, transcription)
+                    timings["llm"] = round(1000 * (time.perf_counter() - started), 1)
+                    if job.tts and record["llm_response"]:
+                        started = time.perf_counter()
+                        record["tts_file"] = await speak_answer(pipeline, job, item["id"], record["llm_response"])
+                        timings["tts"] = round(1000 * (time.perf_counter() - started), 1)
+                record["timings_ms"] = timings
+                job.completed += 1
+            except Exception as e:
+                logger.error(f"Job {job.id}: clip {item['id']} failed: {str(e)}")
+                record["error"] = str(e)
+                job.failed += 1
+            finally:
+                answer_slots.release()
+            await write_result(record)
+
+        async def start_answer(item: dict, transcription: str, timings: dict):
+            # Bounded so LLM requests fill the continuous batch without flooding the queue
+            await answer_slots.acquire()
+            task = asyncio.create_task(answer(item, transcription, timings))
+            answer_tasks.add(task)
+            task.add_done_callback(answer_tasks.discard)
+
+        async def fail(item: dict, error: Exception):
+            logger.error(f"Job {job.id}: clip {item['id']} failed: {str(error)}")
+            job.failed += 1
+            await write_result({"id": item["id"], "audio": item.get("audio"), "error": str(error)})
+
+        async def decode(batch):
+            return await asyncio.gather(*[
+                loop.run_in_executor(decode_pool, load_clip, item["audio"]) for item in batch
+            ], return_exceptions=True)
+
+        batches = [audio_items[i:i + batch_size] for i in range(0, len(audio_items), batch_size)]
+        # Decode the next batch on the worker threads while Whisper runs the current one
+        next_decode = asyncio.create_task(decode(batches[0])) if batches else None
+        for index, batch in enumerate(batches):
+            clips = await next_decode
+            next_decode = asyncio.create_task(decode(batches[index + 1])) if index + 1 < len(batches) else None
+
+            batched, single = [], []
+            for item, clip in zip(batch, clips):
+                if isinstance(clip, Exception):
+                    await fail(item, clip)
+                    continue
+                if clip is not None:
+                    item["duration"] = len(clip) / WHISPER_SAMPLE_RATE
+                    job.audio_seconds += item["duration"]
+                if decode_batch is not None and clip is not None and item["duration"] <= WHISPER_WINDOW_SECONDS:
+                    batched.append((item, clip))
+                else:
+                    single.append((item, clip))
+
+            if batched:
+                started = time.perf_counter()
+                try:
+                    texts = await retry_busy(pipeline.whisper_executor.run, decode_batch, [clip for _, clip in batched])
+                except Exception as e:
+                    logger.warning(f"Job {job.id}: batched decode failed, transcribing one by one: {str(e)}")
+                    single.extend(batched)
+                    batched, texts = [], []
+                job.whisper_batches += 1 if batched else 0
+                elapsed = round(1000 * (time.perf_counter() - started), 1)
+                for (item, _), text in zip(batched, texts):
+                    await start_answer(item, text.strip(), {"whisper_batch": elapsed, "batch_size": len(batched)})
+
+            for item, clip in single:
+                started = time.perf_counter()
+                try:
+                    # Long clips and formats only ffmpeg can read use the regular transcribe()
+                    result = await retry_busy(
+                        pipeline.whisper_executor.run,
+                        pipeline.whisper_transcribe,
+                        item["audio"] if clip is None else clip,
+                        whisper_model,
+                    )
+                except Exception as e:
+                    await fail(item, e)
+                    continue
+                await start_answer(item, result["text"].strip(), {"whisper": round(1000 * (time.perf_counter() - started), 1)})
+
+        for item in text_items:
+            await start_answer(item, item["text"], {})
+        if answer_tasks:
+            await asyncio.gather(*list(answer_tasks))
+        job.status = "done"
+        logger.info(f"Job {job.id} done: {job.completed} completed, {job.failed} failed, {job.skipped} skipped")
+    except asyncio.CancelledError:
+        job.status = "cancelled"
+        raise
+    except Exception as e:
+        job.status = "failed"
+        job.error = str(e)
+        logger.error(f"Job {job.id} failed: {str(e)}")
+        logger.error(f"Traceback: {traceback.format_exc()}")
+    finally:
+        job.finished = time.time()
+        for task in answer_tasks:
+            task.cancel()
+        await asyncio.gather(*list(answer_tasks), return_exceptions=True)
+        decode_pool.shutdown(wait=False, cancel_futures=True)
+        if output is not None:
+            output.close()
+
+
+async def answer_question(pipeline, question: str):
+    """First line of the LLM answer, sharing the live answer cache"""
+    system_prompt = pipeline.config.get("system_prompt", "You are a helpful AI assistant.")
+    model_id = pipeline.model_status["llm"].model_id
+    context = pipeline.answer_cache_context()
+    cached = pipeline.answer_cache.get(question, system_prompt, model_id, context)
+    if cached is not None:
+        return cached
+
+    async def generate():
+        response = ""
+        async for segment in pipeline.stream_llm_response(question):
+            response += segment
+        return response.strip()
+
+    response = await admitted(pipeline, "llm", generate)
+    if response:
+        pipeline.answer_cache.put(question, system_prompt, model_id, response, context)
+    return response
+
+
+async def speak_answer(pipeline, job: BatchJob, item_id: str, text: str):
+    """Synthesize the answer (through the TTS cache) into the job's audio folder"""
+    audio = await admitted(pipeline, "tts", pipeline.cached_speech, text)
+    if audio is None:
+        raise ValueError("No audio segments generated")
+    path = os.path.join(job.audio_folder, f"{safe_filename(item_id)}.wav")
+    await asyncio.to_thread(sf.write, path, audio, pipeline.TTS_SAMPLE_RATE)
+    return path
+
+
+async def main(args):
+    import app as pipeline
+
+    job = BatchJob(args.manifest, args.output, llm=not args.no_llm, tts=not args.no_tts)
+    await pipeline.load_models()
+    task = asyncio.create_task(run_job(job))
+    while not task.done():
+        await asyncio.wait({task}, timeout=args.progress_seconds)
+        progress = job.to_dict()
+        logger.info(
+            f"{progress['completed'] + progress['failed']}/{progress['total'] - progress['skipped']} clips "
+            f"({progress['failed']} failed, {progress['clips_per_second']} clips/s)"
+        )
+    await task
+    print(json.dumps(job.to_dict(), indent=2))
+    return 0 if job.status == "done" else 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a JSONL manifest of recordings through Whisper, the LLM and TTS")
+    parser.add_argument("manifest", help="JSONL with one {\"id\", \"audio\" or \"text\"} object per line")
+    parser.add_argument("--output", help="results JSONL, appended to and resumed from (default: <manifest>.results.jsonl)")
+    parser.add_argument("--no-llm", action="store_true", help="transcribe only")
+    parser.add_argument("--no-tts", action="store_true", help="skip speech synthesis of the answers")
+    parser.add_argument("--progress-seconds", type=float, default=10.0)
+    raise SystemExit(asyncio.run(main(parser.parse_args())))
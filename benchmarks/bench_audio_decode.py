@@ -0,0 +1,167 @@
+"""Compare upload formats: bytes per second of audio and decode time, in memory vs. temp file + ffmpeg.
+
+The old /transcribe/ and /process-vad-audio/ handlers wrote every upload to a
+temporary file and let Whisper decode it with an ffmpeg subprocess (the same
+command mlx_whisper.audio.load_audio runs). This times that path against
+audio_io.decode_audio_bytes for each format the browser can upload: 16-bit PCM
+WAV at 16 kHz, Opus in WebM (Chrome's MediaRecorder) and in Ogg (Firefox's),
+plus the 32-bit float and 48 kHz WAVs older clients sent.
+
+    python benchmarks/bench_audio_decode.py [--repeat 20] [--seconds 2 5 15]
+"""
+import argparse
+import io
+import os
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import soundfile as sf
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_io import UPLOAD_FORMATS, WHISPER_SAMPLE_RATE, decode_audio_bytes  # noqa: E402
+from opus_io import OGG_PAGE_HEADER, opus_packet_samples  # noqa: E402
+
+
+def make_signal(seconds: float, sample_rate: int):
+    """Speech-like test signal: a few harmonics with a slow amplitude envelope"""
+    rng = np.random.default_rng(0)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    signal = sum(np.sin(2 * np.pi * f * t) / (i + 1) for i, f in enumerate((180, 360, 720, 1440)))
+    signal *= 0.5 + 0.5 * np.sin(2 * np.pi * 3 * t)
+    signal = 0.2 * signal + 0.01 * rng.standard_normal(len(t))
+    return signal.astype(np.float32)
+
+
+def make_wav(seconds: float, sample_rate: int, subtype: str):
+    buffer = io.BytesIO()
+    sf.write(buffer, make_signal(seconds, sample_rate), sample_rate, subtype=subtype, format="WAV")
+    return buffer.getvalue()
+
+
+def make_ogg_opus(seconds: float, sample_rate: int = 48000):
+    """Ogg Opus as Firefox's MediaRecorder uploads it"""
+    buffer = io.BytesIO()
+    sf.write(buffer, make_signal(seconds, sample_rate), sample_rate, format="OGG", subtype="OPUS")
+    return buffer.getvalue()
+
+
+def ogg_packets(data: bytes):
+    """Split an Ogg stream into its packets"""
+    packets, partial, pos = [], b"", 0
+    while pos + OGG_PAGE_HEADER.size <= len(data):
+        *_, segments = OGG_PAGE_HEADER.unpack_from(data, pos)
+        lacing = data[pos + OGG_PAGE_HEADER.size:pos + OGG_PAGE_HEADER.size + segments]
+        pos += OGG_PAGE_HEADER.size + segments
+        for size in lacing:
+            partial += data[pos:pos + size]
+            pos += size
+            if size < 255:
+                packets.append(partial)
+                partial = b""
+    return packets
+
+
+def _ebml(element_id: int, payload: bytes, unknown_size: bool = False):
+    id_bytes = element_id.to_bytes((element_id.bit_length() + 7) // 8, "big")
+    if unknown_size:
+        return id_bytes + b"\x01\xff\xff\xff\xff\xff\xff\xff" + payload
+    return id_bytes + (len(payload) | (1 << 56)).to_bytes(8, "big") + payload
+
+
+def _uint(value: int):
+    return value.to_bytes(max(1, (value.bit_length() + 7) // 8), "big")
+
+
+def make_webm_opus(seconds: float, cluster_ms: int = 5000):
+    """WebM Opus laid out like Chrome's MediaRecorder output: unknown-size Segment and Clusters of SimpleBlocks"""
+    head, _, *packets = ogg_packets(make_ogg_opus(seconds))
+    header = _ebml(0x1A45DFA3, _ebml(0x4282, b"webm") + _ebml(0x4287, _uint(4)) + _ebml(0x4285, _uint(2)))
+    audio = _ebml(0xB5, struct.pack(">d", 48000.0)) + _ebml(0x9F, _uint(1))
+    track = _ebml(0xAE, _ebml(0xD7, _uint(1)) + _ebml(0x83, _uint(2)) + _ebml(0x86, b"A_OPUS") + _ebml(0x63A2, head) + _ebml(0xE1, audio))
+    body = _ebml(0x1549A966, _ebml(0x2AD7B1, _uint(1_000_000))) + _ebml(0x1654AE6B, track)
+
+    clusters, cluster, cluster_start, elapsed_ms = [], b"", 0, 0.0
+    for packet in packets:
+        if elapsed_ms - cluster_start >= cluster_ms:
+            clusters.append(_ebml(0x1F43B675, _ebml(0xE7, _uint(cluster_start)) + cluster, unknown_size=True))
+            cluster, cluster_start = b"", int(elapsed_ms)
+        block = b"\x81" + struct.pack(">h", int(elapsed_ms) - cluster_start) + b"\x80" + packet
+        cluster += _ebml(0xA3, block)
+        elapsed_ms += 1000 * opus_packet_samples(packet) / 48000
+    clusters.append(_ebml(0x1F43B675, _ebml(0xE7, _uint(cluster_start)) + cluster, unknown_size=True))
+    return header + _ebml(0x18538067, body + b"".join(clusters), unknown_size=True)
+
+
+def ffmpeg_file_path(content: bytes):
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".bin") as temp_file:
+        temp_file.write(content)
+    try:
+        cmd = [
+            "ffmpeg", "-nostdin", "-threads", "0", "-i", temp_file.name,
+            "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", "16000", "-",
+        ]
+        out = subprocess.run(cmd, capture_output=True, check=True).stdout
+        return np.frombuffer(out, np.int16).astype(np.float32) / 32768.0
+    finally:
+        os.unlink(temp_file.name)
+
+
+def in_memory(content: bytes):
+    audio = decode_audio_bytes(content)
+    if audio is None:
+        raise ValueError("Upload format not decoded in memory")
+    return audio
+
+
+def time_ms(fn, content: bytes, repeat: int):
+    fn(content)  # warm up
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(content)
+        samples.append((time.perf_counter() - start) * 1000)
+    return float(np.median(samples))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seconds", type=float, nargs="+", default=[2.0, 5.0, 15.0])
+    args = parser.parse_args()
+
+    paths = [("in-memory", in_memory)]
+    if shutil.which("ffmpeg"):
+        paths.insert(0, ("tempfile+ffmpeg", ffmpeg_file_path))
+    else:
+        print("ffmpeg not found; only timing the in-memory path\n")
+
+    formats = [
+        ("wav float32 16k", lambda seconds: make_wav(seconds, 16000, "FLOAT")),
+        ("wav pcm16 48k", lambda seconds: make_wav(seconds, 48000, "PCM_16")),
+        ("pcm16", lambda seconds: make_wav(seconds, WHISPER_SAMPLE_RATE, "PCM_16")),
+    ]
+    if "webm-opus" in UPLOAD_FORMATS:
+        formats.append(("webm-opus", make_webm_opus))
+        formats.append(("ogg-opus", make_ogg_opus))
+    else:
+        print("libsndfile has no Opus support; skipping the Opus formats\n")
+
+    print(f"{'format':<18}{'audio':>7}{'bytes':>10}{'bytes/s':>10}" + "".join(f"{name + ' ms/s':>22}" for name, _ in paths))
+    for label, make in formats:
+        for seconds in args.seconds:
+            content = make(seconds)
+            timings = [time_ms(fn, content, args.repeat) / seconds for _, fn in paths]
+            print(
+                f"{label:<18}{seconds:>6g}s{len(content):>10}{len(content) / seconds:>10.0f}"
+                + "".join(f"{ms:>19.3f} ms" for ms in timings)
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,495 @@
+"""End-to-end latency benchmark of the voice pipeline with stand-in models.
+
+Drives the real FastAPI app in-process over ASGI (no sockets, no MLX):
+
+  upload      POST /transcribe/ then GET /stream_response/{id} (SSE)
+  vad_upload  POST /process-vad-audio/ then GET /stream_response/{id} (SSE)
+  vad_stream  /vad-stream/?capture=1 with binary PCM frames; server-side
+              endpointing, partial transcripts and the turn over the socket
+  llm_tts     process_llm_and_tts directly on the reference transcript
+
+Whisper, the LLM, Kokoro and Silero are replaced by the deterministic CPU
+stand-ins in benchmarks/stand_ins.py with configurable latency. Per-stage
+p50/p95/p99, time to first token (TTFT), time to first audio (TTFA) and
+throughput are reported for each concurrency level and written as JSON.
+Pass --compare with an earlier result file to see regressions.
+
+    python benchmarks/bench_pipeline.py [--concurrency 1,2,4,8] [--requests 16]
+        [--scenarios upload,vad_stream] [--llm-batching] [--no-vad-batching]
+        [--compare OLD.json]
+"""
+import argparse
+import asyncio
+import dataclasses
+import io
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+import numpy as np
+import soundfile as sf
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from audio_io import FRAME_FORMAT_INT16, WHISPER_SAMPLE_RATE, encode_audio_frame  # noqa: E402
+from stand_ins import StandInLatency, install  # noqa: E402
+
+SCENARIOS = ("upload", "vad_upload", "vad_stream", "llm_tts")
+STAGES = ("transcribe", "first_token", "first_audio", "llm_done", "total")
+FRAME_SAMPLES = 2048
+
+
+# --- Test audio -------------------------------------------------------------
+
+def load_sample_audio(seconds: float):
+    """First seconds of the bundled audio.mp4 at 16 kHz, or None if it can't be decoded here"""
+    path = os.path.join(REPO_ROOT, "audio.mp4")
+    try:
+        import av
+    except ImportError:
+        return None
+    try:
+        with av.open(path) as container:
+            resampler = av.AudioResampler(format="flt", layout="mono", rate=WHISPER_SAMPLE_RATE)
+            chunks = []
+            total = 0
+            for frame in container.decode(audio=0):
+                for resampled in resampler.resample(frame):
+                    samples = resampled.to_ndarray().reshape(-1)
+                    chunks.append(samples)
+                    total += len(samples)
+                if total >= seconds * WHISPER_SAMPLE_RATE:
+                    break
+        return np.concatenate(chunks)[:int(seconds * WHISPER_SAMPLE_RATE)].astype(np.float32)
+    except Exception:
+        return None
+
+
+def synthetic_speech(seconds: float, seed: int = 0):
+    """Speech-like signal: harmonics under a syllable-rate envelope"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * WHISPER_SAMPLE_RATE)) / WHISPER_SAMPLE_RATE
+    signal = sum(np.sin(2 * np.pi * f * t) / (i + 1) for i, f in enumerate((150, 300, 600, 1200)))
+    envelope = 0.6 + 0.4 * np.sin(2 * np.pi * 4 * t)
+    return (0.15 * signal * envelope + 0.01 * rng.standard_normal(len(t))).astype(np.float32)
+
+
+def wav_bytes(audio: np.ndarray):
+    buffer = io.BytesIO()
+    sf.write(buffer, audio, WHISPER_SAMPLE_RATE, subtype="PCM_16", format="WAV")
+    return buffer.getvalue()
+
+
+# --- Minimal in-process ASGI client -----------------------------------------
+
+async def asgi_lifespan(app, event: str):
+    queue = asyncio.Queue()
+    done = asyncio.Event()
+    await queue.put({"type": f"lifespan.{event}"})
+
+    async def receive():
+        return await queue.get()
+
+    async def send(message):
+        if message["type"].startswith(f"lifespan.{event}."):
+            done.set()
+
+    task = asyncio.create_task(app({"type": "lifespan", "asgi": {"version": "3.0"}, "state": {}}, receive, send))
+    await done.wait()
+    return task
+
+
+async def asgi_request(app, method: str, path: str, body: bytes = b"", headers=(), on_chunk=None):
+    """Send one HTTP request; on_chunk(bytes) is called for each body chunk as it is sent"""
+    path, _, query = path.partition("?")
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "headers": [(k.lower().encode(), v.encode()) for k, v in headers],
+        "client": ("127.0.0.1", 50000),
+        "server": ("testserver", 80),
+    }
+    sent = False
+    finished = asyncio.Event()
+    status = None
+    chunks = []
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await finished.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            chunk = message.get("body", b"")
+            if chunk:
+                chunks.append(chunk)
+                if on_chunk is not None:
+                    on_chunk(chunk)
+            if not message.get("more_body", False):
+                finished.set()
+
+    await app(scope, receive, send)
+    finished.set()
+    return status, b"".join(chunks)
+
+
+def multipart(fields: dict, filename: str, content: bytes, content_type: str = "audio/wav"):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    parts.append(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        f"Content-Type: {content_type}\r\n\r\n".encode() + content + b"\r\n"
+    )
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+class ASGIWebSocket:
+    """Client side of one ASGI WebSocket connection"""
+
+    def __init__(self, app, path: str):
+        path, _, query = path.partition("?")
+        self.scope = {
+            "type": "websocket",
+            "asgi": {"version": "3.0"},
+            "scheme": "ws",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": query.encode(),
+            "headers": [],
+            "client": ("127.0.0.1", 50000),
+            "server": ("testserver", 80),
+            "subprotocols": [],
+        }
+        self.app = app
+        self._to_app = asyncio.Queue()
+        self.messages = asyncio.Queue()
+        self._accepted = asyncio.Event()
+
+    async def connect(self):
+        await self._to_app.put({"type": "websocket.connect"})
+        self.task = asyncio.create_task(self.app(self.scope, self._to_app.get, self._send))
+        await self._accepted.wait()
+
+    async def _send(self, message):
+        if message["type"] == "websocket.accept":
+            self._accepted.set()
+        elif message["type"] == "websocket.send":
+            await self.messages.put((time.perf_counter(), json.loads(message.get("text") or message["bytes"])))
+
+    async def send_bytes(self, data: bytes):
+        await self._to_app.put({"type": "websocket.receive", "bytes": data})
+
+    async def close(self):
+        await self._to_app.put({"type": "websocket.disconnect", "code": 1000})
+        try:
+            await asyncio.wait_for(self.task, 5)
+        except asyncio.TimeoutError:
+            self.task.cancel()
+
+
+# --- Scenarios ----------------------------------------------------------------
+
+def record(times: dict, stage: str, started: float, now: float = None):
+    if stage not in times:
+        times[stage] = 1000 * ((now or time.perf_counter()) - started)
+
+
+def apply_result_event(times: dict, started: float, event: str, data: dict, now: float = None):
+    if event == "token":
+        record(times, "first_token", started, now)
+    elif event == "audio":
+        record(times, "first_audio", started, now)
+    elif event == "llm_done":
+        record(times, "llm_done", started, now)
+    elif event == "done":
+        record(times, "total", started, now)
+    elif event == "error":
+        raise RuntimeError(data.get("error"))
+
+
+async def stream_result(app, transcription_id: str, times: dict, started: float):
+    """Follow /stream_response/ and time each event as it arrives"""
+    buffer = b""
+
+    def on_chunk(chunk):
+        nonlocal buffer
+        now = time.perf_counter()
+        buffer += chunk
+        while b"\n\n" in buffer:
+            raw, buffer = buffer.split(b"\n\n", 1)
+            lines = dict(line.split(": ", 1) for line in raw.decode().splitlines() if ": " in line)
+            apply_result_event(times, started, lines.get("event"), json.loads(lines.get("data", "{}")), now)
+
+    status, _ = await asgi_request(app, "GET", f"/stream_response/{transcription_id}", on_chunk=on_chunk)
+    if status != 200:
+        raise RuntimeError(f"/stream_response/ returned {status}")
+
+
+async def run_upload(app, audio_wav: bytes, endpoint: str):
+    times = {}
+    started = time.perf_counter()
+    body, content_type = multipart({"session_id": uuid.uuid4().hex}, "recording.wav", audio_wav)
+    status, response = await asgi_request(app, "POST", endpoint, body, [("content-type", content_type)])
+    result = json.loads(response)
+    if status != 200 or result.get("status") != "success":
+        raise RuntimeError(f"{endpoint} returned {status}: {result.get('error')}")
+    record(times, "transcribe", started)
+    await stream_result(app, result["transcription_id"], times, started)
+    return times
+
+
+async def run_vad_stream(app, speech: np.ndarray, realtime: bool):
+    """Stream silence + speech + silence; stages are timed from the end of speech"""
+    silence = np.zeros(int(0.5 * WHISPER_SAMPLE_RATE), dtype=np.float32)
+    trailing = np.zeros(int(1.0 * WHISPER_SAMPLE_RATE), dtype=np.float32)
+    socket = ASGIWebSocket(app, f"/vad-stream/?capture=1&session_id={uuid.uuid4().hex}")
+    await socket.connect()
+
+    times = {}
+    started = None
+    try:
+        for part, is_trailing in ((silence, False), (speech, False), (trailing, True)):
+            for i in range(0, len(part), FRAME_SAMPLES):
+                if is_trailing and started is None:
+                    started = time.perf_counter()
+                await socket.send_bytes(encode_audio_frame(part[i:i + FRAME_SAMPLES], FRAME_FORMAT_INT16))
+                await asyncio.sleep(FRAME_SAMPLES / WHISPER_SAMPLE_RATE if realtime else 0)
+
+        while "total" not in times:
+            now, message = await asyncio.wait_for(socket.messages.get(), 60)
+            status = message.get("status")
+            if status == "transcription":
+                record(times, "transcribe", started, now)
+            elif status in ("token", "audio", "llm_done", "done", "error"):
+                apply_result_event(times, started, status, message, now)
+    finally:
+        await socket.close()
+    return times
+
+
+async def run_llm_tts(app_module, text: str):
+    times = {}
+    started = time.perf_counter()
+    transcription_id = str(uuid.uuid4())
+    entry = app_module.new_result_entry()
+    app_module.results_store[transcription_id] = entry
+    task = asyncio.create_task(app_module.process_llm_and_tts(transcription_id, text, True))
+    async for event, data in app_module.result_events(entry):
+        apply_result_event(times, started, event, data)
+    await task
+    return times
+
+
+# --- Reporting ----------------------------------------------------------------
+
+def summarize(samples):
+    values = np.asarray(samples, dtype=np.float64)
+    return {
+        "count": len(values),
+        "mean": round(float(values.mean()), 2),
+        "p50": round(float(np.percentile(values, 50)), 2),
+        "p95": round(float(np.percentile(values, 95)), 2),
+        "p99": round(float(np.percentile(values, 99)), 2),
+        "max": round(float(values.max()), 2),
+    }
+
+
+async def run_level(app, scenario: str, concurrency: int, requests: int, make_request):
+    durations = {stage: [] for stage in STAGES}
+    errors = []
+    remaining = list(range(requests))
+
+    async def worker():
+        while remaining:
+            remaining.pop()
+            try:
+                times = await make_request()
+            except Exception as e:
+                errors.append(str(e))
+                continue
+            for stage, ms in times.items():
+                durations[stage].append(ms)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - started
+    completed = requests - len(errors)
+    return {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": len(errors),
+        "error_samples": sorted(set(errors))[:3],
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(completed / wall, 3) if wall else 0.0,
+        "stages_ms": {stage: summarize(values) for stage, values in durations.items() if values},
+    }
+
+
+def print_results(results, previous=None):
+    baseline = {}
+    for result in (previous or {}).get("results", []):
+        baseline[(result["scenario"], result["concurrency"])] = result
+
+    print(f"{'scenario':<12}{'conc':>5}{'rps':>8}{'err':>5}  {'stage':<12}{'p50':>9}{'p95':>9}{'p99':>9}{'Δp50':>9}")
+    for result in results:
+        old = baseline.get((result["scenario"], result["concurrency"]), {}).get("stages_ms", {})
+        if not result["stages_ms"]:
+            print(f"{result['scenario']:<12}{result['concurrency']:>5}{'-':>8}{result['errors']:>5}  {result['error_samples']}")
+            continue
+        first = True
+        for stage, stats in result["stages_ms"].items():
+            head = (
+                f"{result['scenario']:<12}{result['concurrency']:>5}{result['throughput_rps']:>8.2f}{result['errors']:>5}"
+                if first else " " * 30
+            )
+            delta = ""
+            if stage in old and old[stage]["p50"]:
+                delta = f"{100 * (stats['p50'] - old[stage]['p50']) / old[stage]['p50']:+.0f}%"
+            print(f"{head}  {stage:<12}{stats['p50']:>9.1f}{stats['p95']:>9.1f}{stats['p99']:>9.1f}{delta:>9}")
+            first = False
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+async def main_async(args):
+    latency = StandInLatency(**{
+        field.name: getattr(args, field.name) for field in dataclasses.fields(StandInLatency)
+    })
+    with open(os.path.join(REPO_ROOT, "audio.txt")) as f:
+        reference_text = f.read()
+
+    speech = None if args.audio == "synthetic" else load_sample_audio(args.utterance_seconds)
+    audio_source = "audio.mp4" if speech is not None else "synthetic"
+    if speech is None:
+        speech = synthetic_speech(args.utterance_seconds)
+    speech_wav = wav_bytes(speech)
+
+    # app.py reads config.json and mounts static/ relative to the working directory
+    os.chdir(REPO_ROOT)
+    import app as app_module
+
+    if not args.verbose:
+        logging.getLogger("mlx-whisper-tts").setLevel(logging.WARNING)
+    install(app_module, latency, reference_text, llm_batching=args.llm_batching)
+
+    # Keep benchmark audio out of ~/.mlx_audio/outputs and don't let caches answer repeated requests
+    output_folder = tempfile.mkdtemp(prefix="bench_pipeline_")
+    app_module.OUTPUT_FOLDER = output_folder
+    if not args.caches:
+        app_module.answer_cache = app_module.AnswerCache(max_entries=0)
+        app_module.tts_cache = app_module.TTSCache(output_folder, app_module.TTS_SAMPLE_RATE, max_entries=0)
+    else:
+        app_module.tts_cache = app_module.TTSCache(output_folder, app_module.TTS_SAMPLE_RATE)
+    app_module.config["tts_playback"] = "browser"
+    app_module.config["vad_batching"] = not args.no_vad_batching
+
+    app = app_module.app
+    lifespan = await asgi_lifespan(app, "startup")
+    startup = time.perf_counter()
+    await asyncio.gather(*(state.wait(60) for state in app_module.model_status.values()))
+    print(f"Stand-in models ready in {1000 * (time.perf_counter() - startup):.0f} ms; audio: {audio_source}, {args.utterance_seconds}s utterance")
+
+    transcript = app_module.mlx_whisper.transcribe(speech)["text"].strip()
+    makers = {
+        "upload": lambda: run_upload(app, speech_wav, "/transcribe/"),
+        "vad_upload": lambda: run_upload(app, speech_wav, "/process-vad-audio/"),
+        "vad_stream": lambda: run_vad_stream(app, speech, args.realtime),
+        "llm_tts": lambda: run_llm_tts(app_module, transcript),
+    }
+
+    results = []
+    for scenario in args.scenarios:
+        for concurrency in args.concurrency:
+            results.append(await run_level(app, scenario, concurrency, max(args.requests, concurrency), makers[scenario]))
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+    print_results(results, previous)
+
+    report = {
+        "run": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "audio": audio_source,
+            "utterance_seconds": args.utterance_seconds,
+            "llm_batching": args.llm_batching,
+            "vad_batching": not args.no_vad_batching,
+            "caches": args.caches,
+            "latency": dataclasses.asdict(latency),
+        },
+        "results": results,
+        "inference": [executor.stats() for executor in (app_module.whisper_executor, app_module.llm_executor, app_module.tts_executor, app_module.vad_executor)],
+        "vad_batching": app_module.vad_batcher.stats() if app_module.vad_batcher is not None else None,
+    }
+    output = args.output or os.path.join(
+        REPO_ROOT, "benchmarks", "results", f"pipeline-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+    lifespan.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", type=lambda s: s.split(","), default=list(SCENARIOS))
+    parser.add_argument("--concurrency", type=lambda s: [int(n) for n in s.split(",")], default=[1, 2, 4, 8])
+    parser.add_argument("--requests", type=int, default=16, help="requests per concurrency level")
+    parser.add_argument("--audio", choices=("sample", "synthetic"), default="sample")
+    parser.add_argument("--utterance-seconds", type=float, default=4.0)
+    parser.add_argument("--realtime", action="store_true", help="pace /vad-stream/ frames at real time")
+    parser.add_argument("--llm-batching", action="store_true", help="route LLM requests through LLMScheduler")
+    parser.add_argument("--no-vad-batching", action="store_true", help="score each /vad-stream/ connection on its own")
+    parser.add_argument("--caches", action="store_true", help="keep the answer and TTS caches enabled")
+    parser.add_argument("--output", help="JSON results path (default: benchmarks/results/pipeline-<time>.json)")
+    parser.add_argument("--compare", help="earlier JSON results to diff p50s against")
+    parser.add_argument("--verbose", action="store_true", help="keep the app's INFO logging")
+    for field in dataclasses.fields(StandInLatency):
+        parser.add_argument(f"--{field.name.replace('_', '-')}", type=float, default=field.default)
+    args = parser.parse_args()
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
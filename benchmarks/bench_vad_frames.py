@@ -0,0 +1,61 @@
+"""Compare base64 text frames against binary PCM frames on /vad-stream/.
+
+Times the server-side decode of one 2048-sample chunk (what the browser's
+ScriptProcessor delivers) for the legacy base64 float32 text message and for
+binary int16/float32 frames, and reports bytes on the wire per chunk.
+
+    python benchmarks/bench_vad_frames.py [--iterations 20000]
+"""
+import argparse
+import base64
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_io import FRAME_FORMAT_FLOAT32, FRAME_FORMAT_INT16, decode_audio_frame, encode_audio_frame  # noqa: E402
+
+CHUNK_SAMPLES = 2048
+
+
+def decode_base64_text(data: str):
+    # What vad_stream did for every message before binary frames
+    audio_data = base64.b64decode(data.split(',')[1] if ',' in data else data)
+    return np.frombuffer(audio_data, dtype=np.float32)
+
+
+def time_us(fn, message, iterations: int):
+    for _ in range(100):
+        fn(message)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn(message)
+    return (time.perf_counter() - start) * 1e6 / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    chunk = (0.1 * rng.standard_normal(CHUNK_SAMPLES)).astype(np.float32)
+
+    cases = [
+        ("base64 float32 text", base64.b64encode(chunk.tobytes()).decode("ascii"), decode_base64_text),
+        ("binary int16", encode_audio_frame(chunk, FRAME_FORMAT_INT16), decode_audio_frame),
+        ("binary float32", encode_audio_frame(chunk, FRAME_FORMAT_FLOAT32), decode_audio_frame),
+    ]
+
+    chunk_seconds = CHUNK_SAMPLES / 16000
+    print(f"{'frame':<22}{'bytes/chunk':>12}{'kbit/s':>10}{'decode us':>12}")
+    for label, message, fn in cases:
+        size = len(message)
+        print(f"{label:<22}{size:>12}{size * 8 / chunk_seconds / 1000:>10.1f}{time_us(fn, message, args.iterations):>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,350 @@
+"""Deterministic CPU stand-ins for the app's models, with configurable latency.
+
+install(app_module, latency) swaps the model loaders in app.py for loaders that
+return these stand-ins. Startup, readiness, warm-up and every request handler
+then run unchanged. Latencies are simulated with sleeps on the same executor
+threads the real models use, so queueing and overlap behave as they would
+with the real models. No MLX, no Apple Silicon and no downloads are needed.
+"""
+import hashlib
+import threading
+import time
+from dataclasses import dataclass
+
+import numpy as np
+
+REFERENCE_WORDS_PER_SECOND = 2.6
+
+CANNED_ANSWERS = [
+    "We are open from 11 AM to 5 PM, Monday to Friday. Is there anything else I can help you with today?",
+    "That is a great question. The short answer is to listen first and then ask what led them to that conclusion.",
+    "Sure. Start with one simple habit, practice it every day for a week, and then add the next one.",
+]
+
+
+@dataclass
+class StandInLatency:
+    """Simulated model cost; rtf values are seconds of compute per second of audio"""
+    whisper_base_ms: float = 40.0
+    whisper_rtf: float = 0.03
+    llm_prefill_ms: float = 60.0
+    llm_token_ms: float = 12.0
+    # Extra cost per additional sequence in a batched decode step (0.1 = +10%)
+    llm_batch_overhead: float = 0.1
+    tts_base_ms: float = 15.0
+    tts_rtf: float = 0.05
+    vad_window_ms: float = 0.0
+
+
+def _sleep_ms(ms: float):
+    if ms > 0:
+        time.sleep(ms / 1000)
+
+
+class StandInWhisper:
+    """Replaces the mlx_whisper module: transcribe() returns reference text sized to the audio"""
+
+    def __init__(self, latency: StandInLatency, reference_text: str):
+        self.latency = latency
+        self.words = reference_text.split() or ["hello"]
+        self.calls = 0
+
+    def transcribe(self, audio, path_or_hf_repo=None, word_timestamps=False, initial_prompt=None, **kwargs):
+        self.calls += 1
+        if isinstance(audio, str):
+            import soundfile as sf
+            duration = sf.info(audio).duration
+        else:
+            duration = len(audio) / 16000
+        _sleep_ms(self.latency.whisper_base_ms + 1000 * self.latency.whisper_rtf * duration)
+
+        count = max(1, int(round(duration * REFERENCE_WORDS_PER_SECOND))) if duration >= 0.3 else 0
+        words = [self.words[i % len(self.words)] for i in range(count)]
+        segment = {"start": 0.0, "end": duration, "text": " " + " ".join(words)}
+        if word_timestamps:
+            step = duration / max(count, 1)
+            segment["words"] = [
+                {"word": " " + word, "start": i * step, "end": (i + 1) * step}
+                for i, word in enumerate(words)
+            ]
+        return {"text": segment["text"], "segments": [segment] if words else [], "language": "en"}
+
+
+class StandInDetokenizer:
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+        self.reset()
+
+    def reset(self):
+        self.text = ""
+        self._pending = ""
+
+    def add_token(self, token):
+        word = self.tokenizer.words[token]
+        self._pending += word if not self.text and not self._pending else " " + word
+
+    def finalize(self):
+        pass
+
+    @property
+    def last_segment(self):
+        segment, self._pending = self._pending, ""
+        self.text += segment
+        return segment
+
+
+class StandInTokenizer:
+    """Word-level tokenizer; id 0 is EOS"""
+
+    eos_token_id = 0
+    eos_token_ids = {0}
+    chat_template = None
+
+    def __init__(self):
+        self.words = ["</s>"]
+        self._ids = {}
+        self._lock = threading.Lock()
+        self.detokenizer = StandInDetokenizer(self)
+
+    def encode(self, text: str):
+        with self._lock:
+            ids = []
+            for word in text.split():
+                if word not in self._ids:
+                    self._ids[word] = len(self.words)
+                    self.words.append(word)
+                ids.append(self._ids[word])
+            return ids
+
+
+class StandInLLM:
+    """Picks a canned answer from a hash of the prompt"""
+
+    def __init__(self, tokenizer: StandInTokenizer):
+        self.tokenizer = tokenizer
+
+    def answer_tokens(self, prompt_tokens):
+        digest = hashlib.sha1(repr(list(prompt_tokens)).encode()).digest()
+        return self.tokenizer.encode(CANNED_ANSWERS[digest[0] % len(CANNED_ANSWERS)])
+
+
+@dataclass
+class StandInGenerationResponse:
+    text: str
+    token: int
+
+
+def make_stream_generate(latency: StandInLatency):
+    """Return a stand-in for mlx_lm.stream_generate"""
+
+    def stream_generate(model, tokenizer, prompt, max_tokens=100, **kwargs):
+        tokens = tokenizer.encode(prompt) if isinstance(prompt, str) else list(prompt)
+        _sleep_ms(latency.llm_prefill_ms)
+        for i, token in enumerate(model.answer_tokens(tokens)[:max_tokens]):
+            if i:
+                _sleep_ms(latency.llm_token_ms)
+            word = tokenizer.words[token]
+            yield StandInGenerationResponse(text=word if i == 0 else " " + word, token=token)
+
+    return stream_generate
+
+
+class StandInPromptCaches:
+    """PromptCacheManager interface without KV caches; sessions keep their history like the real one"""
+
+    def __init__(self, tokenizer: StandInTokenizer, history_turns: int = 6):
+        self.tokenizer = tokenizer
+        self.history_turns = history_turns
+        self._history = {}
+        self._lock = threading.Lock()
+
+    def set_system_prompt(self, system_prompt: str):
+        pass
+
+    def prepare(self, system_prompt: str, question: str, session_id: str = None, reuse_cache: bool = True, augmented_question: str = None):
+        def commit(answer, final_cache=None, keep_cache=True):
+            if session_id:
+                self.record_turn(session_id, question, answer)
+        return self.tokenizer.encode(f"{system_prompt} {augmented_question or question}"), None, commit
+
+    def has_history(self, session_id: str):
+        with self._lock:
+            return bool(self._history.get(session_id))
+
+    def record_turn(self, session_id: str, question: str, answer: str):
+        with self._lock:
+            self._history[session_id] = (self._history.get(session_id, []) + [(question, answer)])[-self.history_turns:]
+
+    def drop_session(self, session_id: str):
+        with self._lock:
+            self._history.pop(session_id, None)
+
+    def stats(self):
+        return {}
+
+
+@dataclass
+class StandInBatchResponse:
+    uid: int
+    token: int
+    finish_reason: str = None
+
+
+class StandInBatchGenerator:
+    """mlx_lm BatchGenerator stand-in: one decode step costs the same for the whole batch
+    plus llm_batch_overhead per extra sequence"""
+
+    latency = StandInLatency()
+
+    def __init__(self, model, stop_tokens=None, completion_batch_size=32, prefill_batch_size=8, **kwargs):
+        self.model = model
+        self._next_uid = 0
+        self._pending = []
+        self._active = {}
+
+    def insert(self, prompts, max_tokens=None):
+        uids = []
+        for i, prompt in enumerate(prompts):
+            limit = max_tokens[i] if isinstance(max_tokens, list) else (max_tokens or 100)
+            answer = self.model.answer_tokens(prompt)[:limit]
+            self._pending.append((self._next_uid, answer))
+            uids.append(self._next_uid)
+            self._next_uid += 1
+        return uids
+
+    def remove(self, uids):
+        for uid in uids:
+            self._active.pop(uid, None)
+        self._pending = [item for item in self._pending if item[0] not in uids]
+
+    def next(self):
+        if self._pending:
+            # New prompts are prefilled together before the next decode step
+            _sleep_ms(self.latency.llm_prefill_ms)
+            for uid, answer in self._pending:
+                self._active[uid] = [answer, 0]
+            self._pending = []
+        if not self._active:
+            return []
+
+        batch = len(self._active)
+        _sleep_ms(self.latency.llm_token_ms * (1 + self.latency.llm_batch_overhead * (batch - 1)))
+        responses = []
+        for uid, state in list(self._active.items()):
+            answer, position = state
+            if position < len(answer):
+                state[1] += 1
+                finish = "length" if state[1] == len(answer) else None
+                responses.append(StandInBatchResponse(uid, answer[position], finish))
+            else:
+                responses.append(StandInBatchResponse(uid, StandInTokenizer.eos_token_id, "stop"))
+            if responses[-1].finish_reason is not None:
+                del self._active[uid]
+        return responses
+
+    def close(self):
+        pass
+
+
+@dataclass
+class StandInSegment:
+    audio: np.ndarray
+
+
+class StandInTTS:
+    """Kokoro stand-in: a tone whose length follows the text, roughly 15 characters per second"""
+
+    sample_rate = 24000
+
+    def __init__(self, latency: StandInLatency):
+        self.latency = latency
+
+    def generate(self, text, voice="af_heart", speed=1.0, lang_code="a", verbose=False, **kwargs):
+        duration = max(0.2, len(text) / 15.0 / speed)
+        _sleep_ms(self.latency.tts_base_ms + 1000 * self.latency.tts_rtf * duration)
+        t = np.arange(int(duration * self.sample_rate)) / self.sample_rate
+        yield StandInSegment(audio=(0.1 * np.sin(2 * np.pi * 220 * t)).astype(np.float32))
+
+
+class StandInVAD:
+    """Energy-based stand-in for Silero VAD with the same call interface.
+
+    Keeps Silero's per-batch recurrent state attributes, so VADBatcher can
+    score several streams in one call; each call costs one window's latency
+    whatever the batch size.
+    """
+
+    def __init__(self, latency: StandInLatency):
+        self.latency = latency
+        self.reset_states()
+
+    def __call__(self, x, sr):
+        import torch
+
+        _sleep_ms(self.latency.vad_window_ms)
+        x = x.float().reshape(-1, x.shape[-1])
+        if self._last_batch_size != x.shape[0]:
+            self.reset_states(x.shape[0])
+        if not len(self._context):
+            self._context = torch.zeros(x.shape[0], 64)
+        rms = torch.sqrt(torch.mean(x ** 2, dim=1))
+        level_db = 20 * np.log10(rms.numpy() + 1e-9)
+        self._context = x[:, -64:]
+        self._last_sr = sr
+        self._last_batch_size = x.shape[0]
+        # About 0.5 at -40 dBFS, saturating within a few dB either side
+        return torch.tensor(1 / (1 + np.exp(-(level_db + 40) / 2))).reshape(-1, 1)
+
+    def reset_states(self, batch_size: int = 1):
+        import torch
+
+        self._state = torch.zeros(2, batch_size, 128)
+        self._context = torch.zeros(0)
+        self._last_sr = 0
+        self._last_batch_size = 0
+
+
+def install(app, latency: StandInLatency, reference_text: str, llm_batching: bool = False):
+    """Point app.py's model loaders at the stand-ins (call before startup)"""
+    import llm_scheduler
+
+    def load_whisper():
+        app.mlx_whisper = StandInWhisper(latency, reference_text)
+        return app.mlx_whisper
+
+    def load_llm(model_id=None):
+        app.tokenizer = StandInTokenizer()
+        app.llm_model = StandInLLM(app.tokenizer)
+        app.stream_generate = make_stream_generate(latency)
+        app.prompt_caches = StandInPromptCaches(app.tokenizer)
+        app.llm_scheduler = None
+        if llm_batching:
+            StandInBatchGenerator.latency = latency
+            llm_scheduler.BatchGenerator = StandInBatchGenerator
+            app.llm_scheduler = llm_scheduler.LLMScheduler(
+                app.llm_model,
+                app.tokenizer,
+                app.llm_executor,
+                app.prompt_caches,
+                max_batch_size=app.config.get("llm_max_batch_size", 8),
+            )
+        if model_id:
+            app.model_status["llm"].model_id = model_id
+        return app.llm_model
+
+    def load_tts(model_id=None):
+        app.tts_model = StandInTTS(latency)
+        # Nothing is played on the benchmark machine
+        app.audio_player = None
+        if model_id:
+            app.model_status["tts"].model_id = model_id
+        return app.tts_model
+
+    def load_vad():
+        app.vad_model = StandInVAD(latency)
+        return app.vad_model
+
+    app.load_whisper = load_whisper
+    app.load_llm = load_llm
+    app.load_tts = load_tts
+    app.load_vad = load_vad
@@ -0,0 +1,157 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger("mlx-whisper-tts")
+
+
+_STREAM_END = object()
+
+
+class QueueFullError(Exception):
+    """Raised when an executor already has max_queue calls waiting"""
+
+
+class InferenceExecutor:
+    """Runs blocking inference for one model on a dedicated worker thread.
+
+    Calls are serialized in submission order. At most ``max_queue`` calls may be
+    waiting behind the running one; further submissions fail fast with
+    QueueFullError instead of piling up. MLX streams are thread-local, so models
+    should also be loaded through the executor that will run them.
+    """
+
+    def __init__(self, name: str, max_queue: int = 8):
+        self.name = name
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"{name}-worker")
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._busy = False
+        self.submitted = 0
+        self.started = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.last_wait = 0.0
+        self.total_run = 0.0
+
+    def _invoke(self, enqueued_at: float, fn, args, kwargs):
+        started = time.perf_counter()
+        wait = started - enqueued_at
+        with self._lock:
+            self._waiting -= 1
+            self._busy = True
+            self.started += 1
+            self.total_wait += wait
+            self.last_wait = wait
+            self.max_wait = max(self.max_wait, wait)
+        ok = False
+        try:
+            result = fn(*args, **kwargs)
+            ok = True
+            return result
+        finally:
+            with self._lock:
+                self._busy = False
+                self.total_run += time.perf_counter() - started
+                if ok:
+                    self.completed += 1
+                else:
+                    self.failed += 1
+
+    def _on_done(self, future):
+        # A call cancelled before it started never reaches _invoke
+        if future.cancelled():
+            with self._lock:
+                self._waiting -= 1
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue fn on the worker thread and return a concurrent.futures.Future"""
+        with self._lock:
+            if self._waiting >= self.max_queue:
+                self.rejected += 1
+                raise QueueFullError(f"{self.name} queue is full ({self._waiting} waiting)")
+            self._waiting += 1
+            self.submitted += 1
+        future = self._pool.submit(self._invoke, time.perf_counter(), fn, args, kwargs)
+        future.add_done_callback(self._on_done)
+        return future
+
+    async def run(self, fn, *args, **kwargs):
+        """Await fn(*args, **kwargs) executed on the worker thread"""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    async def stream(self, gen_fn, *args, **kwargs):
+        """Iterate gen_fn(*args, **kwargs) on the worker thread, yielding items as they are produced.
+
+        The whole iteration holds the worker. Closing this async generator early
+        (break + aclose) stops the underlying generator at its next item.
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        stop = threading.Event()
+
+        def push(item, error=None):
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, (item, error))
+            except RuntimeError:
+                # Event loop already closed; nobody is listening anymore
+                stop.set()
+
+        def drain():
+            iterator = gen_fn(*args, **kwargs)
+            try:
+                for item in iterator:
+                    if stop.is_set():
+                        break
+                    push(item)
+                push(_STREAM_END)
+            except BaseException as e:
+                push(_STREAM_END, e)
+            finally:
+                close = getattr(iterator, "close", None)
+                if close is not None:
+                    close()
+
+        self.submit(drain)
+        try:
+            while True:
+                item, error = await queue.get()
+                if item is _STREAM_END:
+                    if error is not None:
+                        raise error
+                    return
+                yield item
+        finally:
+            stop.set()
+
+    def call(self, fn, *args, **kwargs):
+        """Blocking variant of run() for use outside the event loop (e.g. model loading)"""
+        return self.submit(fn, *args, **kwargs).result()
+
+    def stats(self):
+        """Return queue depth, wait time and throughput counters"""
+        with self._lock:
+            finished = self.completed + self.failed
+            return {
+                "name": self.name,
+                "queue_depth": self._waiting,
+                "max_queue": self.max_queue,
+                "busy": self._busy,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "avg_wait_ms": round(1000 * self.total_wait / self.started, 2) if self.started else 0.0,
+                "max_wait_ms": round(1000 * self.max_wait, 2),
+                "last_wait_ms": round(1000 * self.last_wait, 2),
+                "avg_run_ms": round(1000 * self.total_run / finished, 2) if finished else 0.0,
+            }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
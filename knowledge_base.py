@@ -0,0 +1,220 @@
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+
+logger = logging.getLogger("mlx-whisper-tts")
+
+INDEX_FILE = "index.json"
+
+# Common words that would otherwise match every chunk
+STOPWORDS = frozenset(
+    "a an and are as at be but by can do does for from has have how i if in is it its me my of on or our "
+    "so that the their there these this to was we what when where which who why will with you your".split()
+)
+
+
+def tokenize(text: str):
+    """Lowercased word terms without stopwords"""
+    return [term for term in re.findall(r"[a-z0-9]+", text.lower()) if term not in STOPWORDS]
+
+
+def chunk_text(text: str, max_words: int = 80, overlap_words: int = 20):
+    """Split text into passages of at most max_words, keeping paragraphs together where they fit"""
+    chunks = []
+    current = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        words = paragraph.split()
+        if not words:
+            continue
+        if current and len(current) + len(words) > max_words:
+            chunks.append(" ".join(current))
+            current = []
+        if len(words) <= max_words:
+            current.extend(words)
+            continue
+        # A paragraph longer than a chunk: overlapping windows so no sentence is cut off from its context
+        step = max(1, max_words - overlap_words)
+        for start in range(0, len(words), step):
+            chunks.append(" ".join(words[start:start + max_words]))
+            if start + max_words >= len(words):
+                break
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+
+def format_question(question: str, passages):
+    """The LLM prompt for a turn: retrieved passages first, then the user's question"""
+    if not passages:
+        return question
+    context = "\n".join(f"- {passage['text']}" for passage in passages)
+    return f"Use this information if it is relevant:\n{context}\n\nQuestion: {question}"
+
+
+class KnowledgeBase:
+    """Documents split into passages with an on-disk BM25 inverted index.
+
+    The index (documents, passages and per-term postings) lives in one JSON
+    file under directory and is rebuilt whenever a document is added or
+    removed. search() returns the top-k passages for a question, so each turn
+    only prefills what is relevant instead of the whole knowledge base. The
+    file is reloaded when another process (another web worker) changed it.
+    """
+
+    def __init__(self, directory: str, chunk_words: int = 80, k1: float = 1.5, b: float = 0.75):
+        self.directory = directory
+        self.path = os.path.join(directory, INDEX_FILE)
+        self.chunk_words = chunk_words
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self.documents = {}
+        self.chunks = []
+        self.postings = {}
+        self.avg_length = 0.0
+        self._mtime = None
+        self.build_ms = None
+        self.queries = 0
+        self.total_query_ms = 0.0
+        self.last_query_ms = None
+        self._load()
+
+    def _load(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        self.documents = data["documents"]
+        self.chunks = data["chunks"]
+        self.postings = data["postings"]
+        self.avg_length = data["avg_length"]
+        self.build_ms = data.get("build_ms")
+        self._mtime = mtime
+        logger.info(f"Loaded knowledge base: {len(self.documents)} documents, {len(self.chunks)} passages")
+
+    def _reload_if_changed(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            mtime = None
+        if mtime != self._mtime:
+            if mtime is None:
+                self.documents, self.chunks, self.postings, self.avg_length = {}, [], {}, 0.0
+                self._mtime = None
+            else:
+                self._load()
+
+    def _build(self, documents: dict):
+        """Re-chunk and re-index all documents, then write the index file"""
+        started = time.perf_counter()
+        chunks = []
+        postings = {}
+        for doc_id, document in documents.items():
+            passages = chunk_text(document["text"], self.chunk_words)
+            for text in passages:
+                terms = Counter(tokenize(text))
+                for term, count in terms.items():
+                    postings.setdefault(term, []).append([len(chunks), count])
+                chunks.append({"doc_id": doc_id, "text": text, "length": sum(terms.values())})
+            document["chunks"] = len(passages)
+        avg_length = sum(chunk["length"] for chunk in chunks) / len(chunks) if chunks else 0.0
+        build_ms = round(1000 * (time.perf_counter() - started), 2)
+
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"documents": documents, "chunks": chunks, "postings": postings, "avg_length": avg_length, "build_ms": build_ms}, f)
+        # Readers in other workers never see a half-written index
+        os.replace(tmp_path, self.path)
+
+        self.documents, self.chunks, self.postings, self.avg_length = documents, chunks, postings, avg_length
+        self.build_ms = build_ms
+        self._mtime = os.path.getmtime(self.path)
+        logger.info(f"Indexed knowledge base: {len(documents)} documents, {len(chunks)} passages, {len(postings)} terms in {build_ms} ms")
+
+    def add_document(self, name: str, text: str):
+        """Add a document, replacing one with the same name; returns its metadata"""
+        with self._lock:
+            self._reload_if_changed()
+            documents = {doc_id: dict(document) for doc_id, document in self.documents.items() if document["name"] != name}
+            doc_id = uuid.uuid4().hex[:12]
+            documents[doc_id] = {"name": name, "text": text, "words": len(text.split()), "added": time.time()}
+            self._build(documents)
+            return self.describe(doc_id)
+
+    def remove_document(self, doc_id: str):
+        """Remove a document; returns False if there is none with that ID"""
+        with self._lock:
+            self._reload_if_changed()
+            if doc_id not in self.documents:
+                return False
+            documents = {other: dict(document) for other, document in self.documents.items() if other != doc_id}
+            self._build(documents)
+            return True
+
+    def describe(self, doc_id: str):
+        document = self.documents[doc_id]
+        return {key: value for key, value in document.items() if key != "text"} | {"id": doc_id}
+
+    def list_documents(self):
+        with self._lock:
+            self._reload_if_changed()
+            return [self.describe(doc_id) for doc_id in self.documents]
+
+    def search(self, question: str, k: int = 3, min_score: float = 0.0):
+        """Top-k passages for question by BM25 score, best first"""
+        started = time.perf_counter()
+        with self._lock:
+            self._reload_if_changed()
+            scores = {}
+            n = len(self.chunks)
+            for term in set(tokenize(question)):
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                for index, count in postings:
+                    length_norm = 1 - self.b + self.b * self.chunks[index]["length"] / self.avg_length
+                    scores[index] = scores.get(index, 0.0) + idf * count * (self.k1 + 1) / (count + self.k1 * length_norm)
+            best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+            passages = [
+                {
+                    "text": self.chunks[index]["text"],
+                    "document": self.documents[self.chunks[index]["doc_id"]]["name"],
+                    "score": round(score, 3),
+                }
+                for index, score in best
+                if score > min_score
+            ]
+            elapsed = 1000 * (time.perf_counter() - started)
+            self.queries += 1
+            self.total_query_ms += elapsed
+            self.last_query_ms = round(elapsed, 3)
+        return passages
+
+    def version(self):
+        """Modification time of the index file; changes whenever any worker edits the documents"""
+        try:
+            return os.path.getmtime(self.path)
+        except OSError:
+            return None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "documents": len(self.documents),
+                "passages": len(self.chunks),
+                "terms": len(self.postings),
+                "build_ms": self.build_ms,
+                "queries": self.queries,
+                "avg_query_ms": round(self.total_query_ms / self.queries, 3) if self.queries else 0.0,
+                "last_query_ms": self.last_query_ms,
+            }
@@ -0,0 +1,297 @@
+import asyncio
+import copy
+import inspect
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger("mlx-whisper-tts")
+
+try:
+    from mlx_lm.generate import BatchGenerator
+except ImportError:  # mlx_lm < 0.28
+    BatchGenerator = None
+
+_DONE = object()
+
+
+class _Request:
+    def __init__(self, loop, question: str, system_prompt: str, session_id: str, max_tokens: int, augmented_question: str = None):
+        self.loop = loop
+        self.question = question
+        self.augmented_question = augmented_question
+        self.system_prompt = system_prompt
+        self.session_id = session_id
+        self.max_tokens = max_tokens
+        self.queue = asyncio.Queue()
+        self.cancelled = False
+        self.submitted_at = time.perf_counter()
+        # Filled in on the worker once the request joins the batch
+        self.uid = None
+        self.detokenizer = None
+        self.commit = None
+        self.text = ""
+        self.tokens = 0
+
+    def push(self, item):
+        try:
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, item)
+        except RuntimeError:
+            # Event loop already closed; nobody is listening anymore
+            self.cancelled = True
+
+
+class LLMScheduler:
+    """Continuous batching for concurrent LLM requests.
+
+    Requests wait in an inbox and are admitted into the running batch at token
+    boundaries. mlx_lm's BatchGenerator then prefills new prompts together and
+    decodes every active sequence in one forward pass per step. Each sequence's
+    text is streamed back to its own caller. The decode loop runs on the LLM
+    executor only while sequences are active, so other LLM work such as prompt
+    cache rebuilds can run between batches.
+
+    Only the first line of an answer is used, so a sequence finishes as soon
+    as its text has a line break, like at a stop token: its session keeps the
+    KV cache when the generator can hand it back, and the history otherwise.
+    """
+
+    def __init__(self, model, tokenizer, executor, prompt_caches=None, max_batch_size: int = 8, prefill_batch_size: int = 4):
+        if BatchGenerator is None:
+            raise RuntimeError("Continuous batching needs mlx_lm>=0.28 (BatchGenerator)")
+        self.model = model
+        self.tokenizer = tokenizer
+        self.executor = executor
+        self.prompt_caches = prompt_caches
+        self.max_batch_size = max_batch_size
+        self.prefill_batch_size = prefill_batch_size
+        # Older BatchGenerators always prefill from scratch
+        self._insert_takes_caches = "caches" in inspect.signature(BatchGenerator.insert).parameters
+        if prompt_caches is not None and not self._insert_takes_caches:
+            logger.warning(
+                "This mlx_lm's BatchGenerator can't start from a KV cache, so batched turns prefill "
+                "the system prompt and history every time; upgrade mlx_lm or set llm_batching to false "
+                "to keep prompt caching"
+            )
+        # Newer ones return the caches of removed sequences
+        remove = getattr(BatchGenerator, "remove", None)
+        self._remove_returns_caches = remove is not None and "return_prompt_caches" in inspect.signature(remove).parameters
+        self._inbox = deque()
+        self._lock = threading.Lock()
+        self._running = False
+        self._active = 0
+        self.requests = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.generated_tokens = 0
+        self.decode_steps = 0
+        self.decode_seconds = 0.0
+        self.peak_batch = 0
+        self.total_first_token = 0.0
+        self.first_tokens = 0
+
+    async def stream(self, question: str, system_prompt: str, session_id: str = None, max_tokens: int = 100, augmented_question: str = None):
+        """Yield text deltas of the answer to question as they are decoded.
+
+        augmented_question replaces question in this turn's prompt only (see
+        PromptCacheManager.prepare). Closing the generator early (break +
+        aclose) removes the sequence from the batch at the next token boundary.
+        """
+        request = _Request(asyncio.get_running_loop(), question, system_prompt, session_id, max_tokens, augmented_question)
+        with self._lock:
+            self._inbox.append(request)
+            self.requests += 1
+            start = not self._running
+            self._running = True
+        if start:
+            try:
+                self.executor.submit(self._run)
+            except Exception:
+                with self._lock:
+                    self._running = False
+                    self._inbox.remove(request)
+                raise
+
+        try:
+            while True:
+                item = await request.queue.get()
+                if item is _DONE:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            request.cancelled = True
+
+    def _new_generator(self):
+        eos = getattr(self.tokenizer, "eos_token_ids", None) or {self.tokenizer.eos_token_id}
+        return BatchGenerator(
+            self.model,
+            stop_tokens=set(eos),
+            completion_batch_size=self.max_batch_size,
+            prefill_batch_size=self.prefill_batch_size,
+        )
+
+    def _new_detokenizer(self):
+        detokenizer = copy.copy(self.tokenizer.detokenizer)
+        detokenizer.reset()
+        return detokenizer
+
+    def _admit(self, generator, active):
+        """Move waiting requests into the batch while there is room"""
+        while len(active) < self.max_batch_size:
+            with self._lock:
+                if not self._inbox:
+                    return
+                request = self._inbox.popleft()
+            if request.cancelled:
+                continue
+
+            try:
+                if self.prompt_caches is not None:
+                    tokens, cache, request.commit = self.prompt_caches.prepare(
+                        request.system_prompt,
+                        request.question,
+                        request.session_id,
+                        reuse_cache=self._insert_takes_caches,
+                        augmented_question=request.augmented_question,
+                    )
+                else:
+                    prompt = f"{request.system_prompt}\n\nQ: {request.augmented_question or request.question}\nA: "
+                    tokens, cache = list(self.tokenizer.encode(prompt)), None
+                if self._insert_takes_caches and cache is not None:
+                    (request.uid,) = generator.insert([tokens], [request.max_tokens], caches=[cache])
+                else:
+                    (request.uid,) = generator.insert([tokens], [request.max_tokens])
+            except Exception as e:
+                logger.error(f"Could not admit LLM request: {str(e)}")
+                request.push(e)
+                continue
+
+            request.detokenizer = self._new_detokenizer()
+            active[request.uid] = request
+
+    def _finish(self, request, final_cache=None, keep_cache: bool = True):
+        if request.commit is not None:
+            try:
+                request.commit(request.text.strip().split("\n")[0].strip(), final_cache, keep_cache)
+            except Exception as e:
+                logger.error(f"Could not store LLM turn: {str(e)}")
+        request.push(_DONE)
+
+    def _drop_cancelled(self, generator, active):
+        cancelled = [uid for uid, request in active.items() if request.cancelled]
+        if not cancelled or not hasattr(generator, "remove"):
+            # Without remove() abandoned sequences simply run to max_tokens
+            return
+        generator.remove(cancelled)
+        for uid in cancelled:
+            # The answer was cut off, so its cache is not worth keeping; keep the history only
+            self.cancelled += 1
+            self._finish(active.pop(uid), keep_cache=False)
+
+    def _stop_at_line_end(self, generator, uid, active):
+        """Finish a sequence whose first line is complete, keeping its cache if the generator returns it"""
+        request = active.pop(uid)
+        final_cache = None
+        if not hasattr(generator, "remove"):
+            # Without remove() the sequence runs on to max_tokens unread
+            pass
+        elif self._remove_returns_caches:
+            caches = generator.remove([uid], return_prompt_caches=True)
+            if isinstance(caches, dict):
+                final_cache = caches.get(uid)
+            elif caches:
+                final_cache = caches[0]
+        else:
+            generator.remove([uid])
+        self.completed += 1
+        self._finish(request, final_cache, keep_cache=final_cache is not None)
+
+    def _deliver(self, response, active, generator):
+        request = active.get(response.uid)
+        if request is None:
+            return
+        if request.tokens == 0:
+            self.total_first_token += time.perf_counter() - request.submitted_at
+            self.first_tokens += 1
+        request.tokens += 1
+
+        if response.finish_reason != "stop":
+            request.detokenizer.add_token(response.token)
+        if response.finish_reason is not None:
+            request.detokenizer.finalize()
+        segment = request.detokenizer.last_segment
+        if segment and not request.cancelled:
+            request.text += segment
+            request.push(segment)
+
+        if response.finish_reason is not None:
+            del active[response.uid]
+            final_cache = getattr(response, "prompt_cache", None)
+            if callable(final_cache):
+                final_cache = final_cache()
+            self.completed += 1
+            self._finish(request, final_cache, keep_cache=final_cache is not None)
+        elif "\n" in request.text.lstrip():
+            # The caller stops reading here; don't let it look like a cancel
+            self._stop_at_line_end(generator, response.uid, active)
+
+    def _run(self):
+        """Decode loop; runs on the LLM worker until no sequence is left"""
+        generator = self._new_generator()
+        active = {}
+        try:
+            while True:
+                self._admit(generator, active)
+                self._drop_cancelled(generator, active)
+                self._active = len(active)
+                if not active:
+                    with self._lock:
+                        if not self._inbox:
+                            self._running = False
+                            return
+                    continue
+
+                self.peak_batch = max(self.peak_batch, len(active))
+                started = time.perf_counter()
+                responses = generator.next()
+                self.decode_seconds += time.perf_counter() - started
+                if responses:
+                    self.decode_steps += 1
+                    self.generated_tokens += len(responses)
+                for response in responses:
+                    self._deliver(response, active, generator)
+        except Exception as e:
+            logger.error(f"LLM batch failed: {str(e)}")
+            with self._lock:
+                waiting = list(self._inbox)
+                self._inbox.clear()
+                self._running = False
+            for request in list(active.values()) + waiting:
+                request.push(e)
+        finally:
+            self._active = 0
+            close = getattr(generator, "close", None)
+            if close is not None:
+                close()
+
+    def stats(self):
+        with self._lock:
+            waiting = len(self._inbox)
+        return {
+            "active": self._active,
+            "waiting": waiting,
+            "max_batch_size": self.max_batch_size,
+            "peak_batch": self.peak_batch,
+            "requests": self.requests,
+            "completed": self.completed,
+            "cancelled": self.cancelled,
+            "generated_tokens": self.generated_tokens,
+            "decode_steps": self.decode_steps,
+            "avg_batch": round(self.generated_tokens / self.decode_steps, 2) if self.decode_steps else 0.0,
+            # Aggregate throughput across all sequences in the batch
+            "tokens_per_second": round(self.generated_tokens / self.decode_seconds, 1) if self.decode_seconds else 0.0,
+            "avg_first_token_ms": round(1000 * self.total_first_token / self.first_tokens, 2) if self.first_tokens else 0.0,
+        }
@@ -0,0 +1,331 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from multiprocessing import resource_tracker
+from multiprocessing.connection import Client
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from inference import QueueFullError
+from model_loader import ModelUnavailableError
+
+logger = logging.getLogger("mlx-whisper-tts")
+
+# Exceptions that cross the IPC boundary by name; anything else becomes ModelServerError
+_REMOTE_ERRORS = {
+    "QueueFullError": QueueFullError,
+    "ModelUnavailableError": ModelUnavailableError,
+}
+
+
+class ModelServerError(Exception):
+    """An inference call failed inside the model server"""
+
+
+def raise_remote_error(kind: str, message: str):
+    raise _REMOTE_ERRORS.get(kind, ModelServerError)(message)
+
+
+def authkey_from_env():
+    """Shared secret for the model server socket (MODEL_SERVER_AUTHKEY), or None"""
+    key = os.environ.get("MODEL_SERVER_AUTHKEY")
+    return key.encode("utf-8") if key else None
+
+
+class SharedAudioBuffer:
+    """A growable shared-memory segment that one side writes arrays into.
+
+    Each side of a connection owns one buffer for the audio it sends, so audio
+    crosses the socket as a (segment name, dtype, shape) descriptor instead of
+    being pickled. The writer reuses its segment between calls and replaces it
+    with a larger one when an array does not fit; the reader attaches to
+    segments by name and keeps them mapped. A descriptor is only valid until
+    the writer's next write on the same connection.
+    """
+
+    def __init__(self):
+        self._segment = None
+        self._attached = {}
+
+    def write(self, array: np.ndarray):
+        array = np.ascontiguousarray(array)
+        if self._segment is None or self._segment.size < array.nbytes:
+            self._release_segment()
+            # Round up so slowly growing utterances do not reallocate every call
+            self._segment = SharedMemory(create=True, size=max(1 << 20, 2 * array.nbytes))
+        target = np.ndarray(array.shape, dtype=array.dtype, buffer=self._segment.buf)
+        target[...] = array
+        return (self._segment.name, array.dtype.str, array.shape)
+
+    def read(self, descriptor, copy: bool = True):
+        name, dtype, shape = descriptor
+        segment = self._attached.get(name)
+        if segment is None:
+            # A new segment from the writer means the old one is gone
+            self._detach_all()
+            segment = SharedMemory(name=name)
+            # Python < 3.13 registers attached segments with this process's resource
+            # tracker, which would unlink the writer's segment when we exit
+            resource_tracker.unregister(segment._name, "shared_memory")
+            self._attached[name] = segment
+        view = np.ndarray(shape, dtype=np.dtype(dtype), buffer=segment.buf)
+        return view.copy() if copy else view
+
+    def _release_segment(self):
+        if self._segment is not None:
+            self._segment.close()
+            self._segment.unlink()
+            self._segment = None
+
+    def _detach_all(self):
+        for segment in self._attached.values():
+            try:
+                segment.close()
+            except BufferError:
+                # A zero-copy view is still alive; the mapping goes away with it
+                pass
+        self._attached.clear()
+
+    def close(self):
+        self._detach_all()
+        self._release_segment()
+
+
+class _Channel:
+    """One client connection with its own pair of audio buffers"""
+
+    def __init__(self, address: str, authkey: bytes):
+        self.conn = Client(address, family="AF_UNIX", authkey=authkey)
+        self.outgoing = SharedAudioBuffer()
+        self.incoming = SharedAudioBuffer()
+
+    def close(self):
+        try:
+            self.conn.close()
+        finally:
+            self.outgoing.close()
+            self.incoming.close()
+
+
+class ModelServerClient:
+    """Blocking client for model_server.py with a pool of connections.
+
+    Each request takes an idle connection (opening one if needed), so calls
+    from different worker threads and concurrent LLM streams run side by side.
+    Methods block; call them from worker threads, not the event loop.
+    """
+
+    def __init__(self, address: str, authkey: bytes = None, max_idle: int = 8):
+        self.address = address
+        self.authkey = authkey
+        self.max_idle = max_idle
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _acquire(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        try:
+            return _Channel(self.address, self.authkey)
+        except (OSError, EOFError) as e:
+            raise ModelUnavailableError(f"model server at {self.address} is unreachable: {str(e)}")
+
+    def _release(self, channel: _Channel):
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(channel)
+                return
+        channel.close()
+
+    def call(self, op: str, audio: np.ndarray = None, **kwargs):
+        """Run op on the server and return (result, audio array or None)"""
+        channel = self._acquire()
+        try:
+            if audio is not None:
+                kwargs["audio"] = channel.outgoing.write(audio)
+            channel.conn.send((op, kwargs))
+            kind, value, audio_out = channel.conn.recv()
+        except (OSError, EOFError) as e:
+            channel.close()
+            raise ModelUnavailableError(f"lost connection to model server: {str(e)}")
+        if kind == "error":
+            self._release(channel)
+            raise_remote_error(*value)
+        if audio_out is not None:
+            audio_out = channel.incoming.read(audio_out)
+        self._release(channel)
+        return value, audio_out
+
+    def open_stream(self, op: str, **kwargs):
+        """Start a streaming op; returns a RemoteStream to read chunks from"""
+        channel = self._acquire()
+        try:
+            channel.conn.send((op, kwargs))
+        except (OSError, EOFError) as e:
+            channel.close()
+            raise ModelUnavailableError(f"lost connection to model server: {str(e)}")
+        return RemoteStream(self, channel)
+
+    def wait_ready(self, name: str, timeout: float):
+        """Block until the server reports the model ready; raise if it failed.
+
+        Loading a model can take minutes, so the timeout only applies while the
+        server itself is unreachable.
+        """
+        unreachable_since = None
+        while True:
+            try:
+                status, _ = self.call("status")
+                unreachable_since = None
+            except ModelUnavailableError:
+                unreachable_since = unreachable_since or time.monotonic()
+                if time.monotonic() - unreachable_since > timeout:
+                    raise
+                time.sleep(1.0)
+                continue
+            state = status[name]
+            if state["state"] == "ready":
+                return state
+            if state["state"] == "failed":
+                raise ModelUnavailableError(f"{name} model failed to load in the model server: {state['error']}")
+            time.sleep(0.5)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for channel in idle:
+            channel.close()
+
+
+class RemoteStream:
+    """Chunks of one streaming call. Closing early asks the server to stop"""
+
+    def __init__(self, client: ModelServerClient, channel: _Channel):
+        self.client = client
+        self.channel = channel
+        self.done = False
+
+    def next(self):
+        """Block for the next chunk; returns None at the end of the stream"""
+        try:
+            kind, value, _ = self.channel.conn.recv()
+        except (OSError, EOFError) as e:
+            self.done = True
+            self.channel.close()
+            raise ModelUnavailableError(f"lost connection to model server: {str(e)}")
+        if kind == "chunk":
+            return value
+        self.done = True
+        self.client._release(self.channel)
+        if kind == "error":
+            raise_remote_error(*value)
+        return None
+
+    def cancel(self):
+        """Stop the stream and drain it so the connection can be reused"""
+        if self.done:
+            return
+        try:
+            self.channel.conn.send(("cancel", {}))
+            while self.next() is not None:
+                pass
+        except Exception:
+            pass
+
+
+@dataclass
+class RemoteSegment:
+    audio: np.ndarray
+
+
+class RemoteWhisper:
+    """Stands in for the mlx_whisper module; transcribe() runs in the model server"""
+
+    def __init__(self, client: ModelServerClient):
+        self.client = client
+
+    def transcribe(self, audio, path_or_hf_repo: str = None, **kwargs):
+        if isinstance(audio, str):
+            # File-decode fallback: both processes share the filesystem
+            result, _ = self.client.call("transcribe", path=audio, model=path_or_hf_repo, options=kwargs)
+        else:
+            result, _ = self.client.call("transcribe", audio=np.asarray(audio, dtype=np.float32), model=path_or_hf_repo, options=kwargs)
+        return result
+
+
+class RemoteTTS:
+    """Stands in for the Kokoro model; generate() yields one segment with all the audio"""
+
+    def __init__(self, client: ModelServerClient):
+        self.client = client
+
+    def generate(self, text: str, voice: str = "af_heart", speed: float = 1.0, lang_code: str = "a", verbose: bool = False, **kwargs):
+        _, audio = self.client.call("synthesize", text=text, voice=voice, speed=speed, lang_code=lang_code)
+        if audio is not None:
+            yield RemoteSegment(audio=audio)
+
+
+class RemoteLLM:
+    """LLMScheduler interface backed by the model server's LLM.
+
+    The server applies its own batching and prompt caches, so concurrent turns
+    from every front-end worker share decode steps.
+    """
+
+    def __init__(self, client: ModelServerClient):
+        self.client = client
+
+    async def stream(self, question: str, system_prompt: str, session_id: str = None, max_tokens: int = 100, augmented_question: str = None):
+        remote = await asyncio.to_thread(
+            self.client.open_stream,
+            "llm_stream",
+            question=question,
+            system_prompt=system_prompt,
+            session_id=session_id,
+            max_tokens=max_tokens,
+            augmented_question=augmented_question,
+        )
+        try:
+            while True:
+                segment = await asyncio.to_thread(remote.next)
+                if segment is None:
+                    return
+                yield segment
+        finally:
+            if not remote.done:
+                await asyncio.to_thread(remote.cancel)
+
+    def stats(self):
+        stats, _ = self.client.call("stats")
+        return stats["llm_batching"]
+
+
+class RemotePromptCaches:
+    """PromptCacheManager interface; sessions and KV caches live in the model server"""
+
+    def __init__(self, client: ModelServerClient):
+        self.client = client
+
+    def _call(self, method: str, *args):
+        result, _ = self.client.call("prompt_cache", method=method, args=args)
+        return result
+
+    def set_system_prompt(self, system_prompt: str):
+        return self._call("set_system_prompt", system_prompt)
+
+    def has_history(self, session_id: str):
+        return self._call("has_history", session_id)
+
+    def record_turn(self, session_id: str, question: str, answer: str):
+        return self._call("record_turn", session_id, question, answer)
+
+    def drop_session(self, session_id: str):
+        return self._call("drop_session", session_id)
+
+    def stats(self):
+        return self._call("stats")
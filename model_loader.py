@@ -0,0 +1,89 @@
+import asyncio
+import logging
+import time
+import traceback
+
+logger = logging.getLogger("mlx-whisper-tts")
+
+
+class ModelUnavailableError(Exception):
+    """Raised when a request needs a model that failed to load or is still loading"""
+
+
+class ModelState:
+    """Background load and warm-up status of one model.
+
+    Request handlers await wait() instead of checking a global that may still
+    be None. wait() returns once the model is ready and raises
+    ModelUnavailableError if loading failed or did not finish in time.
+    """
+
+    def __init__(self, name: str, model_id: str = None):
+        self.name = name
+        self.model_id = model_id
+        self.state = "pending"
+        self.error = None
+        self.load_seconds = None
+        self.warmup_seconds = None
+        self._settled = asyncio.Event()
+
+    @property
+    def ready(self):
+        return self.state == "ready"
+
+    @property
+    def failed(self):
+        return self.state == "failed"
+
+    async def load(self, load_fn, warmup_fn=None, run=None):
+        """Run load_fn() and then warmup_fn(loaded) through run (default: a worker thread).
+
+        Pass an InferenceExecutor's run so the model is loaded, warmed up and
+        later used on the same thread. Returns what load_fn returned, or None on
+        failure.
+        """
+        run = run or asyncio.to_thread
+        started = time.perf_counter()
+        self.state = "loading"
+        try:
+            loaded = await run(load_fn)
+            self.load_seconds = round(time.perf_counter() - started, 2)
+            if warmup_fn is not None:
+                self.state = "warming"
+                warmup_started = time.perf_counter()
+                await run(warmup_fn, loaded)
+                self.warmup_seconds = round(time.perf_counter() - warmup_started, 2)
+            self.state = "ready"
+            logger.info(f"{self.name} model ready (load {self.load_seconds}s, warm-up {self.warmup_seconds}s)")
+            return loaded
+        except Exception as e:
+            self.state = "failed"
+            self.error = str(e)
+            logger.error(f"Error loading {self.name} model: {str(e)}")
+            logger.error(f"Traceback: {traceback.format_exc()}")
+            logger.warning(f"{self.name} features will be disabled due to initialization error.")
+            return None
+        finally:
+            self._settled.set()
+
+    async def wait(self, timeout: float = None):
+        """Wait until the model is ready; raise ModelUnavailableError otherwise"""
+        if not self._settled.is_set():
+            try:
+                await asyncio.wait_for(self._settled.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        if self.ready:
+            return
+        if self.failed:
+            raise ModelUnavailableError(f"{self.name} model failed to load: {self.error}")
+        raise ModelUnavailableError(f"{self.name} model is still {self.state}")
+
+    def status(self):
+        return {
+            "model": self.model_id,
+            "state": self.state,
+            "load_seconds": self.load_seconds,
+            "warmup_seconds": self.warmup_seconds,
+            "error": self.error,
+        }
@@ -0,0 +1,167 @@
+import gc
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger("mlx-whisper-tts")
+
+WEIGHT_SUFFIXES = (".safetensors", ".npz", ".bin", ".pt", ".pth")
+
+
+def estimate_model_mb(model_id: str):
+    """Size of a model's weight files in MB, from a local path or the Hugging Face cache"""
+    path = os.path.expanduser(model_id)
+    if not os.path.isdir(path):
+        try:
+            from huggingface_hub import snapshot_download
+            path = snapshot_download(repo_id=model_id, local_files_only=True)
+        except Exception:
+            return None
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            if name.endswith(WEIGHT_SUFFIXES):
+                total += os.path.getsize(os.path.join(root, name))
+    return round(total / (1024 * 1024), 1) if total else None
+
+
+def release_device_memory():
+    """Return freed MLX buffers to the system after a model is dropped"""
+    gc.collect()
+    try:
+        import mlx.core as mx
+    except ImportError:
+        return
+    clear_cache = getattr(mx, "clear_cache", None) or getattr(mx.metal, "clear_cache", None)
+    if clear_cache is not None:
+        clear_cache()
+
+
+class _Entry:
+    def __init__(self, kind: str, model_id: str, model, size_mb: float, unload_fn):
+        self.kind = kind
+        self.model_id = model_id
+        self.model = model
+        self.size_mb = size_mb
+        self.unload_fn = unload_fn
+        self.loaded_at = time.time()
+        self.last_used = time.time()
+        self.uses = 0
+        self.load_seconds = None
+
+
+class ModelRegistry:
+    """Loaded models keyed by (kind, model_id), kept under a memory budget.
+
+    get() returns a loaded model, loading it on demand and then unloading the
+    least recently used models until the total fits budget_mb again. Models
+    that are currently active (pinned) are never unloaded, so a switch keeps
+    the old model serving until the new one is ready. Sizes come from the
+    weight files on disk unless overridden in sizes_mb. Loading blocks; call
+    get() on the worker that will run the model.
+    """
+
+    def __init__(self, budget_mb: float = None, sizes_mb: dict = None):
+        self.budget_mb = budget_mb
+        self.sizes_mb = sizes_mb or {}
+        self._entries = OrderedDict()
+        self._pinned = {}
+        self._lock = threading.Lock()
+        # One load per key at a time; different kinds load in parallel on their own workers
+        self._load_locks = {}
+        self.loads = 0
+        self.unloads = 0
+
+    def get(self, kind: str, model_id: str, load_fn, unload_fn=None):
+        key = (kind, model_id)
+        with self._lock:
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+        with load_lock:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    entry.last_used = time.time()
+                    entry.uses += 1
+                    return entry.model
+            started = time.perf_counter()
+            model = load_fn()
+            size_mb = self.sizes_mb.get(model_id) or estimate_model_mb(model_id) or 0.0
+            entry = _Entry(kind, model_id, model, size_mb, unload_fn)
+            entry.load_seconds = round(time.perf_counter() - started, 2)
+            entry.uses = 1
+            with self._lock:
+                self._entries[key] = entry
+                self.loads += 1
+                evicted = self._evict(keep=key)
+            logger.info(f"Loaded {kind} model {model_id} ({size_mb:.0f} MB, {entry.load_seconds}s)")
+        for victim in evicted:
+            self._unload(victim)
+        return model
+
+    def pin(self, kind: str, model_id: str):
+        """Mark model_id as the active model of its kind, unpinning the previous one"""
+        with self._lock:
+            self._pinned[kind] = model_id
+            evicted = self._evict()
+        for victim in evicted:
+            self._unload(victim)
+
+    def loaded(self, kind: str, model_id: str):
+        with self._lock:
+            return (kind, model_id) in self._entries
+
+    def total_mb(self):
+        return sum(entry.size_mb for entry in self._entries.values())
+
+    def _evict(self, keep=None):
+        """Pop LRU unpinned entries until under budget; caller unloads them outside the lock"""
+        evicted = []
+        if self.budget_mb is None:
+            return evicted
+        for key in list(self._entries):
+            if self.total_mb() <= self.budget_mb:
+                break
+            entry = self._entries[key]
+            if key == keep or self._pinned.get(entry.kind) == entry.model_id:
+                continue
+            del self._entries[key]
+            evicted.append(entry)
+        if self.total_mb() > self.budget_mb:
+            logger.warning(f"Active models use {self.total_mb():.0f} MB, over the {self.budget_mb:.0f} MB budget")
+        return evicted
+
+    def _unload(self, entry: _Entry):
+        logger.info(f"Unloading {entry.kind} model {entry.model_id} ({entry.size_mb:.0f} MB, idle {time.time() - entry.last_used:.0f}s)")
+        try:
+            if entry.unload_fn is not None:
+                entry.unload_fn(entry.model)
+        except Exception as e:
+            logger.error(f"Error unloading {entry.kind} model {entry.model_id}: {str(e)}")
+        entry.model = None
+        with self._lock:
+            self.unloads += 1
+        release_device_memory()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "budget_mb": self.budget_mb,
+                "loaded_mb": round(self.total_mb(), 1),
+                "loads": self.loads,
+                "unloads": self.unloads,
+                "active": dict(self._pinned),
+                "models": [
+                    {
+                        "kind": entry.kind,
+                        "model": entry.model_id,
+                        "size_mb": entry.size_mb,
+                        "load_seconds": entry.load_seconds,
+                        "uses": entry.uses,
+                        "idle_seconds": round(time.time() - entry.last_used, 1),
+                    }
+                    for entry in self._entries.values()
+                ],
+            }
@@ -0,0 +1,208 @@
+"""Model server: one process that owns Whisper, the LLM and Kokoro.
+
+Run it next to any number of front-end workers:
+
+    python model_server.py
+    uvicorn app:app --workers 4   # with "model_server_socket" set in config.json
+
+Front-ends connect over a Unix socket (multiprocessing.connection, with
+MODEL_SERVER_AUTHKEY as the shared secret when set) and pass audio through
+shared memory. Requests run on the same per-model executors, continuous
+batching scheduler and prompt caches as the in-process setup, so model memory
+is paid once and concurrent turns from every worker are batched together.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import queue
+import threading
+import traceback
+from multiprocessing.connection import Listener
+
+import numpy as np
+
+import app
+from model_ipc import SharedAudioBuffer, authkey_from_env
+
+logger = logging.getLogger("mlx-whisper-tts")
+
+DEFAULT_SOCKET = "/tmp/mlx-whisper-tts-models.sock"
+
+# PromptCacheManager methods front-ends may call, and whether they need the MLX thread
+PROMPT_CACHE_METHODS = {
+    "set_system_prompt": True,
+    "has_history": False,
+    "record_turn": False,
+    "drop_session": False,
+    "stats": False,
+}
+
+
+class ModelServer:
+    def __init__(self, address: str, loop: asyncio.AbstractEventLoop):
+        self.address = address
+        self.loop = loop
+        self.connections = 0
+
+    def wait_for_model(self, name: str):
+        asyncio.run_coroutine_threadsafe(app.wait_for_model(name), self.loop).result()
+
+    def serve_forever(self):
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+        listener = Listener(self.address, family="AF_UNIX", authkey=authkey_from_env())
+        # Requests are pickled, so only this user may connect
+        os.chmod(self.address, 0o600)
+        logger.info(f"Model server listening on {self.address}")
+        while True:
+            try:
+                conn = listener.accept()
+            except Exception as e:
+                logger.error(f"Rejected model server connection: {str(e)}")
+                continue
+            threading.Thread(target=self.handle_connection, args=(conn,), daemon=True).start()
+
+    def handle_connection(self, conn):
+        self.connections += 1
+        incoming = SharedAudioBuffer()
+        outgoing = SharedAudioBuffer()
+        try:
+            while True:
+                try:
+                    op, kwargs = conn.recv()
+                except (EOFError, OSError):
+                    break
+                try:
+                    if op == "llm_stream":
+                        if not self.stream_llm(conn, **kwargs):
+                            break
+                        continue
+                    audio = kwargs.pop("audio", None)
+                    if audio is not None:
+                        # Zero-copy view; valid until the client's next request on this connection
+                        kwargs["audio"] = incoming.read(audio, copy=False)
+                    result, audio_out = self.dispatch(op, **kwargs)
+                    conn.send(("ok", result, outgoing.write(audio_out) if audio_out is not None else None))
+                except Exception as e:
+                    if not isinstance(e, (app.QueueFullError, app.ModelUnavailableError)):
+                        logger.error(f"Model server {op} failed: {str(e)}")
+                        logger.error(f"Traceback: {traceback.format_exc()}")
+                    conn.send(("error", (type(e).__name__, str(e)), None))
+        finally:
+            self.connections -= 1
+            conn.close()
+            incoming.close()
+            outgoing.close()
+
+    def dispatch(self, op: str, **kwargs):
+        """Run one request; returns (picklable result, float32 audio or None)"""
+        if op == "status":
+            return {name: state.status() for name, state in app.model_status.items()}, None
+        if op == "stats":
+            return {
+                "executors": [executor.stats() for executor in (app.whisper_executor, app.llm_executor, app.tts_executor)],
+                "prompt_cache": app.prompt_caches.stats() if app.prompt_caches is not None else None,
+                "llm_batching": app.llm_scheduler.stats() if app.llm_scheduler is not None else None,
+                "models": app.model_registry.stats(),
+                "connections": self.connections,
+            }, None
+        if op == "transcribe":
+            self.wait_for_model("whisper")
+            audio = kwargs.get("audio")
+            source = kwargs["path"] if audio is None else audio
+            # Front-ends route by duration, so the checkpoint comes with each call
+            result = app.whisper_executor.call(app.whisper_transcribe, source, kwargs.get("model"), **kwargs["options"])
+            return result, None
+        if op == "synthesize":
+            self.wait_for_model("tts")
+
+            def synthesize():
+                results = app.tts_model.generate(
+                    text=kwargs["text"],
+                    voice=kwargs["voice"],
+                    speed=kwargs["speed"],
+                    lang_code=kwargs["lang_code"],
+                    verbose=False,
+                )
+                return [np.asarray(segment.audio, dtype=np.float32) for segment in results]
+
+            segments = app.tts_executor.call(synthesize)
+            return None, np.concatenate(segments, axis=0) if segments else None
+        if op == "switch_model":
+            asyncio.run_coroutine_threadsafe(app.switch_model(kwargs["kind"], kwargs["model_id"]), self.loop).result()
+            return app.model_status[kwargs["kind"]].model_id, None
+        if op == "prompt_cache":
+            self.wait_for_model("llm")
+            method = kwargs["method"]
+            if method not in PROMPT_CACHE_METHODS:
+                raise ValueError(f"Unknown prompt cache method: {method}")
+            fn = getattr(app.prompt_caches, method)
+            if PROMPT_CACHE_METHODS[method]:
+                return app.llm_executor.call(fn, *kwargs["args"]), None
+            return fn(*kwargs["args"]), None
+        raise ValueError(f"Unknown model server op: {op}")
+
+    def stream_llm(self, conn, question: str, system_prompt: str, session_id: str = None, max_tokens: int = 100, augmented_question: str = None):
+        """Forward LLM text chunks as they are generated until the end or a cancel message.
+
+        Returns False if the client disconnected mid-stream; generation is cancelled then.
+        """
+        chunks = queue.Queue()
+
+        async def pump():
+            await app.wait_for_model("llm")
+            tokens = app.llm_token_stream(question, system_prompt, session_id, max_tokens, augmented_question)
+            try:
+                async for chunk in tokens:
+                    chunks.put(("chunk", getattr(chunk, "text", chunk)))
+            finally:
+                await tokens.aclose()
+
+        def finished(future):
+            if future.cancelled():
+                chunks.put(("end", None))
+            elif future.exception() is not None:
+                e = future.exception()
+                chunks.put(("error", (type(e).__name__, str(e))))
+            else:
+                chunks.put(("end", None))
+
+        future = asyncio.run_coroutine_threadsafe(pump(), self.loop)
+        future.add_done_callback(finished)
+        try:
+            while True:
+                if conn.poll():
+                    # The only message a client sends mid-stream
+                    conn.recv()
+                    future.cancel()
+                try:
+                    kind, value = chunks.get(timeout=0.02)
+                except queue.Empty:
+                    continue
+                if kind == "chunk":
+                    if not future.cancelled():
+                        conn.send(("chunk", value, None))
+                    continue
+                conn.send((kind, value, None))
+                return True
+        except (EOFError, OSError):
+            # The front-end went away: stop generating for nobody
+            future.cancel()
+            return False
+
+
+async def main(address: str):
+    loop = asyncio.get_running_loop()
+    server = ModelServer(address, loop)
+    # Accept connections right away; requests wait for the model they need
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    await app.load_local_models()
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--socket", default=app.config.get("model_server_socket") or DEFAULT_SOCKET, help="Unix socket path")
+    args = parser.parse_args()
+    asyncio.run(main(args.socket))
@@ -0,0 +1,258 @@
+import io
+import struct
+import zlib
+
+import numpy as np
+
+# Uploads MediaRecorder produces: Ogg Opus (Firefox) and WebM Opus (Chrome, Edge, Firefox).
+# libsndfile decodes Ogg Opus itself; WebM is remuxed to Ogg here, so neither needs ffmpeg.
+OGG_MAGIC = b"OggS"
+EBML_MAGIC = b"\x1a\x45\xdf\xa3"
+
+OGG_PAGE_HEADER = struct.Struct("<4sBBqIIIB")
+OGG_BOS = 0x02
+OGG_EOS = 0x04
+# Keep pages small enough that a packet never has to span two of them
+OGG_MAX_SEGMENTS = 255
+
+# Opus always counts granule positions in 48 kHz samples
+OPUS_GRANULE_RATE = 48000
+# Rates libopus can decode to directly, so no resampling is needed afterwards
+OPUS_DECODE_RATES = (8000, 12000, 16000, 24000, 48000)
+
+# Matroska / WebM element IDs (with their length marker bits)
+EBML_SEGMENT = 0x18538067
+EBML_TRACKS = 0x1654AE6B
+EBML_TRACK_ENTRY = 0xAE
+EBML_TRACK_NUMBER = 0xD7
+EBML_CODEC_ID = 0x86
+EBML_CODEC_PRIVATE = 0x63A2
+EBML_CODEC_DELAY = 0x56AA
+EBML_AUDIO = 0xE1
+EBML_CHANNELS = 0x9F
+EBML_CLUSTER = 0x1F43B675
+EBML_BLOCK_GROUP = 0xA0
+EBML_BLOCK = 0xA1
+EBML_SIMPLE_BLOCK = 0xA3
+# Containers whose children we need; everything else is skipped by size
+EBML_MASTERS = {EBML_SEGMENT, EBML_TRACKS, EBML_TRACK_ENTRY, EBML_AUDIO, EBML_CLUSTER, EBML_BLOCK_GROUP}
+
+# Bit-reversal of every byte, to run Ogg's MSB-first CRC through zlib's LSB-first one
+_REVERSE_BITS = bytes(int(f"{i:08b}"[::-1], 2) for i in range(256))
+
+
+def ogg_crc(data: bytes):
+    """Ogg page checksum (CRC-32, polynomial 0x04C11DB7, no reflection, zero init)"""
+    crc = zlib.crc32(data.translate(_REVERSE_BITS), 0xFFFFFFFF) ^ 0xFFFFFFFF
+    return int(f"{crc:032b}"[::-1], 2)
+
+
+def _ogg_page(header_type: int, granule: int, serial: int, sequence: int, packets):
+    lacing = bytearray()
+    for packet in packets:
+        lacing += b"\xff" * (len(packet) // 255) + bytes((len(packet) % 255,))
+    header = OGG_PAGE_HEADER.pack(OGG_MAGIC, 0, header_type, granule, serial, sequence, 0, len(lacing))
+    page = bytearray(header + lacing + b"".join(packets))
+    struct.pack_into("<I", page, 22, ogg_crc(bytes(page)))
+    return bytes(page)
+
+
+def opus_packet_samples(packet: bytes):
+    """Duration of an Opus packet in 48 kHz samples, from its TOC byte (RFC 6716 section 3.1)"""
+    if not packet:
+        return 0
+    toc = packet[0]
+    config = toc >> 3
+    if config < 12:
+        frame = (480, 960, 1920, 2880)[config % 4]
+    elif config < 16:
+        frame = (480, 960)[config % 2]
+    else:
+        frame = (120, 240, 480, 960)[config % 4]
+    code = toc & 0x03
+    if code == 0:
+        frames = 1
+    elif code in (1, 2):
+        frames = 2
+    else:
+        frames = packet[1] & 0x3F if len(packet) > 1 else 0
+    return frame * frames
+
+
+def opus_head(channels: int, pre_skip: int = 312, input_rate: int = OPUS_GRANULE_RATE):
+    """A channel mapping family 0 OpusHead packet (mono or stereo)"""
+    return b"OpusHead" + struct.pack("<BBHIhB", 1, channels, pre_skip, input_rate, 0, 0)
+
+
+def set_opus_head_rate(head: bytes, rate: int):
+    """OpusHead with its input sample rate replaced, which libsndfile decodes at"""
+    if len(head) < 19 or not head.startswith(b"OpusHead"):
+        raise ValueError("Not an OpusHead packet")
+    return head[:12] + struct.pack("<I", rate) + head[16:]
+
+
+def ogg_opus_stream(head: bytes, packets, serial: int = 0x4F505553):
+    """Wrap raw Opus packets in an Ogg Opus stream (RFC 7845)"""
+    tags = b"OpusTags" + struct.pack("<I", 7) + b"opus_io" + struct.pack("<I", 0)
+    pages = [_ogg_page(OGG_BOS, 0, serial, 0, [head]), _ogg_page(0, 0, serial, 1, [tags])]
+    granule = 0
+    page_packets = []
+    segments = 0
+    for index, packet in enumerate(packets):
+        needed = len(packet) // 255 + 1
+        if needed > OGG_MAX_SEGMENTS:
+            raise ValueError("Opus packet too large for one Ogg page")
+        if segments + needed > OGG_MAX_SEGMENTS:
+            pages.append(_ogg_page(0, granule, serial, len(pages), page_packets))
+            page_packets, segments = [], 0
+        page_packets.append(packet)
+        segments += needed
+        granule += opus_packet_samples(packet)
+    pages.append(_ogg_page(OGG_EOS, granule, serial, len(pages), page_packets))
+    return b"".join(pages)
+
+
+def _read_vint(data: bytes, pos: int, keep_marker: bool):
+    """Read an EBML variable-length integer; returns (value, length, all_ones) or None past the end"""
+    if pos >= len(data) or data[pos] == 0:
+        return None
+    first = data[pos]
+    length = 8 - first.bit_length() + 1
+    if pos + length > len(data):
+        return None
+    value = first if keep_marker else first & (0xFF >> length)
+    for byte in data[pos + 1:pos + length]:
+        value = (value << 8) | byte
+    all_ones = not keep_marker and value == (1 << (7 * length)) - 1
+    return value, length, all_ones
+
+
+def parse_webm_opus(data: bytes):
+    """Extract the first Opus track of a WebM file as (OpusHead, [packets]).
+
+    Walks the EBML elements linearly, descending into the containers that hold
+    tracks and blocks, so the unknown-size Segment and Cluster elements that
+    MediaRecorder writes are fine, and so is a recording cut off mid-block.
+    Returns None for anything else (other codecs, laced blocks, not WebM).
+    """
+    if not data.startswith(EBML_MAGIC):
+        return None
+    tracks = []
+    blocks = []
+    pos = 0
+    while pos < len(data):
+        element = _read_vint(data, pos, keep_marker=True)
+        if element is None:
+            break
+        element_id, id_length, _ = element
+        size = _read_vint(data, pos + id_length, keep_marker=False)
+        if size is None:
+            break
+        size, size_length, unknown_size = size
+        body = pos + id_length + size_length
+        if element_id in EBML_MASTERS:
+            if element_id == EBML_TRACK_ENTRY:
+                tracks.append({})
+            pos = body
+            continue
+        if unknown_size:
+            return None
+        end = body + size
+        payload = data[body:end]
+        if element_id in (EBML_SIMPLE_BLOCK, EBML_BLOCK):
+            if end > len(data):
+                # Truncated final block
+                break
+            blocks.append(payload)
+        elif tracks and element_id == EBML_TRACK_NUMBER:
+            tracks[-1]["number"] = int.from_bytes(payload, "big")
+        elif tracks and element_id == EBML_CODEC_ID:
+            tracks[-1]["codec"] = payload.rstrip(b"\0").decode("ascii", "replace")
+        elif tracks and element_id == EBML_CODEC_PRIVATE:
+            tracks[-1]["private"] = payload
+        elif tracks and element_id == EBML_CODEC_DELAY:
+            tracks[-1]["delay_ns"] = int.from_bytes(payload, "big")
+        elif tracks and element_id == EBML_CHANNELS:
+            tracks[-1]["channels"] = int.from_bytes(payload, "big")
+        pos = end
+
+    track = next((track for track in tracks if track.get("codec") == "A_OPUS"), None)
+    if track is None:
+        return None
+    head = track.get("private")
+    if not head or not head.startswith(b"OpusHead"):
+        pre_skip = track.get("delay_ns", 6_500_000) * OPUS_GRANULE_RATE // 1_000_000_000
+        head = opus_head(track.get("channels", 1), pre_skip)
+
+    packets = []
+    for block in blocks:
+        parsed = _read_vint(block, 0, keep_marker=False)
+        if parsed is None or len(block) < parsed[1] + 3:
+            continue
+        number, length, _ = parsed
+        if number != track.get("number", number):
+            continue
+        flags = block[length + 2]
+        if flags & 0x06:
+            # Laced blocks hold several packets; MediaRecorder never writes them
+            return None
+        packets.append(block[length + 3:])
+    if not packets:
+        return None
+    return head, packets
+
+
+def _ogg_opus_at_rate(data: bytes, rate: int):
+    """Rewrite the OpusHead page of an Ogg Opus stream so libopus decodes straight to rate.
+
+    Returns data unchanged if the first page is not a lone OpusHead.
+    """
+    if len(data) < OGG_PAGE_HEADER.size:
+        return data
+    *_, segments = OGG_PAGE_HEADER.unpack_from(data)
+    body = OGG_PAGE_HEADER.size + segments
+    lacing = data[OGG_PAGE_HEADER.size:body]
+    if segments != 1 or lacing[0] >= 255 or not data[body:body + 8] == b"OpusHead":
+        return data
+    end = body + lacing[0]
+    page = bytearray(data[:end])
+    page[body:end] = set_opus_head_rate(bytes(page[body:end]), rate)
+    struct.pack_into("<I", page, 22, 0)
+    struct.pack_into("<I", page, 22, ogg_crc(bytes(page)))
+    return bytes(page) + data[end:]
+
+
+def decode_compressed(data: bytes, target_sr: int = None):
+    """Decode an Ogg (Opus, Vorbis, FLAC) or WebM Opus upload in memory.
+
+    Returns (mono float32 samples, sample rate), or None if the bytes are not
+    one of these or libsndfile can't read them. Opus is decoded directly at
+    target_sr when libopus supports that rate.
+    """
+    import soundfile as sf
+
+    opus_rate = target_sr if target_sr in OPUS_DECODE_RATES else None
+    if data.startswith(EBML_MAGIC):
+        parsed = parse_webm_opus(data)
+        if parsed is None:
+            return None
+        head, packets = parsed
+        if opus_rate is not None:
+            head = set_opus_head_rate(head, opus_rate)
+        try:
+            data = ogg_opus_stream(head, packets)
+        except ValueError:
+            return None
+    elif data.startswith(OGG_MAGIC):
+        if opus_rate is not None:
+            data = _ogg_opus_at_rate(data, opus_rate)
+    else:
+        return None
+
+    try:
+        audio, sample_rate = sf.read(io.BytesIO(data), dtype="float32", always_2d=True)
+    except Exception:
+        return None
+    if audio.shape[1] > 1:
+        return audio.mean(axis=1, dtype=np.float32), sample_rate
+    return audio[:, 0], sample_rate
@@ -0,0 +1,214 @@
+import copy
+import logging
+import threading
+from collections import OrderedDict
+
+import mlx.core as mx
+from mlx_lm.models.cache import can_trim_prompt_cache, make_prompt_cache, trim_prompt_cache
+
+logger = logging.getLogger("mlx-whisper-tts")
+
+
+def common_prefix_length(a, b):
+    n = min(len(a), len(b))
+    for i in range(n):
+        if a[i] != b[i]:
+            return i
+    return n
+
+
+def cache_nbytes(cache):
+    return sum(array.nbytes for layer in cache for array in layer.state if array is not None)
+
+
+class _Session:
+    def __init__(self):
+        # (user, assistant) pairs of earlier turns
+        self.history = []
+        # Tokens whose keys/values are held in cache
+        self.tokens = []
+        self.cache = None
+        self.nbytes = 0
+
+
+class PromptCacheManager:
+    """Reuses the LLM's KV cache across turns.
+
+    The system-prompt prefix is prefilled once (and again only when the system
+    prompt changes). Turns with a session_id also keep their conversation's
+    cache in an LRU bounded by a memory budget, so each turn only prefills the
+    tokens after the longest prefix already in a cache. All methods that touch
+    the model must run on the LLM worker thread.
+    """
+
+    def __init__(self, model, tokenizer, max_sessions: int = 16, memory_budget_mb: float = 1024, history_turns: int = 6):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_sessions = max_sessions
+        self.memory_budget = int(memory_budget_mb * 1024 * 1024)
+        self.history_turns = history_turns
+        self.system_prompt = None
+        self.prefix_tokens = []
+        self.prefix_cache = None
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.prefix_builds = 0
+        self.session_hits = 0
+        self.evictions = 0
+        self.reused_tokens = 0
+        self.prefilled_tokens = 0
+
+    def build_prompt_tokens(self, system_prompt: str, history, question: str):
+        """Token ids for a turn using the tokenizer's chat template.
+
+        The system prompt is folded into the first user message rather than sent
+        as a system role: some templates (Mistral's) reject a system role or move
+        it next to the last user message, which would break prefix reuse.
+        """
+        messages = []
+        for user, assistant in history:
+            messages.append({"role": "user", "content": user})
+            messages.append({"role": "assistant", "content": assistant})
+        messages.append({"role": "user", "content": question})
+        messages[0] = {"role": "user", "content": f"{system_prompt}\n\n{messages[0]['content']}"}
+
+        if getattr(self.tokenizer, "chat_template", None):
+            return list(self.tokenizer.apply_chat_template(messages, add_generation_prompt=True))
+        # Plain completion models: keep the original Q/A format
+        prompt = f"{system_prompt}\n\n"
+        for user, assistant in history:
+            prompt += f"Q: {user}\nA: {assistant}\n"
+        prompt += f"Q: {question}\nA: "
+        return list(self.tokenizer.encode(prompt))
+
+    def _prefill(self, cache, tokens, step: int = 512):
+        remaining = mx.array(tokens)
+        while remaining.size > 0:
+            self.model(remaining[:step][None], cache=cache)
+            mx.eval([layer.state for layer in cache])
+            remaining = remaining[step:]
+
+    def set_system_prompt(self, system_prompt: str):
+        """Prefill the KV cache for the system-prompt prefix shared by every turn"""
+        # The shared prefix is whatever two different questions have in common
+        probe_a = self.build_prompt_tokens(system_prompt, [], "a")
+        probe_b = self.build_prompt_tokens(system_prompt, [], "b")
+        prefix = probe_a[:common_prefix_length(probe_a, probe_b)]
+
+        cache = make_prompt_cache(self.model)
+        self._prefill(cache, prefix)
+        with self._lock:
+            self.system_prompt = system_prompt
+            self.prefix_tokens = prefix
+            self.prefix_cache = cache
+            # Conversations were built on the old prompt
+            self._sessions.clear()
+            self.prefix_builds += 1
+        logger.info(f"Prefilled system prompt cache ({len(prefix)} tokens)")
+
+    @staticmethod
+    def _trim_to(cache, cached_length: int, keep: int):
+        """Trim a cache holding cached_length tokens down to its first keep tokens"""
+        if keep == cached_length:
+            return True
+        if not can_trim_prompt_cache(cache):
+            return False
+        trim_prompt_cache(cache, cached_length - keep)
+        return True
+
+    def prepare(self, system_prompt: str, question: str, session_id: str = None, reuse_cache: bool = True, augmented_question: str = None):
+        """Return (tokens still to prefill, prompt cache, commit callback) for a turn.
+
+        Call commit(answer) after generation to store the turn in the session.
+        augmented_question (the question with retrieved passages) replaces the
+        question in this turn's prompt only; the history keeps the bare question,
+        so later turns don't carry old passages. With reuse_cache=False the full
+        prompt is returned with an empty cache, for generators that cannot start
+        from an existing cache.
+        """
+        if system_prompt != self.system_prompt:
+            self.set_system_prompt(system_prompt)
+
+        with self._lock:
+            session = self._sessions.pop(session_id, None) if session_id else None
+        if session is None:
+            session = _Session()
+        tokens = self.build_prompt_tokens(system_prompt, session.history, augmented_question or question)
+
+        cache, cached_tokens = None, []
+        if not reuse_cache:
+            pass
+        elif session.cache is not None:
+            cache, cached_tokens = session.cache, session.tokens
+            self.session_hits += 1
+        elif self.prefix_cache is not None:
+            cache, cached_tokens = copy.deepcopy(self.prefix_cache), self.prefix_tokens
+
+        reuse = common_prefix_length(cached_tokens, tokens) if cache is not None else 0
+        # Generation needs at least one token to process
+        reuse = min(reuse, len(tokens) - 1)
+        if cache is None or not self._trim_to(cache, len(cached_tokens), reuse):
+            cache, reuse = make_prompt_cache(self.model), 0
+        self.reused_tokens += reuse
+        self.prefilled_tokens += len(tokens) - reuse
+
+        def commit(answer: str, final_cache=None, keep_cache: bool = True):
+            """Store the turn; final_cache replaces the generation cache if it was copied"""
+            if not session_id:
+                return
+            session.history = (session.history + [(question, answer)])[-self.history_turns:]
+            kept = final_cache if final_cache is not None else cache
+            # Drop generated tokens from the cache; next turn's template re-renders the answer
+            # (and the bare question, so a cache holding passages is trimmed back to where they start)
+            length = kept[0].offset if hasattr(kept[0], "offset") else len(tokens)
+            if keep_cache and (length <= len(tokens) or self._trim_to(kept, length, len(tokens))):
+                session.tokens = tokens
+                session.cache = kept
+                session.nbytes = cache_nbytes(kept)
+            else:
+                # Keep the history; the next turn prefills it again
+                session.tokens, session.cache, session.nbytes = [], None, 0
+            with self._lock:
+                self._sessions[session_id] = session
+                self._evict()
+
+        return tokens[reuse:], cache, commit
+
+    def _evict(self):
+        total = sum(session.nbytes for session in self._sessions.values())
+        while self._sessions and (len(self._sessions) > self.max_sessions or total > self.memory_budget):
+            _, session = self._sessions.popitem(last=False)
+            total -= session.nbytes
+            self.evictions += 1
+
+    def has_history(self, session_id: str):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            return bool(session is not None and session.history)
+
+    def record_turn(self, session_id: str, question: str, answer: str):
+        """Add a turn answered without the model (e.g. from a cache) to a session's history"""
+        with self._lock:
+            session = self._sessions.pop(session_id, None) or _Session()
+            # The cached tokens stay a valid prefix of the next turn's prompt
+            session.history = (session.history + [(question, answer)])[-self.history_turns:]
+            self._sessions[session_id] = session
+            self._evict()
+
+    def drop_session(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "prefix_tokens": len(self.prefix_tokens),
+                "prefix_builds": self.prefix_builds,
+                "sessions": len(self._sessions),
+                "session_bytes": sum(session.nbytes for session in self._sessions.values()),
+                "memory_budget_bytes": self.memory_budget,
+                "session_hits": self.session_hits,
+                "evictions": self.evictions,
+                "reused_tokens": self.reused_tokens,
+                "prefilled_tokens": self.prefilled_tokens,
+            }
@@ -0,0 +1,344 @@
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import soundfile as sf
+
+# Content-addressed TTS files; the only audio files the app writes to the outputs folder
+TTS_CACHE_PREFIX = "ttscache_"
+
+
+def normalize_question(text: str):
+    """Fold case, punctuation and whitespace so trivially different transcriptions share a key"""
+    text = re.sub(r"[^\w\s']", " ", text.lower())
+    return " ".join(text.split())
+
+
+def text_fingerprint(text: str):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class AnswerCache:
+    """Exact-match LLM answers keyed by (normalized question, system prompt hash, model, context).
+
+    context is whatever else the answer was based on, such as the knowledge
+    base version, so answers given before it changed are never returned.
+    Bounded by max_entries with LRU eviction; entries older than ttl_seconds
+    are dropped on access. invalidate() clears everything, e.g. when the system
+    prompt changes.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl_seconds: float = 86400):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self.expired = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def key(question: str, system_prompt: str, model: str, context=None):
+        return (normalize_question(question), text_fingerprint(system_prompt), model, context)
+
+    def get(self, question: str, system_prompt: str, model: str, context=None):
+        key = self.key(question, system_prompt, model, context)
+        with self._lock:
+            item = self._entries.get(key)
+            if item is not None and time.monotonic() - item[1] > self.ttl_seconds:
+                del self._entries[key]
+                self.expired += 1
+                item = None
+            if item is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, question: str, system_prompt: str, model: str, answer: str, context=None):
+        key = self.key(question, system_prompt, model, context)
+        if not key[0]:
+            return
+        with self._lock:
+            self._entries[key] = (answer, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evicted += 1
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evicted": self.evicted,
+                "expired": self.expired,
+                "invalidations": self.invalidations,
+            }
+
+
+class AudioBufferCache:
+    """In-memory TTS audio by filename: float32 samples plus their encodings.
+
+    Holds what /audio/, /play and replays need without going back to disk.
+    Encodings (16-bit WAV, Opus) are produced on first request and kept next
+    to the samples. Bounded by max_bytes across samples and encodings, with
+    LRU eviction of whole entries.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        # filename -> {"audio": float32 array, "encoded": {format: bytes}, "bytes": total size}
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self.encodes = 0
+
+    def __contains__(self, name):
+        with self._lock:
+            return name in self._entries
+
+    def _drop(self, name: str):
+        entry = self._entries.pop(name)
+        self._bytes -= entry["bytes"]
+
+    def _evict(self):
+        while self._entries and self._bytes > self.max_bytes:
+            self._drop(next(iter(self._entries)))
+            self.evicted += 1
+
+    def put(self, name: str, audio: np.ndarray):
+        audio = np.ascontiguousarray(audio, dtype=np.float32)
+        with self._lock:
+            if name in self._entries:
+                self._drop(name)
+            self._entries[name] = {"audio": audio, "encoded": {}, "bytes": audio.nbytes}
+            self._bytes += audio.nbytes
+            self._evict()
+
+    def get(self, name: str):
+        """Return the float32 samples for name, or None"""
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(name)
+            self.hits += 1
+            return entry["audio"]
+
+    def encoded(self, name: str, fmt: str, encode):
+        """Return name's audio encoded as fmt, calling encode(audio) once per format; None if not cached.
+
+        Encoding runs outside the lock, so call this from a worker thread.
+        """
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(name)
+            self.hits += 1
+            data = entry["encoded"].get(fmt)
+            audio = entry["audio"]
+        if data is not None:
+            return data
+        data = encode(audio)
+        with self._lock:
+            self.encodes += 1
+            # Still cached and nobody encoded it meanwhile: keep the bytes with the entry
+            if self._entries.get(name) is entry and fmt not in entry["encoded"]:
+                entry["encoded"][fmt] = data
+                entry["bytes"] += len(data)
+                self._bytes += len(data)
+                self._evict()
+        return data
+
+    def discard(self, name: str):
+        with self._lock:
+            if name in self._entries:
+                self._drop(name)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evicted": self.evicted,
+                "encodes": self.encodes,
+            }
+
+
+class TTSCache:
+    """Content-addressed WAV files for synthesized text.
+
+    The filename is a hash of (text, voice, speed), so the same sentence is
+    only ever synthesized once. Files live in folder and are indexed at startup,
+    so the cache survives restarts. Keys depend only on the spoken text, so a
+    system prompt change cannot make an entry stale. Eviction is LRU by entry
+    count and total bytes, plus a TTL. With buffers, recently used audio is
+    also kept in memory: remember() makes an entry usable before its file is
+    written and load() skips the disk read. File I/O is blocking; call lookup,
+    load and store from a worker thread.
+    """
+
+    def __init__(self, folder: str, sample_rate: int, max_entries: int = 2000, max_bytes: int = 500 * 1024 * 1024, ttl_seconds: float = 7 * 86400, buffers: AudioBufferCache = None):
+        self.folder = folder
+        self.buffers = buffers
+        self.sample_rate = sample_rate
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        # filename -> (size in bytes, last used as a wall-clock time)
+        self._files = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self._index()
+
+    def _index(self):
+        found = []
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                if entry.name.startswith(TTS_CACHE_PREFIX) and entry.name.endswith(".wav"):
+                    stat = entry.stat()
+                    found.append((stat.st_mtime, entry.name, stat.st_size))
+        for mtime, name, size in sorted(found):
+            self._files[name] = (size, mtime)
+            self._bytes += size
+        with self._lock:
+            self._evict(time.time())
+
+    @staticmethod
+    def filename(text: str, voice: str, speed: float):
+        digest = text_fingerprint(f"{voice}\0{float(speed)}\0{text.strip()}")
+        return f"{TTS_CACHE_PREFIX}{digest[:32]}.wav"
+
+    def _remove(self, name: str):
+        size, _ = self._files.pop(name)
+        self._bytes -= size
+        if self.buffers is not None:
+            self.buffers.discard(name)
+        try:
+            os.unlink(os.path.join(self.folder, name))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self, now: float):
+        for name, (_, used) in list(self._files.items()):
+            if now - used <= self.ttl_seconds:
+                break
+            self._remove(name)
+            self.evicted += 1
+        while self._files and (len(self._files) > self.max_entries or self._bytes > self.max_bytes):
+            self._remove(next(iter(self._files)))
+            self.evicted += 1
+
+    def lookup(self, text: str, voice: str, speed: float):
+        """Return the cached filename for the text, or None"""
+        name = self.filename(text, voice, speed)
+        now = time.time()
+        with self._lock:
+            item = self._files.get(name)
+            if item is not None and now - item[1] > self.ttl_seconds:
+                self._remove(name)
+                self.evicted += 1
+                item = None
+            if item is None and self.buffers is not None and name in self.buffers:
+                # Remembered, its file is still being written
+                self.hits += 1
+                return name
+            if item is None or not os.path.exists(os.path.join(self.folder, name)):
+                if item is not None:
+                    self._files.pop(name)
+                    self._bytes -= item[0]
+                self.misses += 1
+                return None
+            self._files[name] = (item[0], now)
+            self._files.move_to_end(name)
+            self.hits += 1
+            return name
+
+    def load(self, text: str, voice: str, speed: float):
+        """Return the cached float32 audio for the text, or None"""
+        name = self.lookup(text, voice, speed)
+        if name is None:
+            return None
+        if self.buffers is not None:
+            audio = self.buffers.get(name)
+            if audio is not None:
+                return audio
+        try:
+            audio, _ = sf.read(os.path.join(self.folder, name), dtype="float32")
+        except Exception:
+            return None
+        if self.buffers is not None:
+            self.buffers.put(name, audio)
+        return audio
+
+    def remember(self, text: str, voice: str, speed: float, audio: np.ndarray):
+        """Keep audio for the text in memory and return its filename; store() persists it"""
+        name = self.filename(text, voice, speed)
+        if self.buffers is not None:
+            self.buffers.put(name, audio)
+        return name
+
+    def store(self, text: str, voice: str, speed: float, audio: np.ndarray):
+        """Write audio for the text (atomically) and return its filename"""
+        name = self.remember(text, voice, speed, audio)
+        path = os.path.join(self.folder, name)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        sf.write(temp_path, audio, self.sample_rate, format="WAV")
+        os.replace(temp_path, path)
+        size = os.path.getsize(path)
+        now = time.time()
+        with self._lock:
+            previous = self._files.pop(name, None)
+            if previous is not None:
+                self._bytes -= previous[0]
+            self._files[name] = (size, now)
+            self._bytes += size
+            self._evict(now)
+        return name
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "files": len(self._files),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evicted": self.evicted,
+            }
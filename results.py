@@ -0,0 +1,103 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResultsStore:
+    """Dict-like store for per-turn results with a size cap, TTL and LRU eviction.
+
+    Entries older than ttl_seconds are dropped on access and by expire(). When
+    the store is full the least recently used completed entry is evicted first;
+    in-flight entries are only evicted if every entry is still in flight.
+    """
+
+    def __init__(self, max_entries: int = 500, ttl_seconds: float = 3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._created = {}
+        self._lock = threading.Lock()
+        self.expired = 0
+        self.evicted = 0
+
+    def _is_expired(self, key, now):
+        return now - self._created[key] > self.ttl_seconds
+
+    def _drop(self, key):
+        self._entries.pop(key, None)
+        self._created.pop(key, None)
+
+    def _evict_one(self):
+        victim = next(
+            (key for key, entry in self._entries.items() if entry.get("completed")),
+            next(iter(self._entries)),
+        )
+        self._drop(victim)
+        self.evicted += 1
+
+    def __contains__(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return False
+            if self._is_expired(key, time.monotonic()):
+                self._drop(key)
+                self.expired += 1
+                return False
+            return True
+
+    def __getitem__(self, key):
+        with self._lock:
+            if key in self._entries and self._is_expired(key, time.monotonic()):
+                self._drop(key)
+                self.expired += 1
+            entry = self._entries[key]
+            self._entries.move_to_end(key)
+            return entry
+
+    def __setitem__(self, key, entry):
+        with self._lock:
+            if key not in self._entries:
+                while len(self._entries) >= self.max_entries:
+                    self._evict_one()
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            self._created[key] = time.monotonic()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def setdefault(self, key, default):
+        entry = self.get(key)
+        if entry is None:
+            self[key] = default
+            entry = default
+        return entry
+
+    def values(self):
+        with self._lock:
+            return list(self._entries.values())
+
+    def expire(self):
+        """Drop every entry past its TTL and return how many were removed"""
+        now = time.monotonic()
+        with self._lock:
+            stale = [key for key in self._entries if self._is_expired(key, now)]
+            for key in stale:
+                self._drop(key)
+            self.expired += len(stale)
+        return len(stale)
+
+    def stats(self):
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "expired": self.expired,
+            "evicted": self.evicted,
+        }
@@ -13,12 +13,31 @@ document.addEventListener('DOMContentLoaded', function() {
     const stopButton = document.getElementById('stop-button');
     const modelInfoSpan = document.querySelector('.model-info span');
     
+    // Identifies this page's conversation so the server can reuse its history. Only set
+    // when conversation_memory is on: otherwise every question is answered on its own,
+    // so a page left open (a kiosk) doesn't carry one visitor's turns into the next one's
+    let sessionId = null;
+    // The turn being answered, for cancelling it when there is no session
+    let currentTranscriptionId = null;
+    
+    function newSessionId() {
+        return (window.crypto && crypto.randomUUID)
+            ? crypto.randomUUID()
+            : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+    }
+    
     // Configuration elements
     const configButton = document.getElementById('configButton');
     const configModal = document.getElementById('configModal');
     const closeModal = document.getElementById('closeModal');
     const configForm = document.getElementById('configForm');
     const systemPromptTextarea = document.getElementById('systemPrompt');
+    const modelInputs = {
+        whisper_model: document.getElementById('whisperModel'),
+        whisper_small_model: document.getElementById('whisperSmallModel'),
+        llm_model: document.getElementById('llmModel'),
+        tts_model: document.getElementById('ttsModel')
+    };
     
     // Track modal state
     let isModalOpen = false;
@@ -33,6 +52,10 @@ document.addEventListener('DOMContentLoaded', function() {
     let stream;
     let currentTtsFilename = null;
     
+    // Browser-side playback of streamed TTS chunks
+    let streamAudioContext = null;
+    let streamPlayhead = 0;
+    
     // VAD-specific variables
     let vadSocket = null;
     let vadActive = false;
@@ -40,6 +63,19 @@ document.addEventListener('DOMContentLoaded', function() {
     let vadProcessor = null;
     let vadRecordingStartTime = null;
     let vadAudioChunks = [];
+    // When set, the server keeps the utterance audio from the VAD stream and runs the
+    // whole turn itself, so nothing is re-uploaded when speech ends
+    let serverCapture = false;
+    
+    // How spacebar recordings are uploaded: Opus through MediaRecorder when both the
+    // browser and the server support it, otherwise 16-bit PCM WAV at 16 kHz
+    const UPLOAD_SAMPLE_RATE = 16000;
+    const OPUS_BITS_PER_SECOND = 32000;
+    const OPUS_UPLOAD_TYPES = {
+        'webm-opus': 'audio/webm;codecs=opus',
+        'ogg-opus': 'audio/ogg;codecs=opus'
+    };
+    let uploadFormat = { name: 'pcm16', mimeType: null };
     
     // Load initial configuration
     loadConfiguration();
@@ -50,6 +86,13 @@ document.addEventListener('DOMContentLoaded', function() {
             const response = await fetch('/config/');
             const config = await response.json();
             systemPromptTextarea.value = config.system_prompt;
+            for (const [key, input] of Object.entries(modelInputs)) {
+                input.value = config[key] || '';
+            }
+            serverCapture = Boolean(config.vad_server_capture);
+            sessionId = config.conversation_memory ? (sessionId || newSessionId()) : null;
+            uploadFormat = chooseUploadFormat(config.upload_format || 'auto', config.upload_formats || ['pcm16']);
+            console.log('Upload format:', uploadFormat.name);
         } catch (error) {
             console.error('Error loading configuration:', error);
         }
@@ -60,6 +103,9 @@ document.addEventListener('DOMContentLoaded', function() {
         
         const formData = new FormData();
         formData.append('system_prompt', systemPromptTextarea.value);
+        for (const [key, input] of Object.entries(modelInputs)) {
+            formData.append(key, input.value.trim());
+        }
         
         try {
             const response = await fetch('/config/', {
@@ -109,13 +155,76 @@ document.addEventListener('DOMContentLoaded', function() {
     
     configForm.addEventListener('submit', saveConfiguration);
     
+    // Pick the first upload format the server decodes and this browser can record.
+    // preference is the upload_format setting: "auto", "opus" or "pcm16"
+    function chooseUploadFormat(preference, serverFormats) {
+        if (preference !== 'pcm16' && window.MediaRecorder && MediaRecorder.isTypeSupported) {
+            for (const [name, mimeType] of Object.entries(OPUS_UPLOAD_TYPES)) {
+                if (serverFormats.includes(name) && MediaRecorder.isTypeSupported(mimeType)) {
+                    return { name, mimeType };
+                }
+            }
+        }
+        return { name: 'pcm16', mimeType: null };
+    }
+    
+    // Records raw samples with Web Audio and hands over a 16 kHz 16-bit WAV when stopped;
+    // the same start()/stop()/state interface as MediaRecorder
+    function createPcmRecorder(stream, onStop) {
+        let context = null;
+        let processor = null;
+        let chunks = [];
+        const recorder = { state: 'inactive' };
+        
+        recorder.start = () => {
+            context = new (window.AudioContext || window.webkitAudioContext)({ sampleRate: UPLOAD_SAMPLE_RATE });
+            const source = context.createMediaStreamSource(stream);
+            processor = context.createScriptProcessor(4096, 1, 1);
+            chunks = [];
+            processor.onaudioprocess = event => {
+                chunks.push(new Float32Array(event.inputBuffer.getChannelData(0)));
+            };
+            source.connect(processor);
+            processor.connect(context.destination);
+            recorder.state = 'recording';
+        };
+        
+        recorder.stop = () => {
+            processor.disconnect();
+            // The browser may not honour the requested rate
+            const sampleRate = context.sampleRate;
+            context.close();
+            recorder.state = 'inactive';
+            onStop(float32ArrayToWavBlob(downsampleTo16k(concatFloat32(chunks), sampleRate), UPLOAD_SAMPLE_RATE));
+        };
+        
+        return recorder;
+    }
+    
+    function finishRecording(audioBlob) {
+        // Show loading animation when processing starts
+        loadingAnimation.classList.remove('hidden');
+        
+        // Send audio to server for transcription
+        sendAudioForTranscription(audioBlob);
+    }
+    
     // Set up the audio recording
     async function setupAudioRecording() {
         try {
             stream = await navigator.mediaDevices.getUserMedia({ audio: true });
             
+            if (!uploadFormat.mimeType) {
+                mediaRecorder = createPcmRecorder(stream, finishRecording);
+                console.log('Audio recording setup complete');
+                return;
+            }
+            
             // Initialize the media recorder with audio stream
-            mediaRecorder = new MediaRecorder(stream);
+            mediaRecorder = new MediaRecorder(stream, {
+                mimeType: uploadFormat.mimeType,
+                audioBitsPerSecond: OPUS_BITS_PER_SECOND
+            });
             
             // Handle data available event (when audio data becomes available)
             mediaRecorder.addEventListener('dataavailable', event => {
@@ -125,16 +234,12 @@ document.addEventListener('DOMContentLoaded', function() {
             // Handle recording stop event
             mediaRecorder.addEventListener('stop', () => {
                 // Create a blob from the audio chunks
-                const audioBlob = new Blob(audioChunks, { type: 'audio/wav' });
+                const audioBlob = new Blob(audioChunks, { type: mediaRecorder.mimeType });
                 
                 // Clear audio chunks for next recording
                 audioChunks = [];
                 
-                // Show loading animation when processing starts
-                loadingAnimation.classList.remove('hidden');
-                
-                // Send audio to server for transcription
-                sendAudioForTranscription(audioBlob);
+                finishRecording(audioBlob);
             });
             
             console.log('Audio recording setup complete');
@@ -206,7 +311,9 @@ document.addEventListener('DOMContentLoaded', function() {
     // Send audio to the server for transcription
     async function sendAudioForTranscription(audioBlob) {
         const formData = new FormData();
-        formData.append('file', audioBlob, 'recording.wav');
+        const extension = audioBlob.type.startsWith('audio/webm') ? 'webm' : audioBlob.type.startsWith('audio/ogg') ? 'ogg' : 'wav';
+        formData.append('file', audioBlob, `recording.${extension}`);
+        if (sessionId) formData.append('session_id', sessionId);
         
         try {
             resultDiv.textContent = 'Transcribing...';
@@ -231,9 +338,9 @@ document.addEventListener('DOMContentLoaded', function() {
                 // Display the transcription result
                 resultDiv.textContent = data.text || 'No transcription returned';
                 
-                // Always poll for LLM response if transcription_id is available
+                // Always stream the LLM response if transcription_id is available
                 if (data.transcription_id) {
-                    pollForLLMResponse(data.transcription_id);
+                    streamLLMResponse(data.transcription_id);
                 } else {
                     // If no LLM processing needed, hide loading animation
                     loadingAnimation.style.display = 'none';
@@ -241,7 +348,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 }
             } else {
                 // Display error message
-                resultDiv.textContent = `Error: ${data.error || 'Unknown error'}`;
+                resultDiv.textContent = `Error: ${errorMessage(data)}`;
                 loadingAnimation.style.display = 'none';
                 loadingAnimation.classList.add('hidden');
                 console.error('Transcription error:', data.error);
@@ -265,7 +372,11 @@ document.addEventListener('DOMContentLoaded', function() {
         
         // Create new WebSocket connection
         const wsProtocol = window.location.protocol === 'https:' ? 'wss://' : 'ws://';
-        vadSocket = new WebSocket(`${wsProtocol}${window.location.host}/vad-stream/`);
+        const query = new URLSearchParams();
+        if (sessionId) query.set('session_id', sessionId);
+        if (serverCapture) query.set('capture', '1');
+        vadSocket = new WebSocket(`${wsProtocol}${window.location.host}/vad-stream/?${query}`);
+        vadSocket.binaryType = 'arraybuffer';
         
         // Setup event handlers
         vadSocket.onopen = () => {
@@ -275,7 +386,16 @@ document.addEventListener('DOMContentLoaded', function() {
         vadSocket.onmessage = (event) => {
             const data = JSON.parse(event.data);
             
-            if (data.status === 'speech_state') {
+            if (data.status === 'speech_state' && serverCapture) {
+                // The server records and processes the utterance; only mirror its state in the UI
+                if (data.speech_detected && !isRecording && vadActive) {
+                    startVADRecording();
+                } else if (!data.speech_detected && isRecording && vadActive) {
+                    isRecording = false;
+                    statusIndicator.classList.remove('recording');
+                    recordingStatus.classList.add('hidden');
+                }
+            } else if (data.status === 'speech_state') {
                 // Handle speech detection state changes
                 if (data.speech_detected && !isRecording && vadActive) {
                     // Start recording immediately when speech is detected
@@ -289,6 +409,26 @@ document.addEventListener('DOMContentLoaded', function() {
                         stopVADRecording();
                     }, 150);
                 }
+            } else if (data.status === 'transcribing') {
+                resultDiv.textContent = 'Transcribing...';
+                loadingAnimation.style.display = 'flex';
+                loadingAnimation.classList.remove('hidden');
+            } else if (data.status === 'partial_transcript') {
+                // Committed words never change; the tentative tail may still be revised
+                resultDiv.textContent = data.committed ? `${data.committed} ` : '';
+                if (data.tentative) {
+                    const tentative = document.createElement('span');
+                    tentative.className = 'tentative';
+                    tentative.textContent = data.tentative;
+                    resultDiv.appendChild(tentative);
+                }
+            } else if (data.status === 'transcription') {
+                currentTranscriptionId = data.transcription_id;
+                resultDiv.textContent = data.text || 'No transcription returned';
+                llmResponseDiv.textContent = '';
+            } else if (responseHandlers[data.status]) {
+                // Turn results pushed over the same socket (server capture mode)
+                responseHandlers[data.status](data);
             }
         };
         
@@ -356,7 +496,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 const rms = calculateRMS(processedData);
                 
                 // If we're recording with VAD, store the audio chunk
-                if (isRecording && vadActive) {
+                if (isRecording && vadActive && !serverCapture) {
                     vadAudioChunks.push(new Float32Array(processedData));
                 }
                 
@@ -367,14 +507,14 @@ document.addEventListener('DOMContentLoaded', function() {
                     // Only send if the volume is above threshold to reduce false positives
                     // But don't apply this when we're already recording to avoid cutting out softer speech
                     // Use a lower threshold for initial detection
-                    if (isRecording || rms > VOLUME_THRESHOLD) {
-                        // Send audio data to server for VAD processing
-                        const arrayBuffer = processedData.buffer;
-                        const base64Data = arrayBufferToBase64(arrayBuffer);
+                    // In server capture mode every frame is sent so the server has the complete utterance
+                    if (serverCapture || isRecording || rms > VOLUME_THRESHOLD) {
+                        // Send audio data to server for VAD processing as a binary int16 frame
+                        const frame = float32ToInt16Frame(processedData, vadAudioContext.sampleRate);
                         
                         // Send to server if connection is open
                         if (vadSocket.readyState === WebSocket.OPEN) {
-                            vadSocket.send(base64Data);
+                            vadSocket.send(frame);
                         }
                     }
                 }
@@ -421,11 +561,21 @@ document.addEventListener('DOMContentLoaded', function() {
         return result;
     }
     
-    // Convert ArrayBuffer to Base64 string
-    function arrayBufferToBase64(buffer) {
-        const bytes = new Uint8Array(buffer);
-        const binary = bytes.reduce((acc, byte) => acc + String.fromCharCode(byte), '');
-        return window.btoa(binary);
+    // Binary VAD frame: 8-byte header (u8 format, u8 version, u16 reserved, u32 sample rate)
+    // followed by little-endian PCM samples
+    const FRAME_HEADER_BYTES = 8;
+    const FRAME_VERSION = 1;
+    const FRAME_FORMAT_INT16 = 1;
+    
+    function float32ToInt16Frame(samples, sampleRate) {
+        const buffer = new ArrayBuffer(FRAME_HEADER_BYTES + samples.length * 2);
+        const view = new DataView(buffer);
+        view.setUint8(0, FRAME_FORMAT_INT16);
+        view.setUint8(1, FRAME_VERSION);
+        view.setUint16(2, 0, true);
+        view.setUint32(4, sampleRate, true);
+        floatTo16BitPCM(view, FRAME_HEADER_BYTES, samples);
+        return buffer;
     }
     
     // Start recording with VAD
@@ -467,16 +617,10 @@ document.addEventListener('DOMContentLoaded', function() {
         const recordingDuration = (Date.now() - vadRecordingStartTime) / 1000;
         if (vadAudioChunks.length > 0 && recordingDuration > 0.3) {  // Reduced minimum from 0.5 to 0.3 seconds
             // Concatenate all audio chunks
-            let allAudio = new Float32Array(vadAudioChunks.reduce((acc, chunk) => acc + chunk.length, 0));
-            let offset = 0;
-            
-            vadAudioChunks.forEach(chunk => {
-                allAudio.set(chunk, offset);
-                offset += chunk.length;
-            });
+            const allAudio = concatFloat32(vadAudioChunks);
             
-            // Convert to WAV
-            const wavBlob = float32ArrayToWavBlob(allAudio, 16000);
+            // Convert to a 16-bit WAV at exactly 16 kHz, whatever rate the AudioContext runs at
+            const wavBlob = float32ArrayToWavBlob(downsampleTo16k(allAudio, vadAudioContext ? vadAudioContext.sampleRate : UPLOAD_SAMPLE_RATE), UPLOAD_SAMPLE_RATE);
             
             // Send to server for processing
             sendVADAudioForProcessing(wavBlob);
@@ -487,7 +631,35 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
     
-    // Convert Float32Array to WAV blob
+    function concatFloat32(chunks) {
+        const all = new Float32Array(chunks.reduce((acc, chunk) => acc + chunk.length, 0));
+        let offset = 0;
+        chunks.forEach(chunk => {
+            all.set(chunk, offset);
+            offset += chunk.length;
+        });
+        return all;
+    }
+    
+    // Resample to UPLOAD_SAMPLE_RATE, averaging the input samples behind each output
+    // sample so higher rates don't alias
+    function downsampleTo16k(samples, sampleRate) {
+        if (sampleRate === UPLOAD_SAMPLE_RATE) return samples;
+        const ratio = sampleRate / UPLOAD_SAMPLE_RATE;
+        const output = new Float32Array(Math.floor(samples.length / ratio));
+        for (let i = 0; i < output.length; i++) {
+            const start = Math.floor(i * ratio);
+            const end = Math.min(samples.length, Math.max(start + 1, Math.floor((i + 1) * ratio)));
+            let sum = 0;
+            for (let j = start; j < end; j++) {
+                sum += samples[j];
+            }
+            output[i] = sum / (end - start);
+        }
+        return output;
+    }
+    
+    // Convert Float32Array to a 16-bit PCM WAV blob
     function float32ArrayToWavBlob(samples, sampleRate) {
         const numChannels = 1;
         const bitsPerSample = 16;
@@ -540,6 +712,7 @@ document.addEventListener('DOMContentLoaded', function() {
     async function sendVADAudioForProcessing(wavBlob) {
         const formData = new FormData();
         formData.append('file', wavBlob, 'vad_recording.wav');
+        if (sessionId) formData.append('session_id', sessionId);
         
         try {
             resultDiv.textContent = 'Transcribing...';
@@ -555,9 +728,9 @@ document.addEventListener('DOMContentLoaded', function() {
                 // Display the transcription result
                 resultDiv.textContent = data.text || 'No transcription returned';
                 
-                // Always poll for LLM response if transcription_id is available
+                // Always stream the LLM response if transcription_id is available
                 if (data.transcription_id) {
-                    pollForLLMResponse(data.transcription_id);
+                    streamLLMResponse(data.transcription_id);
                 } else {
                     // If no LLM processing needed, hide loading animation
                     loadingAnimation.style.display = 'none';
@@ -565,7 +738,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 }
             } else {
                 // Display error message
-                resultDiv.textContent = `Error: ${data.error || 'Unknown error'}`;
+                resultDiv.textContent = `Error: ${errorMessage(data)}`;
                 loadingAnimation.style.display = 'none';
                 loadingAnimation.classList.add('hidden');
                 console.error('VAD transcription error:', data.error);
@@ -605,6 +778,160 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     });
     
+    // Handlers for streamed turn events, shared by the SSE stream and the VAD WebSocket
+    const responseHandlers = {
+        token(data) {
+            llmResponseContainer.classList.remove('hidden');
+            llmResponseDiv.textContent += data.text;
+        },
+        
+        llm_done(data) {
+            llmResponseContainer.classList.remove('hidden');
+            llmResponseDiv.textContent = data.llm_response;
+        },
+        
+        // Sentence-by-sentence TTS audio, sent while the rest of the answer is still generating
+        audio(data) {
+            if (data.playback === 'browser' && playAudioCheckbox.checked) {
+                if (data.index === 0) {
+                    loadingAnimation.style.display = 'none';
+                    loadingAnimation.classList.add('hidden');
+                }
+                playPcmChunk(data.pcm, data.sample_rate);
+            }
+        },
+        
+        done(data) {
+            handleTtsResult(data.tts_filename, data.audio_streamed);
+        },
+        
+        error(data) {
+            llmResponseContainer.classList.remove('hidden');
+            llmResponseDiv.textContent = errorMessage(data);
+            loadingAnimation.style.display = 'none';
+            loadingAnimation.classList.add('hidden');
+            console.error('LLM response error:', data.error);
+        },
+        
+        // The turn was interrupted (barge-in, a newer question or the stop button)
+        cancelled(data) {
+            stopStreamedAudio();
+            loadingAnimation.style.display = 'none';
+            loadingAnimation.classList.add('hidden');
+        }
+    };
+    
+    // Stream LLM tokens and the TTS result over server-sent events,
+    // falling back to polling if the stream can't be opened
+    function streamLLMResponse(transcriptionId) {
+        currentTranscriptionId = transcriptionId;
+        if (!window.EventSource) {
+            pollForLLMResponse(transcriptionId);
+            return;
+        }
+        
+        const source = new EventSource(`/stream_response/${transcriptionId}`);
+        let receivedAny = false;
+        
+        llmResponseDiv.textContent = '';
+        
+        ['token', 'llm_done', 'audio'].forEach((name) => {
+            source.addEventListener(name, (event) => {
+                receivedAny = true;
+                responseHandlers[name](JSON.parse(event.data));
+            });
+        });
+        
+        source.addEventListener('done', (event) => {
+            source.close();
+            responseHandlers.done(JSON.parse(event.data));
+        });
+        
+        source.addEventListener('cancelled', (event) => {
+            source.close();
+            responseHandlers.cancelled(JSON.parse(event.data));
+        });
+        
+        // Named 'error' events come from the server; plain errors are connection failures
+        source.addEventListener('error', (event) => {
+            source.close();
+            if (event.data) {
+                responseHandlers.error(JSON.parse(event.data));
+            } else if (!receivedAny) {
+                console.warn('LLM stream unavailable, falling back to polling');
+                pollForLLMResponse(transcriptionId);
+            } else {
+                console.error('LLM stream interrupted');
+                loadingAnimation.style.display = 'none';
+                loadingAnimation.classList.add('hidden');
+            }
+        });
+    }
+    
+    // Schedule a base64 16-bit PCM chunk right after the previously queued one
+    function playPcmChunk(base64Pcm, sampleRate) {
+        if (!streamAudioContext) {
+            streamAudioContext = new (window.AudioContext || window.webkitAudioContext)();
+        }
+        
+        const binary = window.atob(base64Pcm);
+        const bytes = new Uint8Array(binary.length);
+        for (let i = 0; i < binary.length; i++) {
+            bytes[i] = binary.charCodeAt(i);
+        }
+        const pcm = new Int16Array(bytes.buffer);
+        
+        const buffer = streamAudioContext.createBuffer(1, pcm.length, sampleRate);
+        const channel = buffer.getChannelData(0);
+        for (let i = 0; i < pcm.length; i++) {
+            channel[i] = pcm[i] / 32768;
+        }
+        
+        const source = streamAudioContext.createBufferSource();
+        source.buffer = buffer;
+        source.connect(streamAudioContext.destination);
+        
+        const startAt = Math.max(streamAudioContext.currentTime, streamPlayhead);
+        source.start(startAt);
+        streamPlayhead = startAt + buffer.duration;
+    }
+    
+    // The server sends retry_after (seconds) when it is too busy to take the request
+    function errorMessage(data) {
+        const message = data.error || 'Unknown error';
+        return data.retry_after ? `${message} (busy, try again in ${data.retry_after}s)` : message;
+    }
+    
+    // Drop streamed sentences that are still scheduled to play
+    function stopStreamedAudio() {
+        if (streamAudioContext) {
+            streamAudioContext.close();
+            streamAudioContext = null;
+        }
+        streamPlayhead = 0;
+    }
+    
+    // Show audio controls for a finished TTS file and auto-play it if enabled.
+    // alreadyPlayed means the server queued the audio sentence by sentence.
+    function handleTtsResult(ttsFilename, alreadyPlayed) {
+        if (ttsFilename) {
+            currentTtsFilename = ttsFilename;
+            audioControls.classList.remove('hidden');
+            
+            // If auto-play is enabled, play the audio immediately
+            if (playAudioCheckbox.checked && !alreadyPlayed) {
+                playTtsAudio(); // This will hide the loading animation when audio starts
+            } else {
+                // Only hide loading if not auto-playing
+                loadingAnimation.style.display = 'none';
+                loadingAnimation.classList.add('hidden');
+            }
+        } else {
+            loadingAnimation.style.display = 'none';
+            loadingAnimation.classList.add('hidden');
+        }
+    }
+    
     // Poll for LLM response and TTS result
     async function pollForLLMResponse(transcriptionId, attempt = 0) {
         try {
@@ -645,22 +972,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 llmResponseDiv.textContent = data.llm_response;
                 
                 // Handle TTS if available
-                if (data.tts_filename) {
-                    currentTtsFilename = data.tts_filename;
-                    audioControls.classList.remove('hidden');
-                    
-                    // If auto-play is enabled, play the audio immediately
-                    if (playAudioCheckbox.checked) {
-                        playTtsAudio(); // This will hide the loading animation when audio starts
-                    } else {
-                        // Only hide loading if not auto-playing
-                        loadingAnimation.style.display = 'none';
-                        loadingAnimation.classList.add('hidden');
-                    }
-                } else {
-                    loadingAnimation.style.display = 'none';
-                    loadingAnimation.classList.add('hidden');
-                }
+                handleTtsResult(data.tts_filename, data.audio_streamed);
             } else {
                 // This should rarely happen as we handle all states above
                 llmResponseDiv.textContent = 'No response from LLM';
@@ -705,6 +1017,21 @@ document.addEventListener('DOMContentLoaded', function() {
     
     // Stop TTS audio
     async function stopTtsAudio() {
+        stopStreamedAudio();
+        try {
+            // Also stop generating the rest of the answer
+            const cancelData = new FormData();
+            if (sessionId) {
+                cancelData.append('session_id', sessionId);
+            } else if (currentTranscriptionId) {
+                cancelData.append('transcription_id', currentTranscriptionId);
+            }
+            if (sessionId || currentTranscriptionId) {
+                await fetch('/cancel', { method: 'POST', body: cancelData });
+            }
+        } catch (error) {
+            console.error('Error cancelling turn:', error);
+        }
         try {
             const response = await fetch('/stop', {
                 method: 'POST'
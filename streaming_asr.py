@@ -0,0 +1,115 @@
+import re
+
+import numpy as np
+
+
+def _normalize(word: str):
+    return re.sub(r"[^\w']", "", word.lower())
+
+
+class LocalAgreementTranscriber:
+    """Incremental Whisper transcription of one utterance (LocalAgreement-2).
+
+    Audio is appended as it arrives and the current window is re-decoded every
+    step_seconds of new audio. Words on which two consecutive hypotheses agree
+    are committed and never change; the rest is reported as tentative. Once the
+    window grows past trim_seconds it is cut at the end of the last committed
+    word and the committed text is passed to Whisper as the prompt, so at
+    end-of-speech only the short unstable tail needs decoding.
+
+    decode_fn(audio, initial_prompt) must return a list of (word, start, end)
+    tuples with times in seconds relative to the start of audio. window(),
+    decode() and update() are split so decoding can run on a worker thread
+    while new audio keeps arriving on the event loop.
+    """
+
+    def __init__(self, decode_fn, sample_rate: int = 16000, step_seconds: float = 1.0, trim_seconds: float = 4.0):
+        self.decode_fn = decode_fn
+        self.sample_rate = sample_rate
+        self.step_samples = int(step_seconds * sample_rate)
+        self.trim_samples = int(trim_seconds * sample_rate)
+        self._chunks = []
+        self.audio = np.zeros(0, dtype=np.float32)
+        # Seconds of the utterance that have been trimmed off the front of self.audio
+        self.offset = 0.0
+        self.committed = []
+        self.tentative = []
+        self.new_samples = 0
+        self.decodes = 0
+
+    def insert_audio(self, samples: np.ndarray):
+        self._chunks.append(np.array(samples, dtype=np.float32))
+        self.new_samples += len(samples)
+
+    def _consolidate(self):
+        if self._chunks:
+            self.audio = np.concatenate([self.audio] + self._chunks)
+            self._chunks = []
+
+    def ready(self):
+        """True once enough new audio has arrived for another partial decode"""
+        return self.new_samples >= self.step_samples
+
+    @property
+    def committed_end(self):
+        return self.committed[-1][2] if self.committed else 0.0
+
+    def prompt(self):
+        # Whisper's prompt window is limited; the recent committed words matter most
+        return "".join(word for word, _, _ in self.committed[-50:])
+
+    def window(self):
+        """Snapshot (audio, offset, prompt) for the next decode"""
+        self._consolidate()
+        self.new_samples = 0
+        return self.audio.copy(), self.offset, self.prompt()
+
+    def decode(self, audio: np.ndarray, prompt: str):
+        """Blocking Whisper decode of a window snapshot"""
+        self.decodes += 1
+        return self.decode_fn(audio, prompt or None)
+
+    def _absolute(self, words, offset):
+        # Drop words already committed; compare midpoints since Whisper's word times jitter
+        limit = self.committed_end
+        return [
+            (word, start + offset, end + offset)
+            for word, start, end in words
+            if (start + end) / 2 + offset > limit
+        ]
+
+    def update(self, words, offset: float):
+        """Apply a decoded hypothesis and return (committed_text, tentative_text)"""
+        hypothesis = self._absolute(words, offset)
+
+        agreed = 0
+        for new, old in zip(hypothesis, self.tentative):
+            if _normalize(new[0]) != _normalize(old[0]):
+                break
+            agreed += 1
+        self.committed.extend(hypothesis[:agreed])
+        self.tentative = hypothesis[agreed:]
+
+        self._trim()
+        return self.committed_text(), "".join(word for word, _, _ in self.tentative).strip()
+
+    def _trim(self):
+        self._consolidate()
+        if len(self.audio) <= self.trim_samples or not self.committed:
+            return
+        cut = int((self.committed_end - self.offset) * self.sample_rate)
+        if cut <= 0:
+            return
+        self.audio = self.audio[cut:]
+        self.offset += cut / self.sample_rate
+
+    def committed_text(self):
+        return "".join(word for word, _, _ in self.committed).strip()
+
+    def finish(self):
+        """Decode the remaining tail (blocking) and return the final transcript"""
+        audio, offset, prompt = self.window()
+        if len(audio):
+            self.committed.extend(self._absolute(self.decode(audio, prompt), offset))
+        self.tentative = []
+        return self.committed_text()
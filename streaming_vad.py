@@ -0,0 +1,249 @@
+import copy
+import logging
+
+import numpy as np
+
+logger = logging.getLogger("mlx-whisper-tts")
+
+# Silero VAD scores fixed 512-sample windows at 16 kHz (32 ms)
+VAD_WINDOW_SAMPLES = 512
+
+
+class AudioRingBuffer:
+    """Fixed-capacity float32 ring buffer addressed by absolute sample position"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._data = np.zeros(capacity, dtype=np.float32)
+        # Total samples ever written; the buffer holds [total_written - capacity, total_written)
+        self.total_written = 0
+
+    def write(self, samples: np.ndarray):
+        samples = samples[-self.capacity:]
+        n = len(samples)
+        start = self.total_written % self.capacity
+        first = min(n, self.capacity - start)
+        self._data[start:start + first] = samples[:first]
+        self._data[:n - first] = samples[first:]
+        self.total_written += n
+
+    @property
+    def oldest(self):
+        return max(0, self.total_written - self.capacity)
+
+    def read(self, position: int, length: int):
+        """Return a copy of length samples starting at absolute position"""
+        if position < self.oldest or position + length > self.total_written:
+            raise IndexError("Requested samples are no longer (or not yet) in the buffer")
+        start = position % self.capacity
+        end = start + length
+        if end <= self.capacity:
+            return self._data[start:end].copy()
+        return np.concatenate((self._data[start:], self._data[:end - self.capacity]))
+
+
+class StreamingVAD:
+    """Incremental Silero VAD for one audio stream.
+
+    Keeps the model's recurrent state between calls so each 512-sample window
+    is scored exactly once, giving constant cost per incoming chunk. Window
+    probabilities feed the same hysteresis the endpoint used before: a higher
+    threshold to start speech than to continue it, minimum speech/silence
+    durations, and chunk-level debounce counters.
+
+    With a VADBatcher the stream holds no model of its own; its windows are
+    scored together with other streams' through process_chunk_batched().
+    """
+
+    def __init__(
+        self,
+        model,
+        sampling_rate: int = 16000,
+        start_threshold: float = 0.65,
+        continue_threshold: float = 0.4,
+        min_speech_duration_ms: int = 100,
+        min_silence_duration_ms: int = 150,
+        start_chunks: int = 2,
+        end_chunks: int = 1,
+        buffer_seconds: float = 2.0,
+        batcher=None,
+    ):
+        self.batcher = batcher
+        self.stream = batcher.open_stream() if batcher is not None else None
+        self.model = self._own_copy(model) if batcher is None else None
+        self.sampling_rate = sampling_rate
+        self.start_threshold = start_threshold
+        self.continue_threshold = continue_threshold
+        window_ms = 1000 * VAD_WINDOW_SAMPLES / sampling_rate
+        self.min_speech_windows = max(1, round(min_speech_duration_ms / window_ms))
+        self.min_silence_windows = max(1, round(min_silence_duration_ms / window_ms))
+        self.start_chunks = start_chunks
+        self.end_chunks = end_chunks
+
+        self.buffer = AudioRingBuffer(int(buffer_seconds * sampling_rate))
+        self.scored_until = 0
+        self.speech_detected = False
+        self.speech_run = 0
+        self.silence_run = 0
+        self.consecutive_speech_chunks = 0
+        self.consecutive_silence_chunks = 0
+        self.chunks_processed = 0
+        self.windows_scored = 0
+        self.last_probability = 0.0
+
+    @staticmethod
+    def _own_copy(model):
+        # Silero keeps its recurrent state on the module, so each stream needs its own copy
+        try:
+            model = copy.deepcopy(model)
+        except Exception as e:
+            logger.warning(f"Could not copy VAD model, sharing state across streams: {str(e)}")
+        model.reset_states()
+        return model
+
+    def score_window(self, window: np.ndarray):
+        """Return the speech probability of one window, advancing the recurrent state"""
+        import torch
+
+        with torch.no_grad():
+            return self.model(torch.from_numpy(window), self.sampling_rate).item()
+
+    def _update_runs(self, probability: float):
+        threshold = self.continue_threshold if self.speech_detected else self.start_threshold
+        if probability >= threshold:
+            self.speech_run += 1
+            self.silence_run = 0
+        else:
+            self.silence_run += 1
+            self.speech_run = 0
+
+    def pending_windows(self):
+        """Yield the complete windows received since the last call, oldest first"""
+        while self.buffer.total_written - self.scored_until >= VAD_WINDOW_SAMPLES:
+            # Fell behind by more than the ring buffer: skip ahead rather than fail
+            self.scored_until = max(self.scored_until, self.buffer.oldest)
+            window = self.buffer.read(self.scored_until, VAD_WINDOW_SAMPLES)
+            self.scored_until += VAD_WINDOW_SAMPLES
+            yield window
+
+    def apply_probabilities(self, probabilities):
+        """Advance the hysteresis with a chunk's window probabilities.
+
+        Returns True/False when speech starts/stops, otherwise None.
+        """
+        for probability in probabilities:
+            self._update_runs(probability)
+            self.last_probability = probability
+        self.windows_scored += len(probabilities)
+        self.chunks_processed += 1
+
+        # A chunk counts as speech once enough consecutive windows were voiced,
+        # and stays speech until silence has lasted long enough
+        if self.speech_detected:
+            raw_speech_detected = self.silence_run < self.min_silence_windows
+        else:
+            raw_speech_detected = self.speech_run >= self.min_speech_windows
+
+        # Implement debouncing to prevent rapid switching
+        if raw_speech_detected:
+            self.consecutive_speech_chunks += 1
+            self.consecutive_silence_chunks = 0
+        else:
+            self.consecutive_silence_chunks += 1
+            self.consecutive_speech_chunks = 0
+
+        if not self.speech_detected and self.consecutive_speech_chunks >= self.start_chunks:
+            self.speech_detected = True
+            return True
+        if self.speech_detected and self.consecutive_silence_chunks >= self.end_chunks:
+            self.speech_detected = False
+            return False
+        return None
+
+    def process_chunk(self, samples: np.ndarray):
+        """Add a chunk of 16 kHz float32 audio and score only its new windows.
+
+        Returns True/False when speech starts/stops, otherwise None.
+        """
+        self.buffer.write(samples)
+        probabilities = [self.score_window(window) for window in self.pending_windows()]
+        if not probabilities:
+            # Not enough new audio for a full window yet
+            return None
+        return self.apply_probabilities(probabilities)
+
+    async def process_chunk_batched(self, samples: np.ndarray):
+        """process_chunk() with the new windows scored in the batcher's next shared forward"""
+        self.buffer.write(samples)
+        windows = list(self.pending_windows())
+        if not windows:
+            return None
+        return self.apply_probabilities(await self.batcher.score(self.stream, windows))
+
+    def close(self):
+        if self.batcher is not None:
+            self.batcher.close_stream(self.stream)
+
+    def reset(self):
+        if self.batcher is not None:
+            self.batcher.reset_stream(self.stream)
+        else:
+            self.model.reset_states()
+        self.speech_detected = False
+        self.speech_run = 0
+        self.silence_run = 0
+        self.consecutive_speech_chunks = 0
+        self.consecutive_silence_chunks = 0
+
+
+class UtteranceRecorder:
+    """Collect the audio of one utterance around a StreamingVAD's speech transitions.
+
+    start() seeds the utterance with pre-roll from the VAD's ring buffer, so the
+    onset that was heard before speech was confirmed is not lost.
+    """
+
+    def __init__(self, vad: StreamingVAD, pre_roll_ms: int = 800, max_seconds: float = 30.0, min_seconds: float = 0.3):
+        self.vad = vad
+        self.pre_roll_samples = int(pre_roll_ms * vad.sampling_rate / 1000)
+        self.max_samples = int(max_seconds * vad.sampling_rate)
+        self.min_samples = int(min_seconds * vad.sampling_rate)
+        self.active = False
+        self._chunks = []
+        self._length = 0
+
+    def start(self):
+        """Begin a new utterance and return its pre-roll audio"""
+        buffer = self.vad.buffer
+        available = buffer.total_written - buffer.oldest
+        pre_roll = min(self.pre_roll_samples, available)
+        self._chunks = [buffer.read(buffer.total_written - pre_roll, pre_roll)]
+        self._length = pre_roll
+        self.active = True
+        return self._chunks[0]
+
+    def append(self, samples: np.ndarray):
+        self._chunks.append(np.array(samples, dtype=np.float32))
+        self._length += len(samples)
+
+    def resume(self):
+        """Keep recording after a forced finish() while speech continues, without pre-roll"""
+        self.active = True
+
+    @property
+    def full(self):
+        return self._length >= self.max_samples
+
+    @property
+    def duration(self):
+        return self._length / self.vad.sampling_rate
+
+    def finish(self):
+        """Stop recording and return the utterance, or None if it was too short"""
+        audio = np.concatenate(self._chunks) if self._chunks else np.zeros(0, dtype=np.float32)
+        self.active = False
+        self._chunks = []
+        self._length = 0
+        if len(audio) < self.min_samples:
+            return None
+        return audio
@@ -0,0 +1,212 @@
+import asyncio
+import copy
+import logging
+import time
+
+import numpy as np
+
+from streaming_vad import VAD_WINDOW_SAMPLES
+
+logger = logging.getLogger("mlx-whisper-tts")
+
+# Attributes Silero's TorchScript module keeps its recurrent state in
+_SILERO_STATE = ("_state", "_context", "_last_sr", "_last_batch_size")
+
+
+class VADStream:
+    """Recurrent state of one audio stream scored by a VADBatcher"""
+
+    def __init__(self):
+        self.state = None
+        self.context = None
+        # Only used when the model can't be batched: a private copy that keeps the state itself
+        self.model = None
+
+
+class VADBatcher:
+    """Scores Silero VAD windows from every open stream in shared forward passes.
+
+    Streams hand their new 512-sample windows to score(). The batcher waits up
+    to max_wait_ms for the other open streams to submit theirs (or until all
+    of them have), stacks the windows and runs one forward on the VAD
+    executor. Silero keeps its recurrent state on the module, so each stream's
+    state and context are gathered into the batch before the forward and
+    scattered back after it. A stream with several new windows contributes one
+    window per forward, in order.
+
+    Models without Silero's state layout fall back to a private copy per
+    stream, scored one after another but still in a single executor call.
+    """
+
+    def __init__(self, model, executor, sampling_rate: int = 16000, max_wait_ms: float = 4.0, max_batch_size: int = 64):
+        self.model = model
+        self.executor = executor
+        self.sampling_rate = sampling_rate
+        self.max_wait = max_wait_ms / 1000
+        self.max_batch_size = max_batch_size
+        self._pending = []
+        self._arrived = None
+        self._task = None
+        self._zero_state = None
+        self._zero_context = None
+        self.streams = 0
+        self.forwards = 0
+        self.windows = 0
+        self.peak_batch = 0
+        self.forward_seconds = 0.0
+        self.requests = 0
+        self.total_latency = 0.0
+        # Blocking; construct the batcher on the VAD executor's thread
+        self.batched = self._check_batching()
+        logger.info(f"VAD batching across streams {'enabled' if self.batched else 'unavailable, scoring streams one by one'}")
+
+    def _check_batching(self):
+        """Whether the model exposes Silero's per-batch state, verified against one-at-a-time scoring"""
+        import torch
+
+        model = self.model
+        if not all(hasattr(model, name) for name in _SILERO_STATE):
+            return False
+        try:
+            with torch.no_grad():
+                model.reset_states()
+                model(torch.zeros(VAD_WINDOW_SAMPLES), self.sampling_rate)
+                # The state of one stream after reset, in the shapes the model uses
+                self._zero_state = torch.zeros_like(model._state[:, :1])
+                self._zero_context = torch.zeros_like(model._context[:1])
+                rng = np.random.default_rng(0)
+                windows = (0.1 * rng.standard_normal((3, 2, VAD_WINDOW_SAMPLES))).astype(np.float32)
+                expected = []
+                for stream in range(windows.shape[1]):
+                    model.reset_states()
+                    expected.append([model(torch.from_numpy(window), self.sampling_rate).item() for window in windows[:, stream]])
+                streams = [VADStream() for _ in range(windows.shape[1])]
+                scored = np.array([self._forward_batched(streams, list(step)) for step in windows]).T
+            model.reset_states()
+            if not np.allclose(scored, expected, atol=1e-4):
+                logger.warning("Batched VAD probabilities differ from single-stream ones, not batching")
+                return False
+            return True
+        except Exception as e:
+            logger.warning(f"VAD model does not support batched scoring: {str(e)}")
+            return False
+
+    def open_stream(self):
+        stream = VADStream()
+        if not self.batched:
+            try:
+                stream.model = copy.deepcopy(self.model)
+            except Exception as e:
+                logger.warning(f"Could not copy VAD model, sharing state across streams: {str(e)}")
+                stream.model = self.model
+            stream.model.reset_states()
+        self.streams += 1
+        return stream
+
+    def close_stream(self, stream: VADStream):
+        self.streams -= 1
+        stream.model = None
+
+    def reset_stream(self, stream: VADStream):
+        stream.state = None
+        stream.context = None
+        if stream.model is not None:
+            stream.model.reset_states()
+
+    async def score(self, stream: VADStream, windows):
+        """Return the speech probability of each window, in order, advancing the stream's state"""
+        if not windows:
+            return []
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((stream, windows, future, time.perf_counter()))
+        if self._task is None or self._task.done():
+            self._arrived = asyncio.Event()
+            self._task = loop.create_task(self._run())
+        self._arrived.set()
+        return await future
+
+    async def _run(self):
+        """Collect pending requests into batches while there are any"""
+        while self._pending:
+            # Give the other streams a moment to send their windows for this frame period
+            deadline = time.perf_counter() + self.max_wait
+            while len(self._pending) < min(self.streams, self.max_batch_size):
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._arrived.clear()
+                try:
+                    await asyncio.wait_for(self._arrived.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+            batch = [request for request in self._pending[:self.max_batch_size] if not request[2].done()]
+            del self._pending[:self.max_batch_size]
+            if not batch:
+                continue
+            try:
+                results = await self.executor.run(self._score_batch, [(stream, windows) for stream, windows, _, _ in batch])
+            except Exception as e:
+                for _, _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            now = time.perf_counter()
+            for (_, _, future, submitted_at), probabilities in zip(batch, results):
+                self.requests += 1
+                self.total_latency += now - submitted_at
+                if not future.done():
+                    future.set_result(probabilities)
+
+    def _score_batch(self, requests):
+        """Score every request's windows, one forward per window position (VAD worker only)"""
+        results = [[] for _ in requests]
+        for step in range(max(len(windows) for _, windows in requests)):
+            active = [i for i, (_, windows) in enumerate(requests) if step < len(windows)]
+            started = time.perf_counter()
+            probabilities = self._forward([requests[i][0] for i in active], [requests[i][1][step] for i in active])
+            self.forward_seconds += time.perf_counter() - started
+            self.forwards += 1
+            self.windows += len(active)
+            self.peak_batch = max(self.peak_batch, len(active))
+            for i, probability in zip(active, probabilities):
+                results[i].append(probability)
+        return results
+
+    def _forward(self, streams, windows):
+        if self.batched:
+            return self._forward_batched(streams, windows)
+        import torch
+
+        with torch.no_grad():
+            return [stream.model(torch.from_numpy(window), self.sampling_rate).item() for stream, window in zip(streams, windows)]
+
+    def _forward_batched(self, streams, windows):
+        import torch
+
+        with torch.no_grad():
+            model = self.model
+            model._state = torch.cat([self._zero_state if stream.state is None else stream.state for stream in streams], dim=1)
+            model._context = torch.cat([self._zero_context if stream.context is None else stream.context for stream in streams], dim=0)
+            # Matching batch size and rate keep the model from resetting the state we just set
+            model._last_sr = self.sampling_rate
+            model._last_batch_size = len(streams)
+            out = model(torch.from_numpy(np.stack(windows)), self.sampling_rate)
+            for i, stream in enumerate(streams):
+                stream.state = model._state[:, i:i + 1].clone()
+                stream.context = model._context[i:i + 1].clone()
+        return out.reshape(-1).tolist()
+
+    def stats(self):
+        return {
+            "batched": self.batched,
+            "streams": self.streams,
+            "waiting": len(self._pending),
+            "max_batch_size": self.max_batch_size,
+            "peak_batch": self.peak_batch,
+            "windows": self.windows,
+            "forwards": self.forwards,
+            "avg_batch": round(self.windows / self.forwards, 2) if self.forwards else 0.0,
+            "avg_forward_ms": round(1000 * self.forward_seconds / self.forwards, 3) if self.forwards else 0.0,
+            "avg_latency_ms": round(1000 * self.total_latency / self.requests, 3) if self.requests else 0.0,
+        }